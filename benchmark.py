@@ -0,0 +1,417 @@
+"""Banco de pruebas del escaneo sin tocar MercadoLibre.
+
+Levanta un servidor local que imita los listados de autos (latencia, paginación y búsquedas sin
+resultados configurables, o páginas grabadas de una carpeta), apunta ``construir_url`` a ese
+servidor y pasa inventarios sintéticos por ``escaneo.ejecutar_escaneo``. El reporte JSON trae
+vehículos por minuto, latencia p50/p95 por vehículo, RSS pico y procesos de Chromium, para
+comparar corridas entre cambios:
+
+    python benchmark.py --filas 10 100 1000 --concurrencia 4 --latencia-ms 200
+    python benchmark.py --comparar benchmarks/anterior.json
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import platform
+import random
+import re
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+CARPETA_BENCHMARKS = os.path.join(os.getcwd(), "benchmarks")
+
+PATRON_RUTA = re.compile(r"^/([^/]+)/([^/]+)/(\d+)_NoIndex_True$")
+PATRON_SIGUIENTE = re.compile(r'(andes-pagination__button--next[^>]*>\s*<a[^>]*href=")([^"]+)(")')
+
+MARCAS = ("Nissan", "Chevrolet", "Volkswagen", "Toyota", "Kia", "Mazda", "Honda", "Ford", "Hyundai", "Seat")
+MODELOS = ("Versa", "Aveo", "Jetta", "Corolla", "Rio", "Mazda 3", "CR-V", "Ranger", "Tucson", "Ibiza",
+           "Sentra", "Onix", "Vento", "Hilux", "Sportage", "CX-5", "City", "Figo", "Grand i10", "León")
+
+
+# -------------------------
+# SERVIDOR DE LISTADOS
+# -------------------------
+def _semilla(texto):
+    return int(hashlib.sha256(texto.encode("utf-8")).hexdigest()[:12], 16)
+
+def pagina_sintetica(precios, siguiente=None, sin_resultados=False):
+    if sin_resultados:
+        return (
+            "<html><body><div class=\"ui-search-rescue\">"
+            "<p>No hay publicaciones que coincidan con tu búsqueda.</p></div></body></html>"
+        )
+    items = "".join(
+        f'<li class="ui-search-layout__item"><span class="andes-money-amount__fraction">{p:,}</span></li>'
+        for p in precios
+    )
+    paginacion = ""
+    if siguiente:
+        paginacion = (
+            '<ul class="andes-pagination"><li class="andes-pagination__button andes-pagination__button--next">'
+            f'<a href="{siguiente}">Siguiente</a></li></ul>'
+        )
+    return f"<html><body><ol class=\"ui-search-layout\">{items}</ol>{paginacion}</body></html>"
+
+
+class ListadosFalsos:
+    """Decide qué responde el servidor para cada búsqueda, siempre igual para la misma URL.
+
+    Con ``grabaciones`` (archivos .html guardados de MercadoLibre) se sirven esas páginas,
+    reescribiendo el enlace "Siguiente" hacia el servidor local; si no, se generan páginas con
+    ``precios_por_pagina`` precios.
+    """
+
+    def __init__(self, latencia_ms=150, variacion_ms=50, paginas=3, precios_por_pagina=48,
+                 fraccion_vacios=0.1, grabaciones=None):
+        self.latencia = latencia_ms / 1000
+        self.variacion = variacion_ms / 1000
+        self.paginas = max(1, int(paginas))
+        self.precios_por_pagina = precios_por_pagina
+        self.fraccion_vacios = fraccion_vacios
+        self.grabaciones = []
+        if grabaciones:
+            for ruta in sorted(glob.glob(os.path.join(grabaciones, "*.html"))):
+                with open(ruta, encoding="utf-8", errors="replace") as f:
+                    self.grabaciones.append(f.read())
+        self.solicitudes = 0
+        self.bytes_servidos = 0
+        self._candado = threading.Lock()
+
+    def responder(self, ruta, consulta):
+        m = PATRON_RUTA.match(ruta)
+        if not m:
+            return 404, "<html><body>No encontrado</body></html>"
+
+        busqueda = "/".join(m.groups())
+        azar = random.Random(_semilla(busqueda))
+        pagina = int(consulta.get("pagina", ["1"])[0])
+        total_paginas = azar.randint(1, self.paginas)
+        sin_resultados = azar.random() < self.fraccion_vacios
+
+        siguiente = None
+        if pagina < total_paginas:
+            siguiente = f"{ruta}?{urlencode({'VIEW': 'list', 'pagina': pagina + 1})}"
+
+        if self.grabaciones and not sin_resultados:
+            contenido = self.grabaciones[(_semilla(busqueda) + pagina) % len(self.grabaciones)]
+            if siguiente:
+                contenido = PATRON_SIGUIENTE.sub(lambda g: g.group(1) + siguiente + g.group(3), contenido)
+            else:
+                contenido = contenido.replace("andes-pagination__button--next", "andes-pagination__button--disabled")
+            return 200, contenido
+
+        centro = azar.randint(150_000, 650_000)
+        azar_pagina = random.Random(_semilla(f"{busqueda}#{pagina}"))
+        precios = [int(azar_pagina.gauss(centro, centro * 0.12)) for _ in range(self.precios_por_pagina)]
+        return 200, pagina_sintetica(precios, siguiente, sin_resultados)
+
+    def atender(self, ruta, consulta):
+        time.sleep(self.latencia + random.uniform(0, self.variacion))
+        codigo, contenido = self.responder(ruta, consulta)
+        cuerpo = contenido.encode("utf-8")
+        with self._candado:
+            self.solicitudes += 1
+            self.bytes_servidos += len(cuerpo)
+        return codigo, cuerpo
+
+
+def iniciar_servidor(listados, puerto=0):
+    """Arranca el servidor en un hilo; regresa ``(servidor, url_base)``."""
+
+    class Manejador(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            partes = urlsplit(self.path)
+            codigo, cuerpo = listados.atender(partes.path, parse_qs(partes.query))
+            self.send_response(codigo)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", puerto), Manejador)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}"
+
+
+# -------------------------
+# INVENTARIOS SINTÉTICOS
+# -------------------------
+def inventario_sintetico(filas, repeticion=0.3, semilla=7):
+    """Inventario con las columnas del Excel maestro; ``repeticion`` es la fracción de filas que
+    repite una marca/modelo/año ya presente (como pasa con unidades iguales en varias sucursales)."""
+    import pandas as pd
+
+    azar = random.Random(semilla)
+    distintos = max(1, int(round(filas * (1 - repeticion))))
+    combinaciones = [
+        (azar.choice(MARCAS), azar.choice(MODELOS), azar.randint(2012, 2024)) for _ in range(distintos)
+    ]
+    registros = []
+    for i in range(filas):
+        marca, modelo, anio = combinaciones[i] if i < distintos else azar.choice(combinaciones)
+        precio = azar.randint(150, 650) * 1000
+        registros.append({
+            "ID": f"BENCH-{i:05d}",
+            "Sucursal": azar.choice(("Centro", "Norte", "Sur")),
+            "Marca": marca,
+            "Submarca": modelo,
+            "Modelo": anio if azar.random() > 0.02 else "s/d",
+            "Versión": "Base",
+            "Precio Venta": precio,
+            "Costo Libro": int(precio * 0.85),
+            "Dias Stock": azar.randint(1, 150),
+        })
+    return pd.DataFrame(registros)
+
+
+# -------------------------
+# MEDICIÓN DE RECURSOS
+# -------------------------
+def _procesos_descendientes(pid_raiz):
+    # Lee /proc directamente (Linux); regresa {pid: (nombre, rss_bytes)} del árbol de pid_raiz.
+    hijos, datos = {}, {}
+    pagina = os.sysconf("SC_PAGE_SIZE")
+    for entrada in os.listdir("/proc"):
+        if not entrada.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entrada}/stat") as f:
+                stat = f.read()
+            with open(f"/proc/{entrada}/statm") as f:
+                rss = int(f.read().split()[1]) * pagina
+        except (OSError, IndexError, ValueError):
+            continue
+        nombre = stat[stat.index("(") + 1:stat.rindex(")")]
+        ppid = int(stat[stat.rindex(")") + 2:].split()[1])
+        hijos.setdefault(ppid, []).append(int(entrada))
+        datos[int(entrada)] = (nombre, rss)
+
+    arbol, pendientes = {}, [pid_raiz]
+    while pendientes:
+        pid = pendientes.pop()
+        if pid in datos:
+            arbol[pid] = datos[pid]
+        pendientes.extend(hijos.get(pid, ()))
+    return arbol
+
+
+class MuestreoRecursos:
+    """Muestrea en segundo plano la memoria del proceso y sus hijos y cuántos son Chromium."""
+
+    def __init__(self, intervalo=0.25):
+        self.intervalo = intervalo
+        self.rss_arbol_pico = 0
+        self.chromium_pico = 0
+        self.disponible = os.path.isdir("/proc")
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def _muestrear(self):
+        arbol = _procesos_descendientes(os.getpid())
+        self.rss_arbol_pico = max(self.rss_arbol_pico, sum(rss for _, rss in arbol.values()))
+        chromium = sum(1 for nombre, _ in arbol.values() if "chrom" in nombre.lower() or "headless" in nombre.lower())
+        self.chromium_pico = max(self.chromium_pico, chromium)
+
+    def _ciclo(self):
+        while not self._detener.wait(self.intervalo):
+            self._muestrear()
+
+    def __enter__(self):
+        if self.disponible:
+            self._hilo = threading.Thread(target=self._ciclo, daemon=True)
+            self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join()
+            self._muestrear()
+        return False
+
+
+def rss_propio_pico():
+    # ru_maxrss viene en KB en Linux y en bytes en macOS.
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico if sys.platform == "darwin" else pico * 1024
+
+
+# -------------------------
+# CORRIDAS
+# -------------------------
+def percentil(valores, p):
+    if not valores:
+        return None
+    if len(valores) == 1:
+        return valores[0]
+    return statistics.quantiles(valores, n=100, method="inclusive")[p - 1]
+
+def medir_latencias(mercado_ml, escaneo):
+    """Envuelve las funciones de consulta para anotar cuánto tardó cada URL de búsqueda."""
+    latencias = {}
+    sync_original = escaneo.analizar_vehiculo
+    async_original = mercado_ml.analizar_vehiculo_async
+
+    def analizar_vehiculo(marca, modelo, anio, *args, **kwargs):
+        inicio = time.perf_counter()
+        resultado = sync_original(marca, modelo, anio, *args, **kwargs)
+        latencias[resultado[3] or f"{marca}/{modelo}/{anio}"] = time.perf_counter() - inicio
+        return resultado
+
+    async def analizar_vehiculo_async(marca, modelo, anio, *args, **kwargs):
+        inicio = time.perf_counter()
+        resultado = await async_original(marca, modelo, anio, *args, **kwargs)
+        latencias[resultado[3] or f"{marca}/{modelo}/{anio}"] = time.perf_counter() - inicio
+        return resultado
+
+    escaneo.analizar_vehiculo = analizar_vehiculo
+    mercado_ml.analizar_vehiculo_async = analizar_vehiculo_async
+    return latencias
+
+def correr(filas, opciones, listados, repeticion, latencias):
+    import escaneo
+
+    data = inventario_sintetico(filas, repeticion=repeticion)
+    cols = escaneo.detectar_columnas(data)
+    resumen = escaneo.resumen_consultas(escaneo.preparar_inventario(data, cols))
+
+    latencias.clear()
+    solicitudes_previas = listados.solicitudes
+    with MuestreoRecursos() as muestreo:
+        inicio = time.perf_counter()
+        df_r, info = escaneo.ejecutar_escaneo(data, cols, opciones)
+        segundos = time.perf_counter() - inicio
+
+    # Cada vehículo hereda la latencia de la búsqueda que compartió con otros.
+    por_vehiculo = [latencias[link] * 1000 for link in df_r["Link"] if link in latencias]
+    errores = int(df_r["Diagnóstico"].eq("❌ ERROR AÑO").sum())
+    return {
+        "filas": filas,
+        "consultas_distintas": resumen["consultas"],
+        "segundos": round(segundos, 3),
+        "vehiculos_por_minuto": round(filas / segundos * 60, 1) if segundos else None,
+        "latencia_p50_ms": round(percentil(por_vehiculo, 50), 1) if por_vehiculo else None,
+        "latencia_p95_ms": round(percentil(por_vehiculo, 95), 1) if por_vehiculo else None,
+        "rss_pico_proceso_mb": round(rss_propio_pico() / 2**20, 1),
+        "rss_pico_total_mb": round(muestreo.rss_arbol_pico / 2**20, 1) if muestreo.disponible else None,
+        "procesos_chromium_pico": muestreo.chromium_pico if muestreo.disponible else None,
+        "solicitudes_servidor": listados.solicitudes - solicitudes_previas,
+        "filas_error_anio": errores,
+        "red_por_url": len(info.get("red_por_url") or {}),
+    }
+
+
+def comparar(actual, anterior):
+    previas = {c["filas"]: c for c in anterior.get("corridas", [])}
+    for corrida in actual["corridas"]:
+        previa = previas.get(corrida["filas"])
+        if previa is None:
+            continue
+        for campo in ("vehiculos_por_minuto", "latencia_p50_ms", "latencia_p95_ms", "rss_pico_total_mb"):
+            antes, ahora = previa.get(campo), corrida.get(campo)
+            if antes and ahora:
+                print(f"  {corrida['filas']:>5} filas · {campo}: {antes} → {ahora} ({(ahora - antes) / antes:+.1%})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mide el escaneo contra un MercadoLibre local.")
+    parser.add_argument("--filas", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--modo", choices=("http", "navegador"), default="http")
+    parser.add_argument("--concurrencia", type=int, default=1)
+    parser.add_argument("--tasa", type=float, default=10.0, help="Consultas por segundo con concurrencia > 1.")
+    parser.add_argument("--latencia-ms", type=float, default=150)
+    parser.add_argument("--variacion-ms", type=float, default=50)
+    parser.add_argument("--paginas", type=int, default=3, help="Máximo de páginas por búsqueda en el servidor.")
+    parser.add_argument("--precios-por-pagina", type=int, default=48)
+    parser.add_argument("--vacios", type=float, default=0.1, help="Fracción de búsquedas sin resultados.")
+    parser.add_argument("--repeticion", type=float, default=0.3, help="Fracción de filas que repiten búsqueda.")
+    parser.add_argument("--grabaciones", help="Carpeta con listados .html grabados para servir en lugar de sintéticos.")
+    parser.add_argument("--salida", help="Ruta del JSON (por defecto benchmarks/bench_<fecha>.json).")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior para mostrar la diferencia.")
+    args = parser.parse_args(argv)
+    if args.tasa <= 0:
+        parser.error("--tasa debe ser mayor que 0.")
+
+    listados = ListadosFalsos(
+        latencia_ms=args.latencia_ms,
+        variacion_ms=args.variacion_ms,
+        paginas=args.paginas,
+        precios_por_pagina=args.precios_por_pagina,
+        fraccion_vacios=args.vacios,
+        grabaciones=args.grabaciones,
+    )
+    servidor, url_base = iniciar_servidor(listados)
+
+    # Antes de importar el robot: las URL apuntan al servidor local y Chromium usa un perfil
+    # temporal, para no tocar la sesión real de MercadoLibre.
+    perfil = tempfile.mkdtemp(prefix="daytona_bench_")
+    os.environ["DAYTONA_URL_ML"] = url_base
+    os.environ["DAYTONA_RUTA_SESION"] = perfil
+    import escaneo
+    import mercado_ml
+    mercado_ml.URL_BASE_LISTADOS = url_base
+    latencias = medir_latencias(mercado_ml, escaneo)
+
+    opciones = {
+        "modo_consulta": args.modo,
+        "concurrencia": args.concurrencia,
+        "tasa": args.tasa,
+        "usar_cache": False,
+        "reanudar": False,
+    }
+
+    reporte = {
+        "fecha": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "opciones": opciones,
+        "servidor": {
+            "latencia_ms": args.latencia_ms,
+            "variacion_ms": args.variacion_ms,
+            "paginas": args.paginas,
+            "precios_por_pagina": args.precios_por_pagina,
+            "vacios": args.vacios,
+            "grabaciones": len(listados.grabaciones),
+        },
+        "corridas": [],
+    }
+    try:
+        for filas in args.filas:
+            corrida = correr(filas, opciones, listados, args.repeticion, latencias)
+            reporte["corridas"].append(corrida)
+            print(
+                f"{filas:>5} filas: {corrida['vehiculos_por_minuto']} veh/min, "
+                f"p50 {corrida['latencia_p50_ms']} ms, p95 {corrida['latencia_p95_ms']} ms, "
+                f"RSS {corrida['rss_pico_total_mb']} MB, Chromium {corrida['procesos_chromium_pico']}"
+            )
+    finally:
+        servidor.shutdown()
+
+    salida = args.salida or os.path.join(CARPETA_BENCHMARKS, f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(reporte, f, ensure_ascii=False, indent=2)
+    print(f"Reporte: {salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            comparar(reporte, json.load(f))
+    return reporte
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import os
+import statistics
+import threading
+import time
+from collections import deque
+
+from cache_mercado import CacheMercado
+from mercado_ml import (
+    MAX_PAGINAS,
+    MAX_PESTANAS,
+    MODO_CONSULTA,
+    OBJETIVO_COMPARABLES,
+    RUTA_SESION,
+    ClienteHttp,
+    PoolPaginasAsync,
+    analizar_vehiculo_async,
+    describir_error,
+    preparar_consulta,
+    resultado_desde_estadisticas,
+    sumar_contadores,
+)
+from regulador import ReguladorTasa
+from trazas import anotar, etapa_previa, vehiculo
+
+# -------------------------
+# CONFIGURACIÓN BROKER
+# -------------------------
+# Pestañas de Chromium (consultas a la vez) para todo el servidor; el broker abre un solo Chromium.
+PAGINAS_BROKER = int(os.environ.get("DAYTONA_PAGINAS_BROKER") or 3)
+TASA_BROKER = 1.0
+
+# Segundos sin pedidos tras los que el broker cierra su Chromium; el siguiente pedido lo vuelve a abrir.
+INACTIVIDAD_BROKER = 300
+
+# Esperas recientes con las que se calculan promedio y percentil 95.
+MUESTRAS_ESPERA = 500
+
+# Búsquedas que un escaneo deja encoladas por delante de sus resultados: la fila de cada sesión
+# se mantiene corta y lo que queda de un escaneo detenido se cancela rápido.
+ADELANTO_ESCANEO = 4
+
+
+class _Pedido:
+    __slots__ = ("url", "consulta", "interesados", "futuro", "encolado", "contexto", "traza", "tiempo_cache", "redes")
+
+    def __init__(self, url, consulta, usuario, futuro, traza, tiempo_cache):
+        self.url = url
+        self.consulta = consulta
+        # Sesiones que esperan este resultado (la que lo pidió y las que pidieron la misma búsqueda).
+        self.interesados = {usuario}
+        self.futuro = futuro
+        self.encolado = time.monotonic()
+        # El broker atiende el pedido en el contexto de quien lo hizo, así su traza va a ese registro.
+        self.contexto = contextvars.copy_context()
+        self.traza = traza
+        self.tiempo_cache = tiempo_cache
+        # Dicts ``red_por_url`` de quienes esperan el resultado.
+        self.redes = []
+
+
+class BrokerConsultas:
+    """Consultas a MercadoLibre de todas las sesiones del proceso, con un solo Chromium.
+
+    Un hilo propio corre un loop de asyncio con un ``PoolPaginasAsync`` de ``paginas`` pestañas
+    (el tope global de consultas a la vez), un ``ClienteHttp`` y un ``ReguladorTasa``
+    compartidos. ``consultar`` se puede llamar desde cualquier hilo y regresa un
+    ``concurrent.futures.Future`` con la tupla de ``analizar_vehiculo``:
+
+    - si la misma búsqueda ya está en cola o en curso, se regresa ese mismo futuro;
+    - cada usuario tiene su propia fila y se atienden por turnos, uno de cada quien, así que un
+      escaneo de mil autos no deja esperando una cotización;
+    - ``cancelar(usuario)`` retira lo que ese usuario tiene en cola (lo que otra sesión también
+      espera se conserva). Como el futuro puede ser compartido, se cancela con ``cancelar`` y no
+      con ``Future.cancel``; un futuro cancelado de todos modos se salta al despacharlo.
+
+    La vigencia del caché la decide quien llama (``cache`` en ``consultar``); lo que el broker
+    consulta siempre se guarda en el caché. Chromium corre sobre una copia de ``ruta_memoria`` (el
+    maestro queda libre para el trabajador, la CLI y la precarga) y se cierra tras
+    ``INACTIVIDAD_BROKER`` segundos sin pedidos. Si el hilo del broker se cae, todos los pedidos
+    pendientes fallan con esa excepción y ``activo`` queda en False para que se cree otro.
+    """
+
+    def __init__(self, paginas=PAGINAS_BROKER, tasa=TASA_BROKER, modo_consulta=MODO_CONSULTA,
+                 objetivo_comparables=OBJETIVO_COMPARABLES, max_paginas=MAX_PAGINAS, ruta_memoria=RUTA_SESION,
+                 **opciones_pool):
+        self.paginas = max(1, min(int(paginas), MAX_PESTANAS))
+        self.ruta_memoria = ruta_memoria
+        self.regulador = ReguladorTasa(tasa)
+        self.modo_consulta = modo_consulta
+        self.objetivo_comparables = objetivo_comparables
+        self.max_paginas = max_paginas
+        self._opciones_pool = opciones_pool
+        self._candado = threading.Lock()
+        self._en_vuelo = {}
+        self._colas = {}
+        self._turnos = deque()
+        self._activos = 0
+        self._esperas = deque(maxlen=MUESTRAS_ESPERA)
+        self.atendidas = 0
+        self.fusionadas = 0
+        self.error = None
+        # Los del hilo del broker; estado() lee de ahí sus contadores (los de cada Chromium ya
+        # cerrado se acumulan en _contadores).
+        self._pool = None
+        self._cliente_http = None
+        self._contadores = {}
+
+        self._loop = asyncio.new_event_loop()
+        self._despertar = None
+        listo = threading.Event()
+        self._hilo = threading.Thread(target=self._correr, args=(listo,), name="broker-consultas", daemon=True)
+        self._hilo.start()
+        listo.wait()
+
+    @property
+    def activo(self):
+        return self.error is None and self._hilo.is_alive()
+
+    # -------------------------
+    # LADO DE LAS SESIONES (cualquier hilo)
+    # -------------------------
+    def consultar(self, marca, modelo, anio, usuario="", cache=None, filas=1, red_por_url=None):
+        """Encola la búsqueda de un auto; regresa un futuro con su resultado.
+
+        Si hay trazas activas (``trazas.trazando``) la consulta se traza en ese registro, con la espera
+        en la fila como etapa ``cola_broker``; lo bloqueado y descargado en Chromium queda en ``red_por_url``.
+        """
+        futuro = concurrent.futures.Future()
+        url, error = preparar_consulta(marca, modelo, anio)
+        if error:
+            futuro.set_result(error)
+            return futuro
+        traza = {"marca": marca, "modelo": modelo, "anio": anio, "filas": filas}
+        tiempo_cache = 0.0
+        if cache is not None:
+            inicio = time.perf_counter()
+            guardado = cache.obtener(url)
+            tiempo_cache = time.perf_counter() - inicio
+            if guardado:
+                resultado = resultado_desde_estadisticas(guardado, url)
+                with vehiculo(**traza):
+                    etapa_previa("cache", tiempo_cache)
+                    anotar(fuente="cache", url=url, estado=resultado[2])
+                futuro.set_result(resultado)
+                return futuro
+
+        with self._candado:
+            if not self.activo:
+                futuro.set_exception(RuntimeError(f"El navegador compartido se detuvo: {self.error}"))
+                return futuro
+            en_vuelo = self._en_vuelo.get(url)
+            if en_vuelo is not None:
+                self.fusionadas += 1
+                en_vuelo.interesados.add(usuario)
+                if red_por_url is not None:
+                    en_vuelo.redes.append(red_por_url)
+                return en_vuelo.futuro
+            pedido = _Pedido(url, (marca, modelo, anio), usuario, futuro, traza, tiempo_cache)
+            if red_por_url is not None:
+                pedido.redes.append(red_por_url)
+            self._en_vuelo[url] = pedido
+            self._encolar(usuario, pedido)
+        self._loop.call_soon_threadsafe(self._despertar.set)
+        return futuro
+
+    def cancelar(self, usuario):
+        """Retira de la cola los pedidos de ``usuario``; regresa cuántos se cancelaron.
+
+        Lo que ya está en curso termina (y se guarda en el caché). Un pedido que otra sesión
+        también espera pasa a la fila de esa sesión en lugar de cancelarse.
+        """
+        canceladas = 0
+        with self._candado:
+            cola = self._colas.pop(usuario, None)
+            if cola is None:
+                return 0
+            self._turnos.remove(usuario)
+            for pedido in cola:
+                pedido.interesados.discard(usuario)
+                if pedido.interesados:
+                    self._encolar(next(iter(pedido.interesados)), pedido)
+                elif pedido.futuro.cancel():
+                    self._en_vuelo.pop(pedido.url, None)
+                    canceladas += 1
+        return canceladas
+
+    def estado(self):
+        """Profundidad de la cola (total y por usuario), consultas en curso, tiempos de espera en segundos
+        y contadores del navegador (ver ``mercado_ml.sumar_contadores``)."""
+        ahora = time.monotonic()
+        navegador = dict(self._contadores)
+        sumar_contadores(navegador, self._pool, self._cliente_http)
+        with self._candado:
+            esperas = sorted(self._esperas)
+            primeros = [c[0].encolado for c in self._colas.values() if c]
+            return {
+                "en_cola": sum(len(c) for c in self._colas.values()),
+                "por_usuario": {u: len(c) for u, c in self._colas.items()},
+                "en_curso": self._activos,
+                "paginas": self.paginas,
+                "atendidas": self.atendidas,
+                "fusionadas": self.fusionadas,
+                "espera_media": statistics.fmean(esperas) if esperas else 0.0,
+                "espera_p95": esperas[int(0.95 * (len(esperas) - 1))] if esperas else 0.0,
+                "espera_mas_vieja": ahora - min(primeros) if primeros else 0.0,
+                "regulador": self.regulador.estado(),
+                "navegador": navegador,
+            }
+
+    def _encolar(self, usuario, pedido):
+        # Con el candado tomado.
+        if usuario not in self._colas:
+            self._colas[usuario] = deque()
+            self._turnos.append(usuario)
+        self._colas[usuario].append(pedido)
+
+    def _siguiente(self):
+        # Con el candado tomado: un pedido del usuario en turno, que pasa al final de la fila.
+        # Lo cancelado se descarta; lo que se entrega ya no se puede cancelar.
+        while self._turnos:
+            usuario = self._turnos.popleft()
+            cola = self._colas[usuario]
+            pedido = cola.popleft()
+            if cola:
+                self._turnos.append(usuario)
+            else:
+                del self._colas[usuario]
+            if pedido.futuro.set_running_or_notify_cancel():
+                return pedido
+            if self._en_vuelo.get(pedido.url) is pedido:
+                del self._en_vuelo[pedido.url]
+        return None
+
+    # -------------------------
+    # LADO DEL BROKER (su hilo y su loop)
+    # -------------------------
+    def _correr(self, listo):
+        asyncio.set_event_loop(self._loop)
+        self._despertar = asyncio.Event()
+        listo.set()
+        try:
+            self._loop.run_until_complete(self._despachar())
+        except BaseException as e:
+            self._detener(e)
+
+    def _detener(self, error):
+        # Nadie va a atender lo pendiente: cada futuro (en cola o en curso) falla con el error.
+        with self._candado:
+            self.error = error
+            futuros = [p.futuro for p in self._en_vuelo.values()]
+            self._en_vuelo.clear()
+            self._colas.clear()
+            self._turnos.clear()
+            self._activos = 0
+        for futuro in futuros:
+            if not futuro.done():
+                futuro.set_exception(error)
+
+    async def _despachar(self):
+        cliente_http = None
+        if self.modo_consulta == "http":
+            cliente_http = ClienteHttp(objetivo_comparables=self.objetivo_comparables, max_paginas=self.max_paginas)
+        self._cliente_http = cliente_http
+        # Vigencia 0: el broker nunca responde del caché (eso ya lo decidió quien llamó), solo guarda.
+        cache = CacheMercado(ttl_horas=0)
+        from fragmentos import borrar_perfil, clonar_perfil
+
+        while True:
+            await self._despertar.wait()
+            # Chromium bloquea la carpeta de su perfil mientras está abierto: el broker usa una copia
+            # del maestro, tomada cada vez que se abre (así trae la sesión de MercadoLibre más reciente).
+            perfil = clonar_perfil(self.ruta_memoria)
+            try:
+                async with PoolPaginasAsync(
+                    False,
+                    paginas=self.paginas,
+                    ruta_memoria=perfil,
+                    objetivo_comparables=self.objetivo_comparables,
+                    max_paginas=self.max_paginas,
+                    **self._opciones_pool,
+                ) as pool:
+                    self._pool = pool
+                    try:
+                        await self._repartir(pool, cache, cliente_http)
+                    finally:
+                        sumar_contadores(self._contadores, navegador=pool)
+                        self._pool = None
+            finally:
+                borrar_perfil(perfil)
+
+    async def _repartir(self, pool, cache, cliente_http):
+        # Regresa (y se cierra Chromium) tras INACTIVIDAD_BROKER segundos sin nada en cola ni en curso.
+        while True:
+            self._despertar.clear()
+            while True:
+                with self._candado:
+                    if self._activos >= self.paginas:
+                        break
+                    pedido = self._siguiente()
+                    if pedido is None:
+                        break
+                    self._activos += 1
+                self._loop.create_task(self._atender(pedido, pool, cache, cliente_http), context=pedido.contexto)
+            with self._candado:
+                ocioso = self._activos == 0 and not self._turnos
+            try:
+                await asyncio.wait_for(self._despertar.wait(), INACTIVIDAD_BROKER if ocioso else None)
+            except asyncio.TimeoutError:
+                return
+
+    async def _atender(self, pedido, pool, cache, cliente_http):
+        espera = time.monotonic() - pedido.encolado
+        with vehiculo(**pedido.traza):
+            if pedido.tiempo_cache:
+                etapa_previa("cache", pedido.tiempo_cache)
+            etapa_previa("cola_broker", espera)
+            try:
+                resultado = await analizar_vehiculo_async(*pedido.consulta, pool, self.regulador, cache, cliente_http)
+            except Exception as e:
+                resultado = (0, 0, describir_error(e), pedido.url, 0, 0, 0)
+            anotar(url=resultado[3], estado=resultado[2])
+        # La red de cada búsqueda se entrega a quienes la esperan; el pool no la acumula.
+        red = pool.red_por_url.pop(pedido.url, None)
+        with self._candado:
+            self._activos -= 1
+            if self._en_vuelo.get(pedido.url) is pedido:
+                del self._en_vuelo[pedido.url]
+            self._esperas.append(espera)
+            self.atendidas += 1
+            redes = list(pedido.redes)
+        if red is not None:
+            for destino in redes:
+                destino[pedido.url] = red
+        # _siguiente ya lo marcó en curso, así que nadie pudo cancelarlo.
+        if not pedido.futuro.done():
+            pedido.futuro.set_result(resultado)
+        self._despertar.set()
@@ -0,0 +1,144 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit, urlunsplit
+
+# -------------------------
+# CONFIGURACIÓN CACHÉ
+# -------------------------
+RUTA_CACHE = os.path.join(os.getcwd(), "cache_mercado.db")
+TTL_HORAS = 24
+MAX_ENTRADAS = 20000
+
+# Lo más viejo que se conserva. Una entrada vencida (más vieja que ``ttl_horas``) ya no cuenta
+# como acierto de un escaneo, pero "Cotizar compra" la muestra con su antigüedad mientras exista.
+RETENCION_HORAS = 24 * 30
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS precios (
+    clave TEXT PRIMARY KEY,
+    precios TEXT NOT NULL,
+    precio_daytona INTEGER NOT NULL,
+    cantidad INTEGER NOT NULL,
+    mediana INTEGER NOT NULL,
+    minimo INTEGER NOT NULL,
+    maximo INTEGER NOT NULL,
+    creado REAL NOT NULL,
+    ultimo_uso REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_precios_creado ON precios (creado);
+CREATE INDEX IF NOT EXISTS idx_precios_uso ON precios (ultimo_uso);
+"""
+
+
+def normalizar_clave(url):
+    partes = urlsplit(url.strip())
+    return urlunsplit((partes.scheme.lower(), partes.netloc.lower(), partes.path.rstrip("/").lower(), partes.query, ""))
+
+
+class CacheMercado:
+    """Precios de MercadoLibre ya consultados, guardados en SQLite por URL de búsqueda normalizada.
+
+    Cada entrada guarda la lista de precios brutos, las estadísticas calculadas y la hora de consulta.
+    Las entradas más viejas que ``ttl_horas`` ya no cuentan como acierto; ``purgar()`` borra las
+    más viejas que ``retencion_horas`` (o que ``ttl_horas``, si es mayor), junto con las de menor
+    uso reciente si se pasa de ``max_entradas``.
+    """
+
+    def __init__(self, ruta=RUTA_CACHE, ttl_horas=TTL_HORAS, max_entradas=MAX_ENTRADAS, retencion_horas=RETENCION_HORAS):
+        self.ruta = ruta
+        self.ttl_segundos = float(ttl_horas) * 3600
+        self.retencion_segundos = max(float(retencion_horas) * 3600, self.ttl_segundos)
+        self.max_entradas = max_entradas
+        self.aciertos = 0
+        self.fallos = 0
+        with self._conectar() as con:
+            con.executescript(ESQUEMA)
+
+    @contextmanager
+    def _conectar(self):
+        con = sqlite3.connect(self.ruta, timeout=30)
+        try:
+            con.execute("PRAGMA journal_mode=WAL")
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def obtener(self, url, ignorar_ttl=False):
+        clave = normalizar_clave(url)
+        with self._conectar() as con:
+            fila = con.execute(
+                "SELECT precios, precio_daytona, cantidad, mediana, minimo, maximo, creado "
+                "FROM precios WHERE clave = ?",
+                (clave,),
+            ).fetchone()
+            vigente = fila is not None and (ignorar_ttl or time.time() - fila[6] <= self.ttl_segundos)
+            if vigente:
+                con.execute("UPDATE precios SET ultimo_uso = ? WHERE clave = ?", (time.time(), clave))
+
+        if not vigente:
+            self.fallos += 1
+            return None
+
+        self.aciertos += 1
+        return {
+            "precios": json.loads(fila[0]),
+            "precio_daytona": fila[1],
+            "cantidad": fila[2],
+            "mediana": fila[3],
+            "minimo": fila[4],
+            "maximo": fila[5],
+            "creado": fila[6],
+        }
+
+    def creados(self, urls):
+        """Hora de consulta de las URLs que están en el caché (vigentes o no), sin contarlas como uso."""
+        claves = {normalizar_clave(u): u for u in urls}
+        creados = {}
+        with self._conectar() as con:
+            lista = list(claves)
+            # En bloques, por el límite de parámetros de SQLite.
+            for i in range(0, len(lista), 500):
+                bloque = lista[i:i + 500]
+                for clave, creado in con.execute(
+                    f"SELECT clave, creado FROM precios WHERE clave IN ({', '.join('?' * len(bloque))})", bloque
+                ):
+                    creados[claves[clave]] = creado
+        return creados
+
+    def guardar(self, url, precios_brutos, estadisticas):
+        ahora = time.time()
+        with self._conectar() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO precios "
+                "(clave, precios, precio_daytona, cantidad, mediana, minimo, maximo, creado, ultimo_uso) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    normalizar_clave(url),
+                    json.dumps(precios_brutos),
+                    estadisticas["precio_daytona"],
+                    estadisticas["cantidad"],
+                    estadisticas["mediana"],
+                    estadisticas["minimo"],
+                    estadisticas["maximo"],
+                    ahora,
+                    ahora,
+                ),
+            )
+
+    def purgar(self):
+        with self._conectar() as con:
+            borradas = con.execute(
+                "DELETE FROM precios WHERE creado < ?", (time.time() - self.retencion_segundos,)
+            ).rowcount
+            total = con.execute("SELECT COUNT(*) FROM precios").fetchone()[0]
+            if total > self.max_entradas:
+                borradas += con.execute(
+                    "DELETE FROM precios WHERE clave IN "
+                    "(SELECT clave FROM precios ORDER BY ultimo_uso ASC LIMIT ?)",
+                    (total - self.max_entradas,),
+                ).rowcount
+        return borradas
@@ -0,0 +1,320 @@
+import difflib
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from mercado_ml import normalizar_para_url
+
+# ----------------------------------------------------
+# CATÁLOGO AUTOPRECIOS
+# ----------------------------------------------------
+RUTA_AUTOPRECIOS = os.path.join(os.getcwd(), "autoprecios_lobato_catalogo.xls")
+HOJA_AUTOPRECIOS = "AUTOPRECIOS"
+
+# Columnas de texto muy repetidas: como categóricas ocupan una fracción de la memoria.
+COLUMNAS_CATEGORICAS = ("MARCA", "SUBMARCA", "VERSIÓN")
+
+# Valor de los niveles del índice que significa "todas" (nada elegido todavía en ese selector).
+TODAS = None
+
+# Copia del catálogo por proceso: todas las sesiones de Streamlit comparten el mismo DataFrame
+# (de solo lectura; quien lo quiera modificar debe hacer .copy()).
+_memoria = {}
+_indices = {}
+_candado = threading.Lock()
+
+
+def _firma_rapida(ruta):
+    info = os.stat(ruta)
+    return info.st_mtime_ns, info.st_size
+
+def _hash_archivo(ruta):
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+def _rutas_sidecar(ruta):
+    base, _ = os.path.splitext(ruta)
+    return {
+        "parquet": base + ".cache.parquet",
+        "pickle": base + ".cache.pkl",
+        "meta": base + ".cache.json",
+    }
+
+def normalizar_anio(x):
+    try:
+        if pd.notna(x):
+            return str(int(float(x)))
+    except:
+        return ""
+    return ""
+
+def leer_excel_catalogo(ruta):
+    df = pd.read_excel(ruta, sheet_name=HOJA_AUTOPRECIOS)
+    df.columns = df.columns.str.strip()
+    df.columns = df.columns.str.upper()
+    for col in COLUMNAS_CATEGORICAS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
+
+def _guardar_sidecar(df, rutas):
+    try:
+        df.to_parquet(rutas["parquet"], index=False)
+        return "parquet"
+    except Exception:
+        # Sin pyarrow, o con columnas de tipos mezclados que Parquet no acepta.
+        df.to_pickle(rutas["pickle"])
+        return "pickle"
+
+def _leer_sidecar(rutas, formato):
+    if formato == "parquet":
+        return pd.read_parquet(rutas["parquet"])
+    return pd.read_pickle(rutas["pickle"])
+
+def _cargar_desde_disco(ruta):
+    rutas = _rutas_sidecar(ruta)
+    mtime_ns, tamano = _firma_rapida(ruta)
+
+    meta = None
+    if os.path.exists(rutas["meta"]):
+        try:
+            with open(rutas["meta"], encoding="utf-8") as f:
+                meta = json.load(f)
+        except ValueError:
+            meta = None
+
+    if meta is not None:
+        vigente = meta["mtime_ns"] == mtime_ns and meta["tamano"] == tamano
+        if not vigente and meta["tamano"] == tamano:
+            # Cambió la fecha pero quizá no el contenido (p. ej. se volvió a copiar el archivo).
+            vigente = meta["sha256"] == _hash_archivo(ruta)
+        if vigente:
+            try:
+                df = _leer_sidecar(rutas, meta["formato"])
+                if meta["mtime_ns"] != mtime_ns:
+                    meta["mtime_ns"] = mtime_ns
+                    with open(rutas["meta"], "w", encoding="utf-8") as f:
+                        json.dump(meta, f)
+                return df
+            except Exception:
+                pass
+
+    df = leer_excel_catalogo(ruta)
+    formato = _guardar_sidecar(df, rutas)
+    with open(rutas["meta"], "w", encoding="utf-8") as f:
+        json.dump(
+            {"mtime_ns": mtime_ns, "tamano": tamano, "sha256": _hash_archivo(ruta), "formato": formato},
+            f,
+        )
+    return df
+
+def cargar_catalogo(ruta=RUTA_AUTOPRECIOS):
+    """Catálogo AUTOPRECIOS, leído del .xls solo cuando cambia.
+
+    Dentro del proceso se reutiliza el mismo DataFrame mientras el archivo no cambie; entre
+    reinicios se lee de un archivo Parquet (o pickle) junto al .xls, que se reconstruye cuando
+    cambian la fecha o el contenido del .xls.
+    """
+    firma = _firma_rapida(ruta)
+    with _candado:
+        guardado = _memoria.get(ruta)
+        if guardado is not None and guardado[0] == firma:
+            return guardado[1]
+        df = _cargar_desde_disco(ruta)
+        _memoria[ruta] = (firma, df)
+        return df
+
+
+# ----------------------------------------------------
+# ÍNDICE PARA LOS SELECTORES DE "COTIZAR COMPRA"
+# ----------------------------------------------------
+class IndiceCatalogo:
+    """Índice anidado marca → submarca → año → versión → posición de la fila en el catálogo.
+
+    Los tres primeros niveles tienen además la llave ``TODAS`` (None) con la unión de sus
+    hermanos, para que cada selector se resuelva con un acceso a diccionario aunque los
+    anteriores sigan sin elegir. Los años se normalizan una sola vez al construirlo; ante
+    filas repetidas gana la primera, igual que el ``iloc[0]`` del filtro original.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self.arbol = {}
+        self._listas = {}
+
+        marcas = df["MARCA"].astype(object)
+        submarcas = df["SUBMARCA"].astype(object)
+        versiones = df["VERSIÓN"].astype(object)
+        anios = [normalizar_anio(a) for a in df["AÑO/MODELO"]]
+
+        for pos, (m, s, a, v) in enumerate(zip(marcas, submarcas, anios, versiones)):
+            llaves_m = (TODAS,) if pd.isna(m) else (TODAS, str(m))
+            llaves_s = (TODAS,) if pd.isna(s) else (TODAS, str(s))
+            llaves_a = (TODAS, a)
+            version = None if pd.isna(v) else str(v)
+            for lm in llaves_m:
+                nivel_m = self.arbol.setdefault(lm, {})
+                for ls in llaves_s:
+                    nivel_s = nivel_m.setdefault(ls, {})
+                    for la in llaves_a:
+                        nivel_a = nivel_s.setdefault(la, {})
+                        if version is not None:
+                            nivel_a.setdefault(version, pos)
+
+    def _nodo(self, *llaves):
+        nodo = self.arbol
+        for llave in llaves:
+            nodo = nodo.get(llave)
+            if nodo is None:
+                return {}
+        return nodo
+
+    def _ordenadas(self, llaves, filtro=None):
+        lista = self._listas.get(llaves)
+        if lista is None:
+            lista = sorted(k for k in self._nodo(*llaves) if k is not TODAS and (filtro is None or filtro(k)))
+            self._listas[llaves] = lista
+        return lista
+
+    def marcas(self):
+        return self._ordenadas(())
+
+    def submarcas(self, marca=TODAS):
+        return self._ordenadas((marca,))
+
+    def anios(self, marca=TODAS, submarca=TODAS):
+        return self._ordenadas((marca, submarca), filtro=lambda a: len(a) == 4)
+
+    def versiones(self, marca=TODAS, submarca=TODAS, anio=TODAS):
+        return self._ordenadas((marca, submarca, anio))
+
+    def fila(self, marca, submarca, anio, version):
+        pos = self._nodo(marca, submarca, anio).get(version)
+        return None if pos is None else self.df.iloc[pos]
+
+def indice_catalogo(ruta=RUTA_AUTOPRECIOS):
+    """``IndiceCatalogo`` del catálogo vigente, construido una vez por proceso."""
+    df = cargar_catalogo(ruta)
+    with _candado:
+        guardado = _indices.get(ruta)
+        if guardado is not None and guardado.df is df:
+            return guardado
+        indice = IndiceCatalogo(df)
+        _indices[ruta] = indice
+        return indice
+
+
+# ----------------------------------------------------
+# CRUCE DE INVENTARIO CON EL CATÁLOGO
+# ----------------------------------------------------
+# Columna de precio del catálogo → columna que agrega al reporte de inventario.
+PRECIOS_CATALOGO = (
+    ("PRECIO VENTA", "Cat. Venta"),
+    ("PRECIO COMPRA", "Cat. Compra"),
+    ("PRECIO INTERMEDIO", "Cat. Intermedio"),
+    ("PRECIO AGENCIA CERTIFICADOS", "Cat. Certificados"),
+    ("PRECIO_DE_LISTA_NUEVO", "Cat. Lista Nuevo"),
+)
+COLUMNAS_CRUCE = [reporte for _, reporte in PRECIOS_CATALOGO] + ["Cat. Coincidencia"]
+
+# Parecido mínimo (difflib, 0 a 1) para aceptar una versión que no coincide exacto.
+UMBRAL_VERSION = 0.6
+
+_cruces = {}
+
+
+def _normalizar_valores(valores, funcion=None):
+    # Cada valor distinto se normaliza una sola vez; vacíos y NaN quedan en "".
+    codigos, unicos = pd.factorize(pd.Series(valores, dtype=object).astype(object))
+    funcion = funcion or (lambda u: normalizar_para_url(str(u)))
+    normalizados = np.array([funcion(u) for u in unicos] + [""], dtype=object)
+    return normalizados[codigos]
+
+def _tokens_version(version):
+    # "cvt-sport" y "sport-cvt" se comparan igual.
+    return " ".join(sorted(t for t in version.split("-") if t))
+
+
+class CruceCatalogo:
+    """Catálogo indexado por marca, submarca, año y versión normalizados, para cruzar inventarios completos.
+
+    Las llaves pasan por el mismo plegado de acentos y mayúsculas que las URLs de búsqueda
+    (``normalizar_para_url``). La versión se busca primero exacta en un diccionario; si no está,
+    se elige la más parecida entre las versiones del mismo marca/submarca/año. Ante filas
+    repetidas en el catálogo gana la primera.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        marcas = _normalizar_valores(df["MARCA"])
+        submarcas = _normalizar_valores(df["SUBMARCA"])
+        anios = _normalizar_valores(df["AÑO/MODELO"], normalizar_anio)
+        versiones = _normalizar_valores(df["VERSIÓN"])
+
+        self.exactas = {}
+        self.bloques = {}
+        for pos, llave in enumerate(zip(marcas, submarcas, anios, versiones)):
+            if llave in self.exactas or not llave[3]:
+                continue
+            self.exactas[llave] = pos
+            self.bloques.setdefault(llave[:3], {}).setdefault(_tokens_version(llave[3]), pos)
+
+        self.precios = pd.DataFrame(
+            {
+                reporte: pd.to_numeric(df[col], errors="coerce") if col in df.columns else np.nan
+                for col, reporte in PRECIOS_CATALOGO
+            },
+            index=df.index,
+        ).to_numpy(dtype=float)
+
+    def posicion(self, marca, submarca, anio, version):
+        """``(posición en el catálogo, "Exacta" | "Aproximada")`` de una llave ya normalizada, o ``(-1, "")``."""
+        pos = self.exactas.get((marca, submarca, anio, version))
+        if pos is not None:
+            return pos, "Exacta"
+        bloque = self.bloques.get((marca, submarca, anio))
+        if not bloque or not version:
+            return -1, ""
+        parecidas = difflib.get_close_matches(_tokens_version(version), list(bloque), n=1, cutoff=UMBRAL_VERSION)
+        if not parecidas:
+            return -1, ""
+        return bloque[parecidas[0]], "Aproximada"
+
+    def cruzar(self, marcas, submarcas, anios, versiones):
+        """Precios del catálogo para cada fila (columnas ``COLUMNAS_CRUCE``); NaN donde no hubo coincidencia."""
+        llaves = pd.MultiIndex.from_arrays([
+            _normalizar_valores(marcas),
+            _normalizar_valores(submarcas),
+            _normalizar_valores(anios, normalizar_anio),
+            _normalizar_valores(versiones),
+        ])
+        # Una búsqueda por combinación distinta; después se reparte a todas las filas con numpy.
+        codigos, unicas = llaves.factorize()
+        encontradas = [self.posicion(*llave) for llave in unicas]
+        posiciones = np.array([p for p, _ in encontradas] + [-1], dtype=int)[codigos]
+        tipos = np.array([t for _, t in encontradas] + [""], dtype=object)[codigos]
+
+        precios = np.full((len(posiciones), self.precios.shape[1]), np.nan)
+        hay = posiciones >= 0
+        precios[hay] = self.precios[posiciones[hay]]
+        cruce = pd.DataFrame(precios, columns=[reporte for _, reporte in PRECIOS_CATALOGO])
+        cruce["Cat. Coincidencia"] = tipos
+        return cruce
+
+def cruce_catalogo(ruta=RUTA_AUTOPRECIOS):
+    """``CruceCatalogo`` del catálogo vigente, construido una vez por proceso."""
+    df = cargar_catalogo(ruta)
+    with _candado:
+        guardado = _cruces.get(ruta)
+        if guardado is not None and guardado.df is df:
+            return guardado
+        cruce = CruceCatalogo(df)
+        _cruces[ruta] = cruce
+        return cruce
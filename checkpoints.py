@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+import time
+
+# -------------------------
+# CONFIGURACIÓN CHECKPOINTS
+# -------------------------
+CARPETA_CHECKPOINTS = os.path.join(os.getcwd(), "checkpoints")
+
+# Un avance más viejo que esto ya no se reanuda (los precios de mercado cambian).
+VIGENCIA_HORAS = 24
+
+# Elementos del resultado de mercado_ml.analizar_vehiculo (el último, la mediana, se agregó después).
+LARGO_RESULTADO = 7
+
+
+def hash_inventario(contenido):
+    return hashlib.sha256(contenido).hexdigest()
+
+def es_fallido(estado):
+    return str(estado).startswith("Error") or estado == "0 Resultados"
+
+
+class BitacoraEscaneo:
+    """Resultados de un escaneo, anotados vehículo por vehículo en un archivo JSONL.
+
+    El archivo se llama como el hash del inventario subido; cada línea es
+    ``{"clave", "resultado", "estado", "ts"}`` y la última línea de una clave manda.
+    Cada anotación se escribe y se sincroniza a disco en cuanto se calcula, así
+    que un corte a media corrida solo pierde el vehículo que estaba en curso.
+    """
+
+    def __init__(self, hash_archivo, carpeta=CARPETA_CHECKPOINTS, vigencia_horas=VIGENCIA_HORAS):
+        os.makedirs(carpeta, exist_ok=True)
+        self.hash_archivo = hash_archivo
+        self.carpeta = carpeta
+        self.vigencia_horas = vigencia_horas
+        self.ruta = os.path.join(carpeta, f"{hash_archivo}.jsonl")
+        self.vigencia_segundos = float(vigencia_horas) * 3600
+        self.registros = self._cargar()
+
+    def _cargar(self):
+        registros = {}
+        if not os.path.exists(self.ruta):
+            return registros
+        if time.time() - os.path.getmtime(self.ruta) > self.vigencia_segundos:
+            os.remove(self.ruta)
+            return registros
+        linea = ""
+        with open(self.ruta, encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    registro = json.loads(linea)
+                except ValueError:
+                    # Última línea a medio escribir cuando se cayó el proceso.
+                    continue
+                registros[registro["clave"]] = registro
+        if linea and not linea.endswith("\n"):
+            # Se cierra la línea rota para que la siguiente anotación empiece limpia.
+            with open(self.ruta, "a", encoding="utf-8") as f:
+                f.write("\n")
+        return registros
+
+    def __len__(self):
+        return len(self.registros)
+
+    @property
+    def fallidos(self):
+        return sum(1 for r in self.registros.values() if es_fallido(r["estado"]))
+
+    def obtener(self, clave, reintentar_fallidos=False):
+        registro = self.registros.get(clave)
+        if registro is None or (reintentar_fallidos and es_fallido(registro["estado"])):
+            return None
+        resultado = tuple(registro["resultado"])
+        return resultado + (0,) * (LARGO_RESULTADO - len(resultado))
+
+    def registrar(self, claves, resultado):
+        ahora = time.time()
+        lineas = []
+        for clave in claves:
+            registro = {"clave": clave, "resultado": list(resultado), "estado": resultado[2], "ts": ahora}
+            self.registros[clave] = registro
+            lineas.append(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+        # Una sola escritura en modo O_APPEND: varios procesos pueden anotar en la misma bitácora
+        # (escaneo repartido) sin que sus líneas se mezclen.
+        fd = os.open(self.ruta, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, "".join(lineas).encode("utf-8"))
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def borrar(self):
+        self.registros = {}
+        if os.path.exists(self.ruta):
+            os.remove(self.ruta)
@@ -1,11 +1,40 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
-from playwright.sync_api import sync_playwright
+import concurrent.futures
 import os
 import time
-import re
-import statistics
-import unicodedata
+import uuid
+
+import trabajos
+from broker import BrokerConsultas
+from checkpoints import BitacoraEscaneo, hash_inventario
+from cache_mercado import TTL_HORAS, CacheMercado
+from catalogo import PRECIOS_CATALOGO, RUTA_AUTOPRECIOS, TODAS, cargar_catalogo, indice_catalogo
+from escaneo import (
+    FILAS_PRUEBA,
+    cargar_inventario,
+    ejecutar_escaneo,
+    guardar_historial,
+    preparar_inventario,
+    resumen_consultas,
+)
+from historial import ARCHIVO_CSV_HISTORIAL, ETIQUETAS_TRAMOS, ErrorEsquemaHistorial, HistorialPrecios
+from mercado_ml import (
+    MAX_NAVEGADORES,
+    MAX_PAGINAS,
+    MAX_PESTANAS,
+    MODOS_CONSULTA,
+    OBJETIVO_COMPARABLES,
+    TIPOS_BLOQUEADOS,
+    TIPOS_RECURSO,
+    preparar_consulta,
+    resultado_desde_estadisticas,
+    texto_navegador,
+)
+from precarga import leer_estado
+from regulador import ReguladorTasa, texto_regulador
+from trazas import archivos_trazas, leer_trazas, resumir_trazas
 
 # -------------------------
 # CONFIGURACIÓN PÁGINA
@@ -39,112 +68,291 @@ st.title("Daytona Financial Intelligence")
 st.markdown("---")
 
 # -------------------------
-# FUNCIONES UTILITARIAS
+# REPORTE DE INVENTARIO
 # -------------------------
-def normalizar_para_url(texto):
-    if not isinstance(texto, str):
-        return ""
-    texto = "".join(
-        c for c in unicodedata.normalize("NFD", texto)
-        if unicodedata.category(c) != "Mn"
+COLUMNAS_MONEDA = [
+    "Costo Real", "Compra Sugerida", "Actual Venta", "Sugerido Venta", "Mínimo (Piso)", "Mediana Mercado", "Utilidad",
+] + [
+    reporte for _, reporte in PRECIOS_CATALOGO
+]
+
+# Arriba de esto el reporte se muestra por páginas para no mandar miles de filas al navegador;
+# durante el escaneo la tabla en vivo muestra solo los últimos autos terminados.
+FILAS_POR_PAGINA = 500
+FILAS_EN_VIVO = 200
+
+# Segundos que "Cotizar compra" espera su consulta en el navegador compartido antes de rendirse.
+ESPERA_COTIZACION = 120
+
+def configuracion_columnas():
+    config = {c: st.column_config.NumberColumn(c, format="dollar") for c in COLUMNAS_MONEDA}
+    config.update({
+        "Link": st.column_config.LinkColumn("URL"),
+        "S": st.column_config.Column("S", width="small"),
+        "±": st.column_config.Column("±", width="small", help="Utilidad positiva (🟢) o negativa (🔴)"),
+        "Comp.": st.column_config.NumberColumn(help="Autos similares en mercado"),
+        "Compra Sugerida": st.column_config.NumberColumn(
+            "Compra Sugerida", format="dollar", help="Precio máx compra (12% margen)"
+        ),
+        "Costo Real": st.column_config.NumberColumn("Costo Real", format="dollar", help="Costo original de libro"),
+        "Cat. Coincidencia": st.column_config.Column(
+            "Cat.", width="small", help="Versión de AUTOPRECIOS exacta o la más parecida del mismo modelo y año"
+        ),
+    })
+    return config
+
+def tabla_reporte(df_r, contenedor=st):
+    vista = df_r.drop(columns=["Fecha"], errors="ignore")
+    utilidad = pd.to_numeric(vista["Utilidad"], errors="coerce").fillna(0)
+    vista.insert(
+        vista.columns.get_loc("Utilidad"),
+        "±",
+        np.select([utilidad > 0, utilidad < 0], ["🟢", "🔴"], default=""),
+    )
+    contenedor.dataframe(
+        vista,
+        column_config=configuracion_columnas(),
+        hide_index=True,
+        use_container_width=True,
     )
-    texto = texto.lower().strip()
-    texto = re.sub(r"[^a-z0-9]+", "-", texto)
-    texto = re.sub(r"-+", "-", texto)
-    return texto
-
-def obtener_semaforo_por_dias(valor_celda):
-    try:
-        texto = str(valor_celda)
-        numeros = re.findall(r"\d+", texto)
-        if not numeros:
-            return "", 0
-        dias = int(numeros[0])
-        if dias <= 30:
-            return "🟢", dias
-        elif dias <= 89:
-            return "🟡", dias
-        else:
-            return "🔴", dias
-    except:
-        return "", 0
 
-def analizar_vehiculo(marca, modelo, anio, ver_navegador):
-    if not marca or not modelo or not anio:
-        return 0, 0, "Datos incompletos", "", 0, 0
+def texto_antiguedad(segundos):
+    if segundos < 3600:
+        return f"{max(1, int(segundos // 60))} min"
+    if segundos < 2 * 86400:
+        return f"{segundos / 3600:.0f} h"
+    return f"{segundos / 86400:.0f} días"
+
+def mostrar_reporte(df_r, nombre_reporte, info=None, clave="reporte"):
+    info = info or {}
+    if info.get("regulador"):
+        st.caption(f"Ritmo final: {texto_regulador(info['regulador'])}")
+    if info.get("cache_aciertos") is not None:
+        st.caption(
+            f"Caché de precios: {info['cache_aciertos']} aciertos · {info['cache_fallos']} consultas nuevas "
+            f"· {len(df_r)} autos en el reporte"
+        )
+    if texto_navegador(info.get("navegador")):
+        st.caption(texto_navegador(info["navegador"]))
+    relanzados = [f for f in info.get("fragmentos", []) if f["intentos"] > 1]
+    if relanzados:
+        st.warning(
+            f"{len(relanzados)} de {len(info['fragmentos'])} procesos se cayeron y su parte se volvió a lanzar."
+        )
 
-    marca_url = normalizar_para_url(marca)
-    modelo_url = normalizar_para_url(modelo)
+    st.header(f"Resumen Ejecutivo: {nombre_reporte}")
+    total_inventario = df_r['Costo Real'].sum()
+    total_utilidad = df_r['Utilidad'].sum()
 
-    try:
-        anio_str = str(int(float(anio)))
-    except:
-        return 0, 0, "Error Año", "", 0, 0
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Valor Inventario", f"${total_inventario:,.0f}")
+    col2.metric("Utilidad Potencial", f"${total_utilidad:,.0f}")
 
-    url = f"https://autos.mercadolibre.com.mx/{marca_url}/{modelo_url}/{anio_str}_NoIndex_True?VIEW=list"
-    ruta_memoria = os.path.join(os.getcwd(), "mi_sesion_ml")
-    precios_brutos = []
+    if len(df_r) > FILAS_POR_PAGINA:
+        paginas = -(-len(df_r) // FILAS_POR_PAGINA)
+        pagina = st.number_input(
+            f"Página (de {paginas})", min_value=1, max_value=paginas, value=1, key=f"pagina_{clave}"
+        )
+        inicio = (pagina - 1) * FILAS_POR_PAGINA
+        st.caption(f"Autos {inicio + 1}–{min(inicio + FILAS_POR_PAGINA, len(df_r))} de {len(df_r)}")
+        tabla_reporte(df_r.iloc[inicio:inicio + FILAS_POR_PAGINA])
+    else:
+        tabla_reporte(df_r)
 
-    try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch_persistent_context(
-                user_data_dir=ruta_memoria,
-                headless=not ver_navegador,
-                viewport={"width": 1280, "height": 800},
-                args=["--disable-blink-features=AutomationControlled"],
+    st.markdown(
+        "<div class='footer-text'>2026 Grupo Daytona · Información confidencial · Generado por Daytona Intelligence</div>",
+        unsafe_allow_html=True
+    )
+    st.markdown("---")
+
+    nombre_csv = f"Daytona_Reporte_{nombre_reporte}_{time.strftime('%Y%m%d')}.csv"
+    csv = df_r.to_csv(index=False).encode('utf-8')
+    st.download_button("📥 Descargar Reporte CSV", csv, nombre_csv, "text/csv", key=f"csv_{clave}")
+
+    red_por_url = info.get("red_por_url") or {}
+    if red_por_url:
+        with st.expander("Red del navegador (recursos bloqueados)"):
+            red = df_r[["Auto", "Año", "Link"]].copy()
+            medicion = red["Link"].map(red_por_url)
+            red = red[medicion.notna()]
+            medicion = medicion.dropna()
+            red["Bloqueadas"] = medicion.map(lambda m: m["bloqueadas"])
+            red["KB ahorrados (est.)"] = medicion.map(lambda m: round(m["bytes_ahorrados_est"] / 1024))
+            red["KB descargados"] = medicion.map(lambda m: round(m["bytes_descargados"] / 1024))
+            bloqueadas = sum(m["bloqueadas"] for m in red_por_url.values())
+            ahorrados = sum(m["bytes_ahorrados_est"] for m in red_por_url.values())
+            st.caption(
+                f"{bloqueadas:,} peticiones bloqueadas · ≈{ahorrados / 1024 ** 2:,.1f} MB ahorrados "
+                f"en {len(red_por_url)} búsquedas con navegador"
             )
-            page = browser.pages[0]
-            page.goto(url, timeout=30000)
-            time.sleep(3.5)
-
-            elementos = page.locator(".andes-money-amount__fraction").all_inner_texts()
-            for t in elementos:
-                limpio = t.replace(",", "").replace(".", "")
-                try:
-                    val = int(limpio)
-                    if 50000 <= val <= 10000000:
-                        precios_brutos.append(val)
-                except:
-                    pass
-
-            browser.close()
-    except Exception as e:
-        return 0, 0, f"Error: {str(e)[:10]}", url, 0, 0
+            st.dataframe(red.drop(columns=["Link"]), hide_index=True, use_container_width=True)
 
-    if not precios_brutos:
-        return 0, 0, "0 Resultados", url, 0, 0
+# -------------------------
+# COLA DE ESCANEOS
+# -------------------------
+ETIQUETAS_ESTADO = {
+    "pendiente": "⏳ En cola",
+    "en_proceso": "🔄 En proceso",
+    "terminado": "✅ Terminado",
+    "error": "❌ Error",
+    "cancelado": "🚫 Cancelado",
+}
+
+@st.fragment(run_every=3)
+def estado_trabajos():
+    lista = trabajos.listar()
+    if not lista:
+        st.caption("No hay escaneos en cola.")
+        return
+
+    activos = [t for t in lista if t["estado"] in ("pendiente", "en_proceso")]
+    if activos and not trabajos.trabajador_activo():
+        trabajos.asegurar_trabajador()
+
+    for t in lista:
+        col_a, col_b, col_c = st.columns([3, 2, 1])
+        col_a.write(f"**#{t['id']}** {t['nombre']}{' · prueba' if t['prueba'] else ''}")
+        etiqueta = ETIQUETAS_ESTADO.get(t["estado"], t["estado"])
+        if t["estado"] == "en_proceso" and t["total"]:
+            col_b.progress(min(t["hechos"] / t["total"], 1.0), text=f"{etiqueta} {t['hechos']}/{t['total']}")
+        elif t["estado"] == "error":
+            col_b.write(f"{etiqueta}: {t['error'] or ''}")
+        else:
+            col_b.write(etiqueta)
+        if t["estado"] in ("pendiente", "en_proceso") and col_c.button("Cancelar", key=f"cancelar_trabajo_{t['id']}"):
+            trabajos.cancelar(t["id"])
+            st.rerun(scope="fragment")
+
+    # Cuando termina un trabajo se recarga la página completa para que aparezca en "Ver resultados".
+    terminados = {t["id"] for t in lista if t["estado"] == "terminado"}
+    if st.session_state.get("trabajos_terminados", terminados) != terminados:
+        st.session_state["trabajos_terminados"] = terminados
+        st.rerun()
+    st.session_state["trabajos_terminados"] = terminados
+
+def panel_trabajos():
+    st.markdown("---")
+    st.subheader("Escaneos en segundo plano")
+    estado_trabajos()
+
+    terminados = [t for t in trabajos.listar() if t["estado"] == "terminado"]
+    if terminados:
+        elegido = st.selectbox(
+            "Ver resultados",
+            terminados,
+            format_func=lambda t: f"#{t['id']} {t['nombre']} ({time.strftime('%Y-%m-%d %H:%M', time.localtime(t['terminado']))})",
+        )
+        if elegido:
+            df_r, info = trabajos.resultado(elegido["id"])
+            if df_r is not None:
+                mostrar_reporte(df_r, elegido["sucursal"] or "General", info, clave=f"trabajo_{elegido['id']}")
 
-    mediana_inicial = statistics.median(precios_brutos)
-    precios_limpios = [
-        p for p in precios_brutos
-        if mediana_inicial * 0.6 <= p <= mediana_inicial * 1.6
-    ]
+# -------------------------
+# NAVEGADOR COMPARTIDO
+# -------------------------
+# Un solo broker por proceso de Streamlit: todas las sesiones (pestañas, usuarios) consultan
+# MercadoLibre por el mismo Chromium, con sus pestañas como tope global.
+@st.cache_resource
+def _broker_compartido():
+    return BrokerConsultas()
+
+def broker_consultas():
+    broker = _broker_compartido()
+    if not broker.activo:
+        # Su hilo se cayó (y ya falló lo pendiente): se arranca otro para las siguientes consultas.
+        _broker_compartido.clear()
+        broker = _broker_compartido()
+    return broker
+
+def usuario_sesion():
+    # Identifica la fila de esta sesión en el broker (los turnos se reparten por sesión).
+    return st.session_state.setdefault("usuario_broker", uuid.uuid4().hex[:8])
+
+@st.fragment(run_every=3)
+def estado_broker():
+    estado = broker_consultas().estado()
+    col_a, col_b = st.columns(2)
+    col_a.metric("En cola", estado["en_cola"])
+    col_b.metric("En curso", f"{estado['en_curso']}/{estado['paginas']}")
+    col_a.metric("Espera media", f"{estado['espera_media']:.1f} s")
+    col_b.metric("Espera p95", f"{estado['espera_p95']:.1f} s")
+    st.caption(
+        f"{estado['atendidas']} consultas · {estado['fusionadas']} repetidas aprovechadas · "
+        f"{len(estado['por_usuario'])} sesiones esperando"
+    )
+    if estado["espera_mas_vieja"]:
+        st.caption(f"La consulta más antigua en cola lleva {estado['espera_mas_vieja']:.0f} s.")
+    st.caption(texto_regulador(estado["regulador"]))
+    if texto_navegador(estado["navegador"]):
+        st.caption(texto_navegador(estado["navegador"]))
 
-    if not precios_limpios:
-        precios_limpios = precios_brutos
+def panel_broker():
+    with st.sidebar.expander("🌐 Navegador compartido"):
+        estado_broker()
 
-    cantidad = len(precios_limpios)
-    mediana_final = int(statistics.median(precios_limpios))
-    precio_daytona = int(mediana_final * 0.95)
-    min_mercado = min(precios_limpios)
-    max_mercado = max(precios_limpios)
+# -------------------------
+# TIEMPOS POR ETAPA
+# -------------------------
+def panel_trazas():
+    rutas = archivos_trazas()
+    if not rutas:
+        return
+    with st.sidebar.expander("⏱️ Tiempos por etapa"):
+        ruta = st.selectbox("Escaneo", rutas, format_func=os.path.basename)
+        resumen = resumir_trazas(leer_trazas(ruta))
+        if not resumen["consultas"]:
+            st.caption("Sin consultas registradas.")
+            return
+
+        st.write(
+            f"{resumen['consultas']} consultas · {resumen['vehiculos']} autos · "
+            f"{resumen['tasa_error']:.0%} con error"
+        )
+        if resumen["duracion_ms"]:
+            st.caption(f"Duración total: {resumen['duracion_ms'] / 1000:,.1f} s")
+
+        st.markdown("**Proporción del tiempo**")
+        st.bar_chart(pd.Series(resumen["proporcion_etapas"], name="proporción"))
+
+        st.markdown("**Más lentos**")
+        st.dataframe(
+            pd.DataFrame([
+                {
+                    "Auto": f"{r.get('marca', '')} {r.get('modelo', '')} {r.get('anio', '')}",
+                    "Fuente": r.get("fuente", ""),
+                    "Estado": r.get("estado", ""),
+                    "Total (s)": round(r["total_ms"] / 1000, 2),
+                    "Etapa principal": max(r["etapas"], key=r["etapas"].get) if r["etapas"] else "",
+                }
+                for r in resumen["mas_lentos"]
+            ]),
+            hide_index=True,
+        )
 
-    return precio_daytona, cantidad, "Exitoso", url, min_mercado, max_mercado
+# -------------------------
+# INVENTARIO SUBIDO
+# -------------------------
+# Cada cambio de sucursal o casilla vuelve a correr el script: el archivo se lee, se prepara y se
+# indexa por sucursal una sola vez por contenido (``huella``); ``_contenido`` no se vuelve a hashear.
+@st.cache_data(max_entries=4, show_spinner="Leyendo inventario...")
+def inventario_subido(huella, _contenido, nombre):
+    df, cols = cargar_inventario(_contenido, nombre)
+    prep = preparar_inventario(df, cols) if cols["version"] else None
+    posiciones = {}
+    if cols["sucursal"]:
+        sucursales = df[cols["sucursal"]].astype(str).to_numpy()
+        posiciones = {s: np.flatnonzero(sucursales == s) for s in sorted(set(sucursales))}
+    return df, cols, prep, posiciones
 
 # ----------------------------------------------------
 # CARGA AUTOPRECIOS DESDE EXCEL
 # ----------------------------------------------------
-ruta_autoprecios = os.path.join(os.getcwd(), "autoprecios_lobato_catalogo.xls")
+ruta_autoprecios = RUTA_AUTOPRECIOS
 
 df_autoprecios = None
 if os.path.exists(ruta_autoprecios):
     try:
-        df_autoprecios = pd.read_excel(
-            ruta_autoprecios,
-            sheet_name="AUTOPRECIOS"
-        )
-        df_autoprecios.columns = df_autoprecios.columns.str.strip()
-        df_autoprecios.columns = df_autoprecios.columns.str.upper()
+        df_autoprecios = cargar_catalogo(ruta_autoprecios)
     except Exception as e:
         st.sidebar.error(f"Error cargando AUTOPRECIOS ({ruta_autoprecios}): {str(e)[:80]}")
 else:
@@ -163,10 +371,26 @@ with st.sidebar:
 
     modo = st.radio(
         "Selecciona modo:",
-        ["Analizar inventario", "Cotizar compra"],
+        ["Analizar inventario", "Cotizar compra", "Tendencias"],
         index=0
     )
 
+# Historial en SQLite; el CSV de versiones anteriores se importa una sola vez.
+try:
+    historial = HistorialPrecios()
+except ErrorEsquemaHistorial as e:
+    historial = None
+    st.sidebar.error(f"Historial no disponible: {e}")
+
+if historial is not None and historial.csv_pendiente():
+    st.sidebar.info(f"Hay un historial anterior en {ARCHIVO_CSV_HISTORIAL} sin importar.")
+    if st.sidebar.button("Importar historial CSV"):
+        filas, descartadas = historial.importar_csv() or (0, 0)
+        st.sidebar.success(f"Importadas {filas} filas ({descartadas} líneas descartadas).")
+
+panel_broker()
+panel_trazas()
+
 st.sidebar.markdown("---")
 st.sidebar.caption("2026 Grupo Daytona. Confidencial y exclusivo. Todos los derechos reservados.")
 
@@ -177,55 +401,26 @@ if modo == "Analizar inventario":
     archivo = st.file_uploader("Carga Inventario Maestro Excel", type="xlsx")
 
     if archivo:
-        df = pd.read_excel(archivo)
-        df.columns = df.columns.str.strip()
-
-        csubmarca = next((c for c in df.columns if "submarca" in c.lower()), None)
-        cmodelolbl = next((c for c in df.columns if "modelo" in c.lower()), None)
-        colnombreauto = csubmarca if csubmarca else cmodelolbl
-
-        caniolbl = next(
-            (c for c in df.columns if any(x in c.lower() for x in ["año", "year", "anho"])),
-            None,
-        )
-        colanionum = cmodelolbl if (csubmarca and cmodelolbl) else caniolbl
-
-        colversion = next(
-            (c for c in df.columns if "versión" in c.lower() or "version" in c.lower()),
-            None,
-        )
-        colprecio = next(
-            (c for c in df.columns if "precio" in c.lower() or "venta" in c.lower()),
-            None,
-        )
-        colcosto = next(
-            (c for c in df.columns if any(x in c.lower() for x in ["costo", "compra", "inversion", "libro"])),
-            None,
-        )
-        colsucursal = next(
-            (c for c in df.columns if any(x in c.lower() for x in ["sucursal", "ubicacion", "agencia"])),
-            None,
-        )
-        colid = next(
-            (c for c in df.columns if any(x in c.lower() for x in ["id", "sku", "articulo"])),
-            None,
-        )
-        coldias = next(
-            (c for c in df.columns if any(x in c.lower() for x in ["dias", "days", "antiguedad", "stock", "inventario"])),
-            None,
-        )
+        contenido = archivo.getvalue()
+        huella = hash_inventario(contenido)
+        df, cols, prep_total, posiciones_sucursal = inventario_subido(huella, contenido, archivo.name)
+        colversion = cols["version"]
+        colsucursal = cols["sucursal"]
 
         if not colversion:
             st.error("Falta columna Versión.")
         else:
-            dffiltrado = df.copy()
+            dffiltrado = df
+            prep_filtrado = prep_total
             nombre_reporte = "General"
+            seleccion = "Todas"
 
             if colsucursal:
-                lista_sucursales = ["Todas"] + sorted(list(df[colsucursal].astype(str).unique()))
+                lista_sucursales = ["Todas"] + list(posiciones_sucursal)
                 seleccion = st.sidebar.selectbox("Filtrar Sucursal", lista_sucursales)
                 if seleccion != "Todas":
-                    dffiltrado = df[df[colsucursal] == seleccion]
+                    dffiltrado = df.iloc[posiciones_sucursal[seleccion]]
+                    prep_filtrado = prep_total.iloc[posiciones_sucursal[seleccion]]
                     nombre_reporte = seleccion
                     st.info(f"Reporte para {seleccion}")
                 else:
@@ -234,189 +429,257 @@ if modo == "Analizar inventario":
                 st.info("Reporte Consolidado")
 
             modoprueba = st.sidebar.checkbox("Modo Prueba 3 autos", value=True)
+            compartido = st.sidebar.checkbox(
+                "Usar navegador compartido",
+                value=True,
+                help="El escaneo en pantalla se forma en la cola del navegador del servidor, por turnos con "
+                "las demás sesiones. Navegador, consultas simultáneas, ritmo y procesos de abajo aplican "
+                "solo a los escaneos sin compartir y a la cola en segundo plano.",
+            )
             vernavegador = st.sidebar.checkbox("Ver navegador", value=True)
+            modo_consulta = st.sidebar.selectbox(
+                "Modo de consulta",
+                MODOS_CONSULTA,
+                format_func=lambda m: {"http": "Rápido (HTTP, navegador de respaldo)", "navegador": "Solo navegador"}[m],
+            )
+            concurrencia = st.sidebar.slider(
+                "Consultas simultáneas",
+                min_value=1,
+                max_value=MAX_PESTANAS,
+                value=1,
+                help="1 = un auto a la vez. Con más, se abren varias pestañas del mismo navegador.",
+            )
+            tasa_consultas = st.sidebar.number_input(
+                "Consultas por segundo (inicial)",
+                min_value=0.1,
+                max_value=5.0,
+                value=1.0,
+                step=0.1,
+                help="Sube sola mientras MercadoLibre responde bien y baja ante lentitud o bloqueos.",
+            )
+            procesos = st.sidebar.slider(
+                "Procesos",
+                min_value=1,
+                max_value=max(1, min(os.cpu_count() or 1, MAX_NAVEGADORES)),
+                value=1,
+                help="Reparte el inventario entre varios navegadores, cada uno con una copia de la sesión. "
+                "Las consultas por segundo se dividen entre ellos. Si el servidor ya tiene abiertos "
+                f"{MAX_NAVEGADORES} navegadores, cada uno espera su turno.",
+            )
+            repartir_por = st.sidebar.selectbox(
+                "Repartir por",
+                ("consulta", "sucursal"),
+                format_func=lambda r: {"consulta": "Búsqueda (sin repetir)", "sucursal": "Sucursal"}[r],
+                disabled=procesos <= 1,
+            )
+            objetivo_comparables = st.sidebar.number_input(
+                "Comparables objetivo por auto",
+                min_value=10,
+                max_value=300,
+                value=OBJETIVO_COMPARABLES,
+                step=10,
+                help="Se recorren páginas de resultados hasta juntar esta cantidad de precios.",
+            )
+            max_paginas = st.sidebar.number_input(
+                "Máx. páginas de resultados",
+                min_value=1,
+                max_value=10,
+                value=MAX_PAGINAS,
+            )
+            tipos_bloqueados = st.sidebar.multiselect(
+                "Bloquear en navegador",
+                TIPOS_RECURSO,
+                default=list(TIPOS_BLOQUEADOS),
+            )
+            bloquear_terceros = st.sidebar.checkbox("Bloquear rastreadores y terceros", value=True)
+            usar_cache = st.sidebar.checkbox("Usar caché de precios", value=True)
+            vigencia_cache = st.sidebar.number_input(
+                "Vigencia caché (horas)",
+                min_value=1,
+                max_value=24 * 14,
+                value=TTL_HORAS,
+                disabled=not usar_cache,
+            )
+            cruzar_catalogo = st.sidebar.checkbox(
+                "Agregar precios AUTOPRECIOS",
+                value=df_autoprecios is not None,
+                disabled=df_autoprecios is None,
+                help="Cada auto del reporte lleva los precios de catálogo de su versión.",
+            )
+            registrar_trazas = st.sidebar.checkbox(
+                "Registrar tiempos por etapa",
+                value=False,
+                help="Anota cuánto tarda cada consulta en navegador, red, extracción, pausas, etc.",
+            )
             st.sidebar.markdown("---")
 
-            if st.button("INICIAR ESCANEO FINAL"):
-                data = dffiltrado.head(3).copy() if modoprueba else dffiltrado.copy()
-                barra = st.progress(0)
-                res = []
+            # Avance guardado de una corrida anterior del mismo archivo.
+            bitacora = BitacoraEscaneo(huella)
+            reanudar = True
+            reintentar_fallidos = False
+            if len(bitacora):
+                st.warning(
+                    f"Este inventario ya tiene {len(bitacora)} autos analizados "
+                    f"({bitacora.fallidos} con error o sin resultados)."
+                )
+                col_reanudar, col_fallidos, col_descartar = st.columns(3)
+                reanudar = col_reanudar.checkbox("Reanudar donde se quedó", value=True)
+                reintentar_fallidos = col_fallidos.checkbox(
+                    "Reintentar solo fallidos",
+                    value=False,
+                    disabled=not reanudar,
+                    help="Vuelve a consultar los autos con 'Error...' o '0 Resultados' y conserva los demás.",
+                )
+                if col_descartar.button("Descartar avance"):
+                    bitacora.borrar()
+                    st.rerun()
+
+            opciones = {
+                "ver_navegador": vernavegador,
+                "modo_consulta": modo_consulta,
+                "concurrencia": concurrencia,
+                "tasa": tasa_consultas,
+                "procesos": procesos,
+                "repartir_por": repartir_por,
+                "objetivo_comparables": objetivo_comparables,
+                "max_paginas": max_paginas,
+                "tipos_bloqueados": tipos_bloqueados,
+                "bloquear_terceros": bloquear_terceros,
+                "usar_cache": usar_cache,
+                "vigencia_cache": vigencia_cache,
+                "reanudar": reanudar,
+                "reintentar_fallidos": reintentar_fallidos,
+                "trazas": registrar_trazas,
+                "cruzar_catalogo": cruzar_catalogo,
+            }
+
+            resumen = resumen_consultas(prep_filtrado.head(FILAS_PRUEBA) if modoprueba else prep_filtrado)
+            detalle = ""
+            if resumen["error_anio"] or resumen["incompletos"]:
+                detalle = f" ({resumen['error_anio']} con año inválido, {resumen['incompletos']} con datos incompletos)"
+            st.caption(
+                f"{resumen['vehiculos']} autos → {resumen['consultas']} búsquedas distintas en MercadoLibre{detalle}."
+            )
 
-                for idx, (_, row) in enumerate(data.iterrows()):
-                    progreso = (idx + 1) / len(data)
-                    if progreso > 1.0:
-                        progreso = 1.0
-                    barra.progress(progreso)
+            col_escanear, col_cola = st.columns(2)
+            iniciar = col_escanear.button("INICIAR ESCANEO FINAL")
+            por_sucursal = False
+            if colsucursal and seleccion == "Todas":
+                por_sucursal = col_cola.checkbox("Un trabajo por sucursal", value=False)
+            enviar_cola = col_cola.button("ENVIAR A COLA (segundo plano)")
 
-                    marca = row.get("Marca", "")
-                    modelo = row.get(colnombreauto, "")
-                    version = row.get(colversion, "")
+            if enviar_cola:
+                if por_sucursal:
+                    sucursales = lista_sucursales[1:]
+                else:
+                    sucursales = [None if seleccion == "Todas" else seleccion]
+                for suc in sucursales:
+                    # Sin ventana: el trabajo corre en un proceso del servidor, no en la pantalla de nadie.
+                    trabajos.encolar(
+                        contenido,
+                        f"{archivo.name} · {suc or 'General'}",
+                        suc,
+                        modoprueba,
+                        {**opciones, "ver_navegador": False},
+                    )
+                trabajos.asegurar_trabajador()
+                st.success(f"✅ {len(sucursales)} trabajo(s) en cola. Puedes cambiar de pantalla sin perder el escaneo.")
 
-                    raw_anio = row.get(colanionum, None)
-                    anio_limpio = ""
-                    anio_valido = False
-                    try:
-                        if pd.notna(raw_anio):
-                            anio_limpio = str(int(float(raw_anio)))
-                            if len(anio_limpio) == 4 and anio_limpio.isdigit():
-                                anio_valido = True
-                    except:
-                        pass
-
-                    if colprecio and isinstance(row[colprecio], (int, float)):
-                        precio_act = row[colprecio]
-                    else:
-                        precio_act = 0
-
-                    if colcosto and isinstance(row[colcosto], (int, float)):
-                        costo_libro = row[colcosto]
-                    else:
-                        costo_libro = 0
-
-                    val_id = row[colid] if colid else ""
-                    val_sucursal = row[colsucursal] if colsucursal else ""
-
-                    semaforo, dias_stock = ("", 0)
-                    if coldias:
-                        semaforo, dias_stock = obtener_semaforo_por_dias(row[coldias])
-
-                    if not anio_valido:
-                        res.append({
-                            "ID": val_id,
-                            "Sucursal": val_sucursal,
-                            "S": semaforo,
-                            "Diagnóstico": "❌ ERROR AÑO",
-                            "Stock": dias_stock,
-                            "Auto": f"{marca} {modelo}",
-                            "Versión": version,
-                            "Año": anio_limpio,
-                            "Comp.": 0,
-                            "Costo Real": costo_libro,
-                            "Compra Sugerida": 0,
-                            "Actual Venta": precio_act,
-                            "Sugerido Venta": 0,
-                            "Mínimo (Piso)": 0,
-                            "Utilidad": 0,
-                            "Link": "",
-                            "Fecha": time.strftime('%Y-%m-%d')
-                        })
-                        continue
-
-                    sugerido, num, estado, url_link, min_mercado, max_mercado = analizar_vehiculo(
-                        marca,
-                        modelo,
-                        anio_limpio,
-                        vernavegador
+            if iniciar:
+                data = dffiltrado.head(FILAS_PRUEBA).copy() if modoprueba else dffiltrado.copy()
+                # El inventario ya preparado (en caché con el archivo) de esas mismas filas.
+                prep_escaneo = prep_filtrado.head(FILAS_PRUEBA) if modoprueba else prep_filtrado
+                barra = st.progress(0)
+                aviso_vivo = st.empty()
+                tabla_vivo = st.empty()
+                aviso_circuito = st.empty()
+                parciales = []
+                ultimo_dibujo = 0.0
+
+                def al_abrir(estado):
+                    aviso_circuito.warning(
+                        f"⏸ Demasiados errores de MercadoLibre: el escaneo se pausa {estado['pausa_restante']:.0f} s "
+                        "y sigue solo."
                     )
 
-                    utilidad_esperada = 0
-                    if sugerido and costo_libro:
-                        utilidad_esperada = sugerido - costo_libro
-
-                    if sugerido > 0:
-                        compra_sugerida = int(sugerido * 0.88)
-                    else:
-                        compra_sugerida = 0
-
-                    diagnostico = "OK"
-                    if dias_stock > 90:
-                        diagnostico = "🧊 CONGELADO"
-                    elif costo_libro > 0 and sugerido > 0 and sugerido < costo_libro:
-                        diagnostico = "⚠️ PÉRDIDA"
-                    elif sugerido > precio_act and dias_stock < 30:
-                        diagnostico = "💰 OPORTUNIDAD"
-
-                    res.append({
-                        "ID": val_id,
-                        "Sucursal": val_sucursal,
-                        "S": semaforo,
-                        "Diagnóstico": diagnostico,
-                        "Stock": dias_stock,
-                        "Auto": f"{marca} {modelo}",
-                        "Versión": version,
-                        "Año": anio_limpio,
-                        "Comp.": num,
-                        "Costo Real": costo_libro,
-                        "Compra Sugerida": compra_sugerida,
-                        "Actual Venta": precio_act,
-                        "Sugerido Venta": sugerido,
-                        "Mínimo (Piso)": min_mercado,
-                        "Utilidad": utilidad_esperada,
-                        "Link": url_link,
-                        "Fecha": time.strftime('%Y-%m-%d')
-                    })
-                    time.sleep(1.5)
+                broker = broker_consultas() if compartido else None
+                if broker is not None:
+                    regulador = broker.regulador
+                else:
+                    regulador = ReguladorTasa(tasa_consultas, al_abrir=al_abrir)
+
+                def al_avanzar(hechos, total):
+                    estado = regulador.estado()
+                    if estado["circuito"] == "abierto" and broker is not None:
+                        al_abrir(estado)
+                    elif estado["circuito"] != "abierto":
+                        aviso_circuito.empty()
+                    texto = f"{hechos}/{total} autos"
+                    if broker is not None:
+                        texto += f" · {broker.estado()['en_cola']} en cola del servidor · {texto_regulador(estado)}"
+                    elif procesos <= 1:
+                        texto += f" · {texto_regulador(estado)}"
+                    barra.progress(min(hechos / total, 1.0), text=texto)
+
+                def al_resultados(posiciones, filas):
+                    # Se redibuja a lo más una vez por segundo; el resto solo se acumula.
+                    global ultimo_dibujo
+                    parciales.append(filas)
+                    ahora = time.monotonic()
+                    if ahora - ultimo_dibujo < 1 and sum(len(p) for p in parciales) < len(data):
+                        return
+                    ultimo_dibujo = ahora
+                    vivo = pd.concat(parciales, ignore_index=True)
+                    if len(vivo) > FILAS_EN_VIVO:
+                        aviso_vivo.caption(f"Mostrando los últimos {FILAS_EN_VIVO} de {len(vivo)} autos terminados.")
+                        vivo = vivo.tail(FILAS_EN_VIVO)
+                    tabla_reporte(vivo, tabla_vivo)
+
+                res, info = ejecutar_escaneo(
+                    data,
+                    cols,
+                    opciones,
+                    al_avanzar=al_avanzar,
+                    bitacora=bitacora if reanudar else None,
+                    al_resultados=al_resultados,
+                    regulador=regulador,
+                    broker=broker,
+                    usuario=usuario_sesion(),
+                    prep=prep_escaneo,
+                )
+                aviso_vivo.empty()
+                tabla_vivo.empty()
+                aviso_circuito.empty()
 
                 st.success("✅ Análisis Finalizado")
                 df_r = pd.DataFrame(res)
 
                 if not modoprueba:
-                    archivo_historial = "historial_master_daytona.csv"
                     try:
-                        cols_guardar = [c for c in df_r.columns if c not in ['Link', 'S', 'Diagnóstico']]
-                        if os.path.exists(archivo_historial):
-                            df_r[cols_guardar].to_csv(archivo_historial, mode='a', header=False, index=False)
-                        else:
-                            df_r[cols_guardar].to_csv(archivo_historial, index=False)
-                    except:
-                        pass
-
-                st.header(f"Resumen Ejecutivo: {nombre_reporte}")
-                total_inventario = df_r['Costo Real'].sum()
-                total_utilidad = df_r['Utilidad'].sum()
-
-                col1, col2, col3 = st.columns(3)
-                col1.metric("Valor Inventario", f"${total_inventario:,.0f}")
-                col2.metric("Utilidad Potencial", f"${total_utilidad:,.0f}")
-
-                format_dict = {
-                    "Costo Real": "${:,.0f}",
-                    "Compra Sugerida": "${:,.0f}",
-                    "Actual Venta": "${:,.0f}",
-                    "Sugerido Venta": "${:,.0f}",
-                    "Mínimo (Piso)": "${:,.0f}",
-                    "Utilidad": "${:,.0f}"
-                }
+                        guardar_historial(df_r, historial)
+                    except Exception as e:
+                        st.error(f"El reporte no se pudo guardar en el historial: {e}")
 
-                def estilos_financieros(val):
-                    if not isinstance(val, (int, float)):
-                        return ''
-                    if val < 0:
-                        return 'color: red; font-weight: bold'
-                    if val > 0:
-                        return 'color: green; font-weight: bold'
-                    return ''
-
-                cols_visual = [c for c in df_r.columns if c not in ['Fecha']]
-
-                st.dataframe(
-                    df_r[cols_visual].style.format(format_dict).applymap(estilos_financieros, subset=['Utilidad']),
-                    column_config={
-                        "Link": st.column_config.LinkColumn("URL"),
-                        "S": st.column_config.Column("S", width="small"),
-                        "Comp.": st.column_config.NumberColumn(help="Autos similares en mercado"),
-                        "Compra Sugerida": st.column_config.NumberColumn(help="Precio máx compra (12% margen)"),
-                        "Costo Real": st.column_config.NumberColumn(help="Costo original de libro")
-                    },
-                    hide_index=True,
-                    use_container_width=True
-                )
+                # Queda en la sesión para que cambiar de página o de filtro no pierda el reporte.
+                st.session_state["reporte"] = {"df": df_r, "nombre": nombre_reporte, "info": info, "archivo": archivo.name}
 
-                st.markdown(
-                    "<div class='footer-text'>2026 Grupo Daytona · Información confidencial · Generado por Daytona Intelligence</div>",
-                    unsafe_allow_html=True
-                )
-                st.markdown("---")
+            reporte = st.session_state.get("reporte")
+            if reporte is not None and reporte["archivo"] == archivo.name:
+                mostrar_reporte(reporte["df"], reporte["nombre"], reporte["info"])
 
-                nombre_csv = f"Daytona_Reporte_{nombre_reporte}_{time.strftime('%Y%m%d')}.csv"
-                csv = df_r.to_csv(index=False).encode('utf-8')
-                st.download_button("📥 Descargar Reporte CSV", csv, nombre_csv, "text/csv")
+    panel_trabajos()
 
 # =====================================================
 # MODO 2: COTIZAR COMPRA (USANDO AUTOPRECIOS)
 # =====================================================
 if modo == "Cotizar compra":
     st.header("Cotizar Compra Seminuevos (por catálogo Autoprecios)")
+    precarga = leer_estado()
+    if precarga:
+        partes = [f"Última precarga de mercado: {precarga['fecha']}", f"{precarga['exitosas']} modelos con precios"]
+        if precarga["pendientes"]:
+            partes.append(f"{precarga['pendientes']} pendientes")
+        st.caption(" · ".join(partes))
 
     if df_autoprecios is None:
         st.error("No se pudo cargar AUTOPRECIOS. Verifica el archivo autoprecios_lobato_catalogo.xls y recarga la app.")
@@ -432,55 +695,29 @@ if modo == "Cotizar compra":
                 st.error(f"Falta la columna '{col}' en AUTOPRECIOS.")
                 st.stop()
 
-        # 1) Marca
-        marcas = sorted(df_autoprecios["MARCA"].dropna().astype(str).unique())
-        marca_sel = st.selectbox("Marca", ["(elige una)"] + marcas)
+        indice = indice_catalogo(ruta_autoprecios)
 
-        df_marca = df_autoprecios.copy()
-        if marca_sel != "(elige una)":
-            df_marca = df_marca[df_marca["MARCA"] == marca_sel]
+        def elegido(valor, vacio):
+            return TODAS if valor == vacio else valor
 
-        # 2) Submarca / Modelo
-        submarcas = sorted(df_marca["SUBMARCA"].dropna().astype(str).unique())
-        submarca_sel = st.selectbox("Submarca / Modelo", ["(elige una)"] + submarcas)
+        # 1) Marca
+        marca_sel = st.selectbox("Marca", ["(elige una)"] + indice.marcas())
+        marca_key = elegido(marca_sel, "(elige una)")
 
-        df_submarca = df_marca.copy()
-        if submarca_sel != "(elige una)":
-            df_submarca = df_submarca[df_submarca["SUBMARCA"] == submarca_sel]
+        # 2) Submarca / Modelo
+        submarca_sel = st.selectbox("Submarca / Modelo", ["(elige una)"] + indice.submarcas(marca_key))
+        submarca_key = elegido(submarca_sel, "(elige una)")
 
         # 3) Año / Modelo (filtra por Marca + Submarca)
-        anios_raw = df_submarca["AÑO/MODELO"].dropna().unique()
-        anios = []
-        for a in anios_raw:
-            try:
-                val = str(int(float(a)))
-                if len(val) == 4:
-                    anios.append(val)
-            except:
-                pass
-        anios = sorted(list(set(anios)))
-        anio_sel = st.selectbox("Año / Modelo", ["(elige uno)"] + anios)
-
-        df_anio = df_submarca.copy()
-        if anio_sel != "(elige uno)":
-            def normalizar_anio(x):
-                try:
-                    if pd.notna(x):
-                        return str(int(float(x)))
-                except:
-                    return ""
-                return ""
-
-            df_anio = df_anio.copy()
-            df_anio["ANIO_STR"] = df_anio["AÑO/MODELO"].apply(normalizar_anio)
-            df_anio = df_anio[df_anio["ANIO_STR"] == anio_sel]
+        anio_sel = st.selectbox("Año / Modelo", ["(elige uno)"] + indice.anios(marca_key, submarca_key))
+        anio_key = elegido(anio_sel, "(elige uno)")
 
         # 4) Versión (solo las de ese año)
-        versiones = sorted(df_anio["VERSIÓN"].dropna().astype(str).unique()) if not df_anio.empty else []
+        versiones = indice.versiones(marca_key, submarca_key, anio_key)
         version_sel = st.selectbox("Versión", ["(elige una)"] + versiones)
 
-        ver_navegador = st.checkbox("Ver navegador (MercadoLibre)", value=True)
-
+        # La cotización queda en la sesión para que "Actualizar ahora" (otro botón) no la borre.
+        seleccion_cotizar = (marca_sel, submarca_sel, anio_sel, version_sel)
         if st.button("COTIZAR ESTA CONFIGURACIÓN"):
             if (
                 marca_sel == "(elige una)"
@@ -490,93 +727,186 @@ if modo == "Cotizar compra":
             ):
                 st.warning("Completa Marca, Submarca, Año y Versión para cotizar.")
             else:
-                # 1) Fila exacta de AUTOPRECIOS
-                df_match = df_autoprecios.copy()
+                st.session_state["cotizacion"] = seleccion_cotizar
 
-                def normalizar_anio(x):
-                    try:
-                        if pd.notna(x):
-                            return str(int(float(x)))
-                    except:
-                        return ""
-                    return ""
-
-                df_match["ANIO_STR"] = df_match["AÑO/MODELO"].apply(normalizar_anio)
-
-                df_match = df_match[
-                    (df_match["MARCA"] == marca_sel) &
-                    (df_match["SUBMARCA"] == submarca_sel) &
-                    (df_match["VERSIÓN"] == version_sel) &
-                    (df_match["ANIO_STR"] == anio_sel)
-                ]
-
-                if df_match.empty:
-                    st.error("No encontré en AUTOPRECIOS una fila que coincida exactamente con Marca/Submarca/Año/Versión seleccionados.")
-                    st.stop()
-
-                fila = df_match.iloc[0]
-
-                id_auto = fila.get("ID", "")
-                precio_venta_cat = fila.get("PRECIO VENTA", 0)
-                precio_compra_cat = fila.get("PRECIO COMPRA", 0)
-                precio_lista_nuevo = fila.get("PRECIO_DE_LISTA_NUEVO", 0)
-                precio_intermedio = fila.get("PRECIO INTERMEDIO", 0)
-                precio_ag_cert = fila.get("PRECIO AGENCIA CERTIFICADOS", 0)
-
-                # 2) Robot ML
-                sugerido, num, estado, url, min_mercado, max_mercado = analizar_vehiculo(
-                    marca_sel,
-                    submarca_sel,
-                    anio_sel,
-                    ver_navegador
-                )
+        if st.session_state.get("cotizacion") == seleccion_cotizar:
+            # 1) Fila exacta de AUTOPRECIOS
+            fila = indice.fila(marca_sel, submarca_sel, anio_sel, version_sel)
 
-                if sugerido == 0 and num == 0:
-                    st.error(f"No se pudieron obtener precios del mercado. Estado: {estado}")
-                    if url:
-                        st.write("Link usado para la búsqueda:", url)
-                else:
-                    compra_sugerida = int(sugerido * 0.88) if sugerido > 0 else 0
-                    utilidad_vs_compra_cat = sugerido - precio_compra_cat if (sugerido and precio_compra_cat) else 0
-
-                    st.subheader("Configuración seleccionada")
-                    st.write(f"**ID Autoprecios**: {id_auto}")
-                    st.write(f"**Marca**: {marca_sel}")
-                    st.write(f"**Submarca / Modelo**: {submarca_sel}")
-                    st.write(f"**Año / Modelo**: {anio_sel}")
-                    st.write(f"**Versión**: {version_sel}")
+            if fila is None:
+                st.error("No encontré en AUTOPRECIOS una fila que coincida exactamente con Marca/Submarca/Año/Versión seleccionados.")
+                st.stop()
 
-                    st.write("---")
-                    st.subheader("Valores de catálogo AUTOPRECIOS")
-                    st.write(f"**Precio lista nuevo**: {precio_lista_nuevo:,.0f} MXN")
-                    st.write(f"**Precio catálogo venta**: {precio_venta_cat:,.0f} MXN")
-                    st.write(f"**Precio catálogo compra**: {precio_compra_cat:,.0f} MXN")
-                    st.write(f"**Precio intermedio**: {precio_intermedio:,.0f} MXN")
-                    st.write(f"**Precio agencia certificados**: {precio_ag_cert:,.0f} MXN")
+            id_auto = fila.get("ID", "")
+            precio_venta_cat = fila.get("PRECIO VENTA", 0)
+            precio_compra_cat = fila.get("PRECIO COMPRA", 0)
+            precio_lista_nuevo = fila.get("PRECIO_DE_LISTA_NUEVO", 0)
+            precio_intermedio = fila.get("PRECIO INTERMEDIO", 0)
+            precio_ag_cert = fila.get("PRECIO AGENCIA CERTIFICADOS", 0)
+
+            # 2) Mercado: lo precargado (aunque sea viejo) responde al instante; si no hay, o si se
+            # pide actualizar, se consulta en vivo y queda guardado para la siguiente vez.
+            actualizar = st.button("🔄 Actualizar ahora", help="Consulta MercadoLibre en este momento.")
+            url_busqueda, _ = preparar_consulta(marca_sel, submarca_sel, anio_sel)
+            cache = CacheMercado()
+            guardado = None if (actualizar or not url_busqueda) else cache.obtener(url_busqueda, ignorar_ttl=True)
+            if guardado:
+                sugerido, num, estado, url, min_mercado, max_mercado, _ = resultado_desde_estadisticas(guardado, url_busqueda)
+                edad = time.time() - guardado["creado"]
+            else:
+                # Por el navegador compartido: si otra sesión ya pidió este auto, se espera su misma consulta.
+                broker = broker_consultas()
+                with st.spinner("Consultando MercadoLibre..."):
+                    consulta = broker.consultar(marca_sel, submarca_sel, anio_sel, usuario_sesion())
+                    try:
+                        sugerido, num, estado, url, min_mercado, max_mercado, _ = consulta.result(timeout=ESPERA_COTIZACION)
+                    except concurrent.futures.TimeoutError:
+                        broker.cancelar(usuario_sesion())
+                        st.error(
+                            f"MercadoLibre no respondió en {ESPERA_COTIZACION} s (el navegador compartido está "
+                            "ocupado o detenido). Intenta de nuevo en unos minutos."
+                        )
+                        st.stop()
+                    except Exception as e:
+                        st.error(f"No se pudo consultar MercadoLibre: {e}")
+                        st.stop()
+                edad = None
+
+            if sugerido == 0 and num == 0:
+                st.error(f"No se pudieron obtener precios del mercado. Estado: {estado}")
+                if url:
+                    st.write("Link usado para la búsqueda:", url)
+            else:
+                compra_sugerida = int(sugerido * 0.88) if sugerido > 0 else 0
+                utilidad_vs_compra_cat = sugerido - precio_compra_cat if (sugerido and precio_compra_cat) else 0
+
+                st.subheader("Configuración seleccionada")
+                st.write(f"**ID Autoprecios**: {id_auto}")
+                st.write(f"**Marca**: {marca_sel}")
+                st.write(f"**Submarca / Modelo**: {submarca_sel}")
+                st.write(f"**Año / Modelo**: {anio_sel}")
+                st.write(f"**Versión**: {version_sel}")
+
+                st.write("---")
+                st.subheader("Valores de catálogo AUTOPRECIOS")
+                st.write(f"**Precio lista nuevo**: {precio_lista_nuevo:,.0f} MXN")
+                st.write(f"**Precio catálogo venta**: {precio_venta_cat:,.0f} MXN")
+                st.write(f"**Precio catálogo compra**: {precio_compra_cat:,.0f} MXN")
+                st.write(f"**Precio intermedio**: {precio_intermedio:,.0f} MXN")
+                st.write(f"**Precio agencia certificados**: {precio_ag_cert:,.0f} MXN")
+
+                st.write("---")
+                st.subheader("Resultados MercadoLibre (Robot Daytona)")
+                st.write(f"**Autos comparables encontrados**: {num}")
+                if edad is None:
+                    st.caption("Consultado en vivo en este momento.")
+                elif edad > TTL_HORAS * 3600:
+                    st.warning(f"Datos de mercado de hace {texto_antiguedad(edad)}; conviene actualizarlos.")
+                else:
+                    st.caption(f"Datos de mercado de hace {texto_antiguedad(edad)}.")
+                st.write(f"**Rango de mercado**: {min_mercado:,.0f} - {max_mercado:,.0f} MXN")
+                if url:
+                    st.write("Link usado para la búsqueda:", url)
+
+                st.write("---")
+                st.subheader("Precios sugeridos Daytona")
+
+                col_a, col_b = st.columns(2)
+                col_a.metric(
+                    "Precio sugerido Daytona (venta)",
+                    f"{sugerido:,.0f} MXN"
+                )
+                col_b.metric(
+                    "Compra sugerida (≈12% margen)",
+                    f"{compra_sugerida:,.0f} MXN"
+                )
 
-                    st.write("---")
-                    st.subheader("Resultados MercadoLibre (Robot Daytona)")
-                    st.write(f"**Autos comparables encontrados**: {num}")
-                    st.write(f"**Rango de mercado**: {min_mercado:,.0f} - {max_mercado:,.0f} MXN")
-                    if url:
-                        st.write("Link usado para la búsqueda:", url)
+                st.write("---")
+                st.subheader("Análisis rápido")
+                st.write(
+                    f"**Utilidad vs PRECIO COMPRA de Autoprecios** "
+                    f"si vendes al sugerido Daytona: {utilidad_vs_compra_cat:,.0f} MXN"
+                )
 
+            if historial is not None:
+                df_hist = historial.historial_modelo(f"{marca_sel} {submarca_sel}", anio_sel, dias=90)
+                if not df_hist.empty:
                     st.write("---")
-                    st.subheader("Precios sugeridos Daytona")
+                    st.subheader("Historial de mercado (últimos 90 días)")
+                    st.line_chart(df_hist.groupby("Fecha")[["Sugerido Venta", "Mínimo (Piso)"]].median())
+                    st.caption(f"{len(df_hist)} registros de escaneos de inventario.")
 
-                    col_a, col_b = st.columns(2)
-                    col_a.metric(
-                        "Precio sugerido Daytona (venta)",
-                        f"{sugerido:,.0f} MXN"
-                    )
-                    col_b.metric(
-                        "Compra sugerida (≈12% margen)",
-                        f"{compra_sugerida:,.0f} MXN"
-                    )
+# =====================================================
+# MODO 3: TENDENCIAS (RESÚMENES DEL HISTORIAL)
+# =====================================================
+# Todo sale de los resúmenes que se actualizan al guardar cada escaneo, no del historial completo.
+if modo == "Tendencias":
+    st.header("Tendencias del historial")
+
+    if historial is None:
+        st.error("El historial no está disponible.")
+        st.stop()
+
+    dias_atras = st.slider("Días hacia atrás", min_value=7, max_value=730, value=90, step=7)
+    desde = time.strftime('%Y-%m-%d', time.localtime(time.time() - dias_atras * 86400))
+
+    # 1) Valor de inventario y utilidad por sucursal
+    st.subheader("Inventario por sucursal")
+    df_suc = historial.resumen_sucursales(desde=desde)
+    if df_suc.empty:
+        st.info("No hay escaneos guardados en ese periodo.")
+    else:
+        sucursales = sorted(df_suc["Sucursal"].unique())
+        elegidas = st.multiselect("Sucursales", sucursales, default=sucursales)
+        df_suc = df_suc[df_suc["Sucursal"].isin(elegidas)]
+
+        col_a, col_b = st.columns(2)
+        col_a.markdown("**Valor de inventario (precio de venta actual)**")
+        col_a.line_chart(df_suc.pivot(index="Fecha", columns="Sucursal", values="Valor venta"))
+        col_b.markdown("**Utilidad**")
+        col_b.line_chart(df_suc.pivot(index="Fecha", columns="Sucursal", values="Utilidad"))
+        st.dataframe(
+            df_suc[df_suc["Fecha"] == df_suc["Fecha"].max()],
+            column_config={c: st.column_config.NumberColumn(c, format="dollar") for c in ("Costo", "Valor venta", "Utilidad")},
+            hide_index=True,
+            use_container_width=True,
+        )
 
-                    st.write("---")
-                    st.subheader("Análisis rápido")
-                    st.write(
-                        f"**Utilidad vs PRECIO COMPRA de Autoprecios** "
-                        f"si vendes al sugerido Daytona: {utilidad_vs_compra_cat:,.0f} MXN"
-                    )
+    # 2) Días en stock del último escaneo
+    st.write("---")
+    st.subheader("Días en stock")
+    fechas_escaneo = historial.fechas()
+    if fechas_escaneo:
+        fecha_dias = st.selectbox("Escaneo del", fechas_escaneo[::-1])
+        df_dias = historial.distribucion_dias(fecha_dias)
+        if df_dias.empty:
+            st.info("Ese escaneo no trae días en stock.")
+        else:
+            tabla_dias = df_dias.pivot(index="Sucursal", columns="Tramo", values="Autos").fillna(0)
+            tabla_dias = tabla_dias.reindex(columns=[t for t in ETIQUETAS_TRAMOS if t in tabla_dias.columns])
+            st.bar_chart(tabla_dias)
+            st.caption("🟢 hasta 30 días · 🟡 31 a 89 · 🔴 90 o más.")
+    else:
+        st.info("Todavía no hay escaneos guardados.")
+
+    # 3) Mediana de mercado por modelo y mes
+    st.write("---")
+    st.subheader("Precio de mercado por modelo")
+    modelos = historial.modelos_resumidos()
+    if modelos.empty:
+        st.info("Todavía no hay precios de mercado guardados.")
+    else:
+        col_auto, col_anio = st.columns(2)
+        auto_sel = col_auto.selectbox("Auto", sorted(modelos["Auto"].unique()))
+        anio_sel = col_anio.selectbox("Año", ["Todos"] + sorted(modelos.loc[modelos["Auto"] == auto_sel, "Año"].unique()))
+        df_med = historial.mediana_mercado(
+            auto_sel, None if anio_sel == "Todos" else anio_sel, desde_mes=desde[:7]
+        )
+        if df_med.empty:
+            st.info("Sin precios de ese modelo en el periodo.")
+        else:
+            st.line_chart(df_med.pivot(index="Mes", columns="Año", values="Mediana"))
+            st.caption(
+                f"Mediana de MercadoLibre por mes, de {int(df_med['Días'].sum())} días escaneados; "
+                "la depreciación se ve como la caída de cada año modelo."
+            )
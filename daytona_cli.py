@@ -0,0 +1,225 @@
+import argparse
+import os
+import sys
+import time
+
+# Los módulos pesados (pandas, el robot, Playwright) se importan dentro de las funciones, así
+# "--help" y los errores de argumentos responden al instante. Streamlit no se importa nunca.
+
+FORMATOS_SALIDA = (".csv", ".parquet")
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(
+        prog="daytona_cli",
+        description="Escanea un inventario contra MercadoLibre sin la app (p. ej. desde cron).",
+    )
+    parser.add_argument("inventario", help="Inventario maestro (.xlsx, .xls o .csv).")
+    grupo = parser.add_mutually_exclusive_group()
+    grupo.add_argument("--sucursal", help="Escanea solo esta sucursal.")
+    grupo.add_argument("--por-sucursal", action="store_true", help="Un escaneo y un reporte por sucursal.")
+    parser.add_argument("--prueba", action="store_true", help="Solo las primeras filas y sin guardar historial.")
+    parser.add_argument("--concurrencia", type=int, default=1, help="Autos consultados a la vez (1 = secuencial).")
+    parser.add_argument("--tasa", type=float, default=1.0,
+                        help="Consultas nuevas por segundo al arrancar (se ajusta sola durante el escaneo).")
+    parser.add_argument("--procesos", type=int, default=1, help="Procesos (y navegadores) que se reparten el inventario.")
+    parser.add_argument("--repartir-por", choices=("consulta", "sucursal"), default="consulta",
+                        help="Cómo se reparte el inventario entre procesos.")
+    parser.add_argument("--modo", choices=("http", "navegador"), default="http", help="Modo de consulta.")
+    parser.add_argument("--ver-navegador", action="store_true", help="Muestra la ventana de Chromium.")
+    parser.add_argument("--salida", help=(
+        "Archivo .csv o .parquet del reporte, o carpeta. Con --por-sucursal puede llevar {sucursal}; "
+        "si no lo lleva, el nombre de la sucursal se agrega al del archivo. "
+        "Por defecto Daytona_Reporte_<sucursal>_<fecha>.csv en la carpeta actual."
+    ))
+    parser.add_argument("--sin-historial", action="store_true", help="No guarda el resultado en el historial.")
+    parser.add_argument("--sin-cache", action="store_true", help="No usa el caché de precios.")
+    parser.add_argument("--vigencia-cache", type=float, help="Horas de vigencia del caché de precios.")
+    parser.add_argument("--no-reanudar", action="store_true", help="Ignora el avance guardado de corridas anteriores.")
+    parser.add_argument("--reintentar-fallidos", action="store_true", help="Al reanudar, vuelve a consultar los errores.")
+    parser.add_argument("--sin-catalogo", action="store_true", help="No agrega los precios de AUTOPRECIOS al reporte.")
+    parser.add_argument("--trazas", action="store_true", help="Registra tiempos por etapa (carpeta trazas/).")
+    parser.add_argument("--silencioso", action="store_true", help="Sin avance en stderr.")
+    return parser
+
+
+def ruta_salida(salida, sucursal, por_sucursal=False):
+    nombre = sucursal or "General"
+    por_defecto = f"Daytona_Reporte_{nombre}_{time.strftime('%Y%m%d')}.csv"
+    if not salida:
+        return por_defecto
+    if os.path.isdir(salida) or salida.endswith(os.sep):
+        return os.path.join(salida, por_defecto)
+    if por_sucursal and "{sucursal}" not in salida:
+        # Un solo nombre para todas las sucursales haría que cada una borrara el archivo de la anterior.
+        base, extension = os.path.splitext(salida)
+        return f"{base}_{nombre}{extension}"
+    return salida.replace("{sucursal}", nombre)
+
+
+class SalidaEnVivo:
+    """Escribe las filas del reporte conforme terminan los autos.
+
+    En .csv cada lote se agrega al archivo en cuanto llega (un corte deja lo ya escaneado) y al
+    terminar se reescribe completo en el orden del inventario; .parquet se escribe solo al final.
+    Cada lote se escribe con las columnas del encabezado: las del primero más ``columnas_catalogo``
+    (antes de "Link") si le faltan, porque las filas de error no traen los precios del catálogo.
+    """
+
+    def __init__(self, ruta, columnas_catalogo=()):
+        self.ruta = ruta
+        self.formato = os.path.splitext(ruta)[1].lower()
+        if self.formato not in FORMATOS_SALIDA:
+            raise ValueError(f"Formato de salida no soportado: {ruta} (usa .csv o .parquet)")
+        carpeta = os.path.dirname(os.path.abspath(ruta))
+        os.makedirs(carpeta, exist_ok=True)
+        self.columnas_catalogo = list(columnas_catalogo)
+        self.columnas = None
+        if self.formato == ".csv" and os.path.exists(ruta):
+            os.remove(ruta)
+
+    def agregar(self, posiciones, filas):
+        if self.formato != ".csv":
+            return
+        encabezado = self.columnas is None
+        if encabezado:
+            self.columnas = list(filas.columns)
+            faltan = [c for c in self.columnas_catalogo if c not in self.columnas]
+            if faltan:
+                posicion = self.columnas.index("Link")
+                self.columnas[posicion:posicion] = faltan
+        filas.reindex(columns=self.columnas).to_csv(self.ruta, mode="a", header=encabezado, index=False)
+
+    def terminar(self, df_r):
+        if self.formato == ".parquet":
+            # Columnas de tipos mezclados (IDs numéricos y de texto) como texto para Parquet.
+            df_r.astype({c: str for c in df_r.columns if df_r[c].dtype == object}).to_parquet(self.ruta, index=False)
+        else:
+            df_r.to_csv(self.ruta, index=False)
+
+
+def avance_en_consola(etiqueta, silencioso, regulador=None):
+    from regulador import texto_regulador
+
+    ultimo = 0.0
+
+    def al_avanzar(hechos, total):
+        nonlocal ultimo
+        ahora = time.monotonic()
+        if silencioso or (ahora - ultimo < 2 and hechos < total):
+            return
+        ultimo = ahora
+        ritmo = f" ({texto_regulador(regulador.estado())})" if regulador is not None else ""
+        print(f"[{etiqueta}] {hechos}/{total} autos{ritmo}", file=sys.stderr, flush=True)
+
+    return al_avanzar
+
+
+def escanear_sucursal(df, cols, sucursal, contenido, args):
+    from catalogo import COLUMNAS_CRUCE, RUTA_AUTOPRECIOS
+    from checkpoints import BitacoraEscaneo, hash_inventario
+    from escaneo import ejecutar_escaneo, filas_a_escanear, guardar_historial, preparar_inventario, resumen_consultas
+    from mercado_ml import texto_navegador
+    from regulador import ReguladorTasa, texto_regulador
+
+    etiqueta = sucursal or "General"
+    data = filas_a_escanear(df, cols, sucursal, args.prueba)
+    resumen = resumen_consultas(preparar_inventario(data, cols))
+    if not args.silencioso:
+        print(
+            f"[{etiqueta}] {resumen['vehiculos']} autos → {resumen['consultas']} búsquedas distintas",
+            file=sys.stderr,
+            flush=True,
+        )
+
+    opciones = {
+        "ver_navegador": args.ver_navegador,
+        "modo_consulta": args.modo,
+        "concurrencia": args.concurrencia,
+        "tasa": args.tasa,
+        "procesos": args.procesos,
+        "repartir_por": args.repartir_por,
+        "usar_cache": not args.sin_cache,
+        "reanudar": not args.no_reanudar,
+        "reintentar_fallidos": args.reintentar_fallidos,
+        "trazas": args.trazas,
+        "cruzar_catalogo": not args.sin_catalogo,
+    }
+    if args.vigencia_cache is not None:
+        opciones["vigencia_cache"] = args.vigencia_cache
+
+    bitacora = None if args.no_reanudar else BitacoraEscaneo(hash_inventario(contenido))
+    con_catalogo = opciones["cruzar_catalogo"] and os.path.exists(RUTA_AUTOPRECIOS)
+    salida = SalidaEnVivo(ruta_salida(args.salida, sucursal, args.por_sucursal), COLUMNAS_CRUCE if con_catalogo else ())
+
+    def al_abrir(estado):
+        if not args.silencioso:
+            print(f"[{etiqueta}] demasiados errores: pausa de {estado['pausa_restante']:.0f} s",
+                  file=sys.stderr, flush=True)
+
+    # Con varios procesos cada uno lleva su propio regulador; la suma llega en info al final.
+    regulador = ReguladorTasa(args.tasa, al_abrir=al_abrir) if args.procesos <= 1 else None
+
+    df_r, info = ejecutar_escaneo(
+        data,
+        cols,
+        opciones,
+        al_avanzar=avance_en_consola(etiqueta, args.silencioso, regulador),
+        bitacora=bitacora,
+        al_resultados=salida.agregar,
+        regulador=regulador,
+    )
+    salida.terminar(df_r)
+
+    corrida = None
+    if not args.prueba and not args.sin_historial:
+        corrida = guardar_historial(df_r)
+
+    if not args.silencioso:
+        sin_precio = int((df_r["Sugerido Venta"] == 0).sum()) if len(df_r) else 0
+        partes = [f"{len(df_r)} autos en {salida.ruta}", f"{sin_precio} sin precio de mercado"]
+        if info.get("regulador"):
+            partes.append(texto_regulador(info["regulador"]))
+        if texto_navegador(info.get("navegador")):
+            partes.append(texto_navegador(info["navegador"]))
+        if corrida:
+            partes.append(f"historial corrida #{corrida}")
+        if info.get("trazas"):
+            partes.append(f"trazas en {info['trazas']}")
+        print(f"[{etiqueta}] listo: {' · '.join(partes)}", file=sys.stderr, flush=True)
+    return df_r
+
+
+def main(argv=None):
+    parser = crear_parser()
+    args = parser.parse_args(argv)
+    if args.tasa <= 0:
+        parser.error("--tasa debe ser mayor que 0.")
+
+    from escaneo import cargar_inventario
+
+    with open(args.inventario, "rb") as f:
+        contenido = f.read()
+    df, cols = cargar_inventario(contenido, nombre=args.inventario)
+    if not cols["version"]:
+        print("Falta columna Versión.", file=sys.stderr)
+        return 1
+
+    if args.por_sucursal:
+        if not cols["sucursal"]:
+            print("El inventario no tiene columna de sucursal.", file=sys.stderr)
+            return 1
+        sucursales = sorted(df[cols["sucursal"]].astype(str).unique())
+    else:
+        if args.sucursal and not cols["sucursal"]:
+            print("El inventario no tiene columna de sucursal.", file=sys.stderr)
+            return 1
+        sucursales = [args.sucursal]
+
+    for sucursal in sucursales:
+        escanear_sucursal(df, cols, sucursal, contenido, args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
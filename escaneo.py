@@ -0,0 +1,607 @@
+import concurrent.futures
+import io
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from broker import ADELANTO_ESCANEO
+from cache_mercado import TTL_HORAS, CacheMercado
+from catalogo import COLUMNAS_CRUCE, RUTA_AUTOPRECIOS, cruce_catalogo
+from historial import HistorialPrecios
+from mercado_ml import (
+    DOMINIOS_BLOQUEADOS,
+    MAX_PAGINAS,
+    MODO_CONSULTA,
+    OBJETIVO_COMPARABLES,
+    POLITICA_PREDETERMINADA,
+    RUTA_SESION,
+    TIPOS_BLOQUEADOS,
+    ClienteHttp,
+    PoliticaRecursos,
+    SesionNavegador,
+    analizar_lote,
+    analizar_vehiculo,
+    construir_url,
+    normalizar_para_url,
+    sumar_contadores,
+)
+from regulador import ReguladorTasa
+from trazas import RegistroTrazas, anotar, etapa, trazando, vehiculo
+
+# -------------------------
+# FUNCIONES UTILITARIAS
+# -------------------------
+def semaforo_por_dias(valores):
+    """Días en stock (primer número del texto, 0 si no hay) y su semáforo, para toda la columna."""
+    dias = pd.to_numeric(valores.astype(str).str.extract(r"(\d+)", expand=False), errors="coerce")
+    semaforo = np.select([dias <= 30, dias <= 89, dias > 89], ["🟢", "🟡", "🔴"], default="")
+    return semaforo, dias.fillna(0).astype(int).to_numpy()
+
+def detectar_columnas(df):
+    csubmarca = next((c for c in df.columns if "submarca" in c.lower()), None)
+    cmodelolbl = next((c for c in df.columns if "modelo" in c.lower()), None)
+
+    caniolbl = next(
+        (c for c in df.columns if any(x in c.lower() for x in ["año", "year", "anho"])),
+        None,
+    )
+
+    return {
+        "nombre_auto": csubmarca if csubmarca else cmodelolbl,
+        "anio": cmodelolbl if (csubmarca and cmodelolbl) else caniolbl,
+        "version": next(
+            (c for c in df.columns if "versión" in c.lower() or "version" in c.lower()),
+            None,
+        ),
+        "precio": next(
+            (c for c in df.columns if "precio" in c.lower() or "venta" in c.lower()),
+            None,
+        ),
+        "costo": next(
+            (c for c in df.columns if any(x in c.lower() for x in ["costo", "compra", "inversion", "libro"])),
+            None,
+        ),
+        "sucursal": next(
+            (c for c in df.columns if any(x in c.lower() for x in ["sucursal", "ubicacion", "agencia"])),
+            None,
+        ),
+        "id": next(
+            (c for c in df.columns if any(x in c.lower() for x in ["id", "sku", "articulo"])),
+            None,
+        ),
+        "dias": next(
+            (c for c in df.columns if any(x in c.lower() for x in ["dias", "days", "antiguedad", "stock", "inventario"])),
+            None,
+        ),
+    }
+
+def claves_filas(data, cols):
+    """Clave estable de cada fila para la bitácora: su ID/SKU o, si no hay, su posición en el archivo."""
+    colid = cols["id"]
+    if colid:
+        texto = data[colid].where(data[colid].notna(), "").astype(str).str.strip()
+    else:
+        texto = pd.Series("", index=data.index)
+    base = texto.where(texto != "", "fila-" + data.index.astype(str))
+    repetida = base.groupby(base).cumcount()
+    return base.where(repetida == 0, base + "#" + repetida.astype(str)).tolist()
+
+def filtrar_sucursal(df, colsucursal, seleccion):
+    if not colsucursal or seleccion in (None, "Todas"):
+        return df
+    # Se compara como texto: la lista de sucursales (y la línea de comandos) las maneja así.
+    return df[df[colsucursal].astype(str) == str(seleccion)]
+
+def motor_excel():
+    """"calamine" (lector en Rust, varias veces más rápido) si está instalado y pandas lo soporta."""
+    try:
+        import python_calamine  # noqa: F401
+    except ImportError:
+        return None
+    version = tuple(int(x) for x in pd.__version__.split(".")[:2])
+    return "calamine" if version >= (2, 2) else None
+
+def leer_inventario(fuente, nombre=None, columnas=None, filas=None):
+    """Inventario maestro desde una ruta, bytes o archivo subido; .csv o Excel según el nombre.
+
+    ``columnas`` (nombres sin espacios alrededor) limita qué columnas se leen y ``filas`` cuántas.
+    """
+    nombre = str(nombre or getattr(fuente, "name", fuente if isinstance(fuente, str) else ""))
+    if isinstance(fuente, bytes):
+        fuente = io.BytesIO(fuente)
+    elif hasattr(fuente, "seek"):
+        fuente.seek(0)
+    usecols = None
+    if columnas is not None:
+        columnas = set(columnas)
+        usecols = lambda c: str(c).strip() in columnas
+    if nombre.lower().endswith(".csv"):
+        df = pd.read_csv(fuente, usecols=usecols, nrows=filas)
+    else:
+        df = pd.read_excel(fuente, usecols=usecols, nrows=filas, engine=motor_excel())
+    df.columns = df.columns.astype(str).str.strip()
+    return df
+
+def columnas_necesarias(cols):
+    # "Marca" no se detecta: preparar_inventario la busca por nombre.
+    return ["Marca"] + [c for c in cols.values() if c]
+
+def cargar_inventario(fuente, nombre=None):
+    """Regresa ``(df, cols)`` leyendo del archivo solo las columnas que usa el escaneo.
+
+    Primero se leen los encabezados para detectar las columnas y luego solo esas columnas
+    (más "Marca"), en el orden del archivo.
+    """
+    nombre = str(nombre or getattr(fuente, "name", fuente if isinstance(fuente, str) else ""))
+    if isinstance(fuente, bytes):
+        fuente = io.BytesIO(fuente)
+    cols = detectar_columnas(leer_inventario(fuente, nombre, filas=0))
+    return leer_inventario(fuente, nombre, columnas=columnas_necesarias(cols)), cols
+
+# En modo prueba solo se escanean las primeras filas.
+FILAS_PRUEBA = 3
+
+def filas_a_escanear(df, cols, sucursal=None, prueba=False):
+    data = filtrar_sucursal(df, cols["sucursal"], sucursal)
+    return data.head(FILAS_PRUEBA).copy() if prueba else data.copy()
+
+# -------------------------
+# PREPARACIÓN DEL INVENTARIO
+# -------------------------
+def _columna(data, col, default=""):
+    if col and col in data.columns:
+        return data[col].to_numpy()
+    return np.full(len(data), default, dtype=object)
+
+def _numerica(data, col):
+    # Solo cuentan celdas que ya son número (texto como "N/D" queda en 0, igual que antes).
+    if not col:
+        return np.zeros(len(data))
+    serie = data[col]
+    if not pd.api.types.is_numeric_dtype(serie):
+        serie = pd.to_numeric(serie.where(serie.map(lambda v: isinstance(v, (int, float)))), errors="coerce")
+    return serie.fillna(0).to_numpy()
+
+def _normalizar_unicos(valores):
+    # normalizar_para_url solo se llama una vez por valor distinto; vacíos y NaN quedan en "".
+    codigos, unicos = pd.factorize(pd.Series(valores, dtype=object))
+    normalizados = np.array([normalizar_para_url(str(u)) for u in unicos] + [""], dtype=object)
+    return normalizados[codigos]
+
+def preparar_inventario(data, cols):
+    """Todo lo que no depende de MercadoLibre, calculado por columna antes de consultar.
+
+    Regresa un DataFrame con una fila por vehículo (en el orden de ``data``) y las columnas
+    ``clave`` (para la bitácora), ``id``, ``sucursal``, ``semaforo``, ``dias_stock``, ``marca``,
+    ``modelo``, ``version``, ``auto``, ``anio``, ``anio_valido``, ``precio_act``, ``costo_libro``
+    y ``consulta``: la URL de búsqueda, igual para los autos que comparten marca/modelo/año
+    y vacía cuando el año no sirve o faltan datos para buscar.
+    """
+    marca = _columna(data, "Marca")
+    modelo = _columna(data, cols["nombre_auto"])
+
+    anio_num = pd.Series(np.nan, index=data.index)
+    if cols["anio"]:
+        crudo = data[cols["anio"]]
+        if not pd.api.types.is_numeric_dtype(crudo):
+            crudo = crudo.astype(str).str.strip()
+        anio_num = np.trunc(pd.to_numeric(crudo, errors="coerce"))
+        anio_num = anio_num.where(anio_num.abs() < 1e9)
+    anio_valido = anio_num.between(1000, 9999).to_numpy()
+    anio = anio_num.astype("Int64").astype(str).where(anio_num.notna(), "").to_numpy()
+
+    semaforo, dias_stock = ("", 0)
+    if cols["dias"]:
+        semaforo, dias_stock = semaforo_por_dias(data[cols["dias"]])
+
+    prep = pd.DataFrame({
+        "clave": claves_filas(data, cols),
+        "id": _columna(data, cols["id"]),
+        "sucursal": _columna(data, cols["sucursal"]),
+        "semaforo": semaforo,
+        "dias_stock": dias_stock,
+        "marca": marca,
+        "modelo": modelo,
+        "version": _columna(data, cols["version"]),
+        "auto": pd.Series(marca, dtype=object).astype(str) + " " + pd.Series(modelo, dtype=object).astype(str),
+        "anio": anio,
+        "anio_valido": anio_valido,
+        "precio_act": _numerica(data, cols["precio"]),
+        "costo_libro": _numerica(data, cols["costo"]),
+    })
+
+    marca_url = _normalizar_unicos(marca)
+    modelo_url = _normalizar_unicos(modelo)
+    completa = anio_valido & (marca_url != "") & (modelo_url != "")
+    consulta = np.full(len(prep), "", dtype=object)
+    if completa.any():
+        # La URL se arma una vez por combinación distinta marca/modelo/año.
+        trios = pd.MultiIndex.from_arrays([marca_url[completa], modelo_url[completa], anio[completa]])
+        codigos, unicos = trios.factorize()
+        urls = np.array([construir_url(m, s, a) for m, s, a in unicos], dtype=object)
+        consulta[completa] = urls[codigos]
+    prep["consulta"] = consulta
+    return prep
+
+def resumen_consultas(prep):
+    """Conteo previo al escaneo: vehículos, años inválidos, datos incompletos y búsquedas distintas."""
+    validas = prep["anio_valido"]
+    con_consulta = prep["consulta"] != ""
+    return {
+        "vehiculos": len(prep),
+        "error_anio": int((~validas).sum()),
+        "incompletos": int((validas & ~con_consulta).sum()),
+        "consultas": int(prep.loc[con_consulta, "consulta"].nunique()),
+    }
+
+# -------------------------
+# FILAS DEL REPORTE
+# -------------------------
+SIN_RESULTADO = (0, 0, "", "", 0, 0, 0)
+DATOS_INCOMPLETOS = (0, 0, "Datos incompletos", "", 0, 0, 0)
+
+def armar_reporte(prep, resultados):
+    """Reporte completo a partir del inventario preparado y un resultado de MercadoLibre por fila."""
+    mercado = pd.DataFrame(list(resultados), columns=["sugerido", "num", "estado", "link", "minimo", "maximo", "mediana"])
+    sugerido = pd.to_numeric(mercado["sugerido"]).fillna(0).to_numpy()
+    costo_libro = prep["costo_libro"].to_numpy()
+    precio_act = prep["precio_act"].to_numpy()
+    dias_stock = prep["dias_stock"].to_numpy()
+
+    utilidad = np.where((sugerido != 0) & (costo_libro != 0), sugerido - costo_libro, 0)
+    compra_sugerida = np.where(sugerido > 0, np.trunc(sugerido * 0.88), 0).astype(int)
+    diagnostico = np.select(
+        [
+            ~prep["anio_valido"].to_numpy(),
+            dias_stock > 90,
+            (costo_libro > 0) & (sugerido > 0) & (sugerido < costo_libro),
+            (sugerido > precio_act) & (dias_stock < 30),
+        ],
+        ["❌ ERROR AÑO", "🧊 CONGELADO", "⚠️ PÉRDIDA", "💰 OPORTUNIDAD"],
+        default="OK",
+    )
+
+    reporte = pd.DataFrame({
+        "ID": prep["id"].to_numpy(),
+        "Sucursal": prep["sucursal"].to_numpy(),
+        "S": prep["semaforo"].to_numpy(),
+        "Diagnóstico": diagnostico,
+        "Stock": dias_stock,
+        "Auto": prep["auto"].to_numpy(),
+        "Versión": prep["version"].to_numpy(),
+        "Año": prep["anio"].to_numpy(),
+        "Comp.": mercado["num"].to_numpy(),
+        "Costo Real": costo_libro,
+        "Compra Sugerida": compra_sugerida,
+        "Actual Venta": precio_act,
+        "Sugerido Venta": sugerido,
+        "Mínimo (Piso)": mercado["minimo"].to_numpy(),
+        "Mediana Mercado": pd.to_numeric(mercado["mediana"]).fillna(0).to_numpy(),
+        "Utilidad": utilidad,
+        "Link": mercado["link"].to_numpy(),
+        "Fecha": time.strftime('%Y-%m-%d'),
+    })
+    if COLUMNAS_CRUCE[0] in prep.columns:
+        # Precios de AUTOPRECIOS (ver ContextoEscaneo), antes del link.
+        posicion = reporte.columns.get_loc("Link")
+        for i, col in enumerate(COLUMNAS_CRUCE):
+            reporte.insert(posicion + i, col, prep[col].to_numpy())
+    return reporte
+
+# -------------------------
+# ESCANEO DE INVENTARIO
+# -------------------------
+# Opciones de un escaneo tal como las arma el panel lateral (y como se guardan en un trabajo en cola).
+OPCIONES_ESCANEO = {
+    "ver_navegador": False,
+    "modo_consulta": MODO_CONSULTA,
+    "concurrencia": 1,
+    # Consultas por segundo al arrancar; el regulador la ajusta durante el escaneo.
+    "tasa": 1.0,
+    "objetivo_comparables": OBJETIVO_COMPARABLES,
+    "max_paginas": MAX_PAGINAS,
+    "tipos_bloqueados": list(TIPOS_BLOQUEADOS),
+    "bloquear_terceros": True,
+    "usar_cache": True,
+    "vigencia_cache": TTL_HORAS,
+    # Con "reanudar" quien llama pasa una bitácora; "reintentar_fallidos" vuelve a consultar sus errores.
+    "reanudar": True,
+    "reintentar_fallidos": False,
+    # Tiempos por etapa de cada consulta en un JSONL de trazas.CARPETA_TRAZAS.
+    "trazas": False,
+    # Agrega al reporte los precios de AUTOPRECIOS de cada auto (si el catálogo está disponible).
+    "cruzar_catalogo": True,
+    # Con más de un proceso el inventario se reparte (por "consulta" o por "sucursal") entre
+    # varios Chromium, cada uno con su copia del perfil (ver fragmentos.py).
+    "procesos": 1,
+    "repartir_por": "consulta",
+}
+
+class ContextoEscaneo:
+    """Lo que acompaña a un escaneo además del inventario.
+
+    ``opciones`` es un dict de ``OPCIONES_ESCANEO``; ``regulador`` marca el ritmo de las
+    consultas (si no se pasa, uno que arranca en ``opciones["tasa"]``). En el navegador se aplica
+    ``politica_recursos`` y en ``red_por_url`` queda por URL lo bloqueado y descargado. Con
+    ``bitacora`` cada resultado se anota al obtenerse; con ``catalogo`` el reporte lleva los
+    precios de AUTOPRECIOS; en ``contadores`` se suman los del navegador.
+    """
+
+    def __init__(self, opciones=None, regulador=None, cache=None, politica_recursos=POLITICA_PREDETERMINADA,
+                 red_por_url=None, bitacora=None, catalogo=None, ruta_memoria=RUTA_SESION, contadores=None):
+        self.op = {**OPCIONES_ESCANEO, **(opciones or {})}
+        self.regulador = regulador if regulador is not None else ReguladorTasa(self.op["tasa"])
+        self.cache = cache
+        self.politica_recursos = politica_recursos
+        self.red_por_url = red_por_url
+        self.bitacora = bitacora
+        self.catalogo = catalogo
+        self.ruta_memoria = ruta_memoria
+        self.contadores = contadores
+
+
+class _Avance:
+    # Resultados de un escaneo en el orden del inventario: resuelve lo que no hace falta consultar
+    # (o ya está en la bitácora), agrupa lo demás por URL y avisa conforme se completa.
+    def __init__(self, data, cols, contexto, al_avanzar=None, al_resultados=None, prep=None):
+        if prep is None:
+            with etapa("preparacion"):
+                prep = preparar_inventario(data, cols)
+        if contexto.catalogo is not None:
+            with etapa("catalogo"):
+                cruce = contexto.catalogo.cruzar(prep["marca"], prep["modelo"], prep["anio"], prep["version"])
+                prep = pd.concat([prep, cruce.set_index(prep.index)], axis=1)
+        self.prep = prep
+        self.bitacora = contexto.bitacora
+        self.al_avanzar = al_avanzar
+        self.al_resultados = al_resultados
+        self.claves = prep["clave"].tolist()
+        self.total = len(prep)
+        self.resultados = [SIN_RESULTADO] * self.total
+
+        # Años inválidos y datos incompletos se resuelven sin consultar.
+        resueltas = ~prep["anio_valido"].to_numpy()
+        for i in np.flatnonzero(prep["anio_valido"].to_numpy() & (prep["consulta"].to_numpy() == "")):
+            self.resultados[i] = DATOS_INCOMPLETOS
+            resueltas[i] = True
+
+        if self.bitacora is not None:
+            for i in np.flatnonzero(~resueltas):
+                previo = self.bitacora.obtener(self.claves[i], contexto.op["reintentar_fallidos"])
+                if previo is not None:
+                    self.resultados[i] = previo
+                    resueltas[i] = True
+
+        self.hechos = int(resueltas.sum())
+        if self.hechos:
+            self.avanzar(np.flatnonzero(resueltas).tolist())
+
+        # Una búsqueda por URL distinta, en el orden en que aparece por primera vez.
+        pendientes = prep.loc[~resueltas, "consulta"]
+        codigos, unicas = pd.factorize(pendientes)
+        self.grupos = [[] for _ in unicas]
+        for i, codigo in zip(np.flatnonzero(~resueltas), codigos):
+            self.grupos[codigo].append(i)
+
+    def primera(self, indices):
+        return self.prep.iloc[indices[0]]
+
+    def avanzar(self, posiciones=()):
+        if self.al_resultados and len(posiciones):
+            with etapa("interfaz"):
+                filas = armar_reporte(self.prep.iloc[posiciones], [self.resultados[i] for i in posiciones])
+                self.al_resultados(list(posiciones), filas)
+        if self.al_avanzar:
+            with etapa("interfaz"):
+                self.al_avanzar(self.hechos, self.total)
+
+    def completar(self, indices, resultado, registrar=True):
+        for i in indices:
+            self.resultados[i] = resultado
+        if self.bitacora is not None and registrar:
+            with etapa("bitacora"):
+                self.bitacora.registrar([self.claves[i] for i in indices], resultado)
+        self.hechos += len(indices)
+        self.avanzar(indices)
+
+    def reporte(self):
+        with etapa("reporte"):
+            return armar_reporte(self.prep, self.resultados)
+
+
+def escanear_inventario(data, cols, contexto, al_avanzar=None, al_resultados=None, prep=None):
+    """Analiza cada fila de ``data`` y regresa el DataFrame del reporte en el mismo orden.
+
+    Las filas con la misma URL de búsqueda se consultan una sola vez; con ``concurrencia`` 1 en
+    un solo navegador, con más varios autos a la vez (``ContextoEscaneo`` trae las opciones).
+    ``al_avanzar(hechos, total)`` y ``al_resultados(posiciones, filas)`` se llaman conforme
+    terminan los vehículos. ``prep`` es ``preparar_inventario(data, cols)`` si ya se tiene.
+    """
+    avance = _Avance(data, cols, contexto, al_avanzar, al_resultados, prep)
+    if contexto.op["concurrencia"] <= 1:
+        _escanear_en_secuencia(avance, contexto)
+    else:
+        _escanear_en_lote(avance, contexto)
+    return avance.reporte()
+
+def _escanear_en_secuencia(avance, contexto):
+    op = contexto.op
+    cliente_http = None
+    if op["modo_consulta"] == "http":
+        cliente_http = ClienteHttp(objetivo_comparables=op["objetivo_comparables"], max_paginas=op["max_paginas"])
+
+    # Un solo Chromium para todo el escaneo (solo se lanza si hace falta); se cierra al terminar.
+    with SesionNavegador(
+        op["ver_navegador"],
+        ruta_memoria=contexto.ruta_memoria,
+        objetivo_comparables=op["objetivo_comparables"],
+        max_paginas=op["max_paginas"],
+        politica_recursos=contexto.politica_recursos,
+        red_por_url=contexto.red_por_url,
+    ) as sesion:
+        for indices in avance.grupos:
+            fila = avance.primera(indices)
+            with vehiculo(marca=fila["marca"], modelo=fila["modelo"], anio=fila["anio"], filas=len(indices)):
+                resultado = analizar_vehiculo(
+                    fila["marca"],
+                    fila["modelo"],
+                    fila["anio"],
+                    op["ver_navegador"],
+                    sesion=sesion,
+                    cache=contexto.cache,
+                    cliente_http=cliente_http,
+                    regulador=contexto.regulador,
+                )
+                anotar(url=resultado[3], estado=resultado[2])
+                avance.completar(indices, resultado)
+    sumar_contadores(contexto.contadores, sesion, cliente_http)
+    if cliente_http is not None:
+        cliente_http.cerrar()
+
+def _escanear_en_lote(avance, contexto):
+    op = contexto.op
+    primeras = avance.prep.iloc[[indices[0] for indices in avance.grupos]]
+    consultas = list(zip(primeras["marca"], primeras["modelo"], primeras["anio"]))
+
+    terminadas = set()
+
+    def al_terminar(pos, resultado):
+        terminadas.add(pos)
+        avance.completar(avance.grupos[pos], resultado)
+
+    del_lote = analizar_lote(
+        consultas,
+        op["ver_navegador"],
+        concurrencia=op["concurrencia"],
+        tasa=op["tasa"],
+        al_terminar=al_terminar,
+        cache=contexto.cache,
+        modo_consulta=op["modo_consulta"],
+        regulador=contexto.regulador,
+        contadores=contexto.contadores,
+        objetivo_comparables=op["objetivo_comparables"],
+        max_paginas=op["max_paginas"],
+        politica_recursos=contexto.politica_recursos,
+        red_por_url=contexto.red_por_url,
+        ruta_memoria=contexto.ruta_memoria,
+    )
+    # Si el lote se cayó, lo que no se consultó sale como error en el reporte pero no entra a la
+    # bitácora: al reanudar se vuelve a consultar.
+    for pos, resultado in enumerate(del_lote):
+        if pos not in terminadas:
+            avance.completar(avance.grupos[pos], resultado, registrar=False)
+
+def escanear_con_broker(data, cols, broker, usuario, contexto, al_avanzar=None, al_resultados=None, prep=None):
+    """``escanear_inventario`` con las búsquedas en la fila de ``usuario`` del navegador
+    compartido (``broker.BrokerConsultas``) en lugar de abrir uno propio."""
+    avance = _Avance(data, cols, contexto, al_avanzar, al_resultados, prep)
+    # Unas cuantas búsquedas por delante de los resultados; si el escaneo se detiene (p. ej. la
+    # sesión se recarga), lo que quedó en la fila del broker se cancela.
+    por_enviar = iter(avance.grupos)
+    futuros = {}
+
+    def enviar():
+        for indices in por_enviar:
+            fila = avance.primera(indices)
+            futuro = broker.consultar(fila["marca"], fila["modelo"], fila["anio"], usuario, contexto.cache,
+                                      filas=len(indices), red_por_url=contexto.red_por_url)
+            futuros[futuro] = indices
+            if len(futuros) >= ADELANTO_ESCANEO:
+                return
+
+    try:
+        enviar()
+        while futuros:
+            listos, _ = concurrent.futures.wait(futuros, return_when=concurrent.futures.FIRST_COMPLETED)
+            for futuro in listos:
+                avance.completar(futuros.pop(futuro), futuro.result())
+            enviar()
+    finally:
+        broker.cancelar(usuario)
+    return avance.reporte()
+
+def ejecutar_escaneo(data, cols, opciones, al_avanzar=None, bitacora=None, al_resultados=None,
+                     ruta_memoria=RUTA_SESION, regulador=None, broker=None, usuario="", prep=None):
+    """Corre ``escanear_inventario`` (o ``escanear_con_broker``) con un dict de ``OPCIONES_ESCANEO``.
+
+    Regresa ``(res, info)``; ``info`` trae los aciertos/fallos de caché, la red por URL, el
+    estado final del regulador (tasa, reintentos, fallas), los contadores del navegador
+    (pestañas recicladas, reinicios, bloqueos HTTP) y, con ``trazas``, la ruta del archivo
+    de tiempos por etapa. Quien pasa ``regulador`` puede leer su ``estado()`` mientras avanza;
+    con varios procesos cada uno lleva el suyo y ``info`` trae la suma.
+    Con ``broker`` las consultas salen por el navegador compartido (sus pestañas y su regulador;
+    ``procesos``, ``concurrencia`` y las opciones de navegador no aplican). ``prep`` es el
+    inventario ya preparado de ``data``; con varios procesos cada uno prepara su parte.
+    """
+    op = {**OPCIONES_ESCANEO, **opciones}
+    if broker is not None:
+        regulador = broker.regulador
+    elif op["procesos"] > 1:
+        from fragmentos import ejecutar_fragmentado
+        return ejecutar_fragmentado(data, cols, op, al_avanzar=al_avanzar, bitacora=bitacora,
+                                    al_resultados=al_resultados, ruta_memoria=ruta_memoria)
+
+    cache = None
+    if op["usar_cache"]:
+        cache = CacheMercado(ttl_horas=op["vigencia_cache"])
+        # Borra según la retención del caché, no según la vigencia de este escaneo: lo precargado
+        # de noche sigue sirviendo a "Cotizar compra" aunque ya esté vencido para escanear.
+        cache.purgar()
+
+    politica = PoliticaRecursos(
+        tipos_bloqueados=op["tipos_bloqueados"],
+        dominios_bloqueados=DOMINIOS_BLOQUEADOS if op["bloquear_terceros"] else (),
+        solo_dominios_propios=op["bloquear_terceros"],
+    )
+    registro = RegistroTrazas() if op["trazas"] else None
+    catalogo = None
+    if op["cruzar_catalogo"] and os.path.exists(RUTA_AUTOPRECIOS):
+        try:
+            catalogo = cruce_catalogo(RUTA_AUTOPRECIOS)
+        except Exception:
+            # Un catálogo ilegible no detiene el escaneo: el reporte sale sin sus precios.
+            catalogo = None
+    contexto = ContextoEscaneo(
+        op,
+        regulador=regulador,
+        cache=cache,
+        politica_recursos=politica,
+        red_por_url={},
+        bitacora=bitacora,
+        catalogo=catalogo,
+        ruta_memoria=ruta_memoria,
+        contadores={},
+    )
+
+    try:
+        with trazando(registro):
+            if broker is not None:
+                res = escanear_con_broker(data, cols, broker, usuario, contexto, al_avanzar=al_avanzar,
+                                          al_resultados=al_resultados, prep=prep)
+            else:
+                res = escanear_inventario(data, cols, contexto, al_avanzar=al_avanzar,
+                                          al_resultados=al_resultados, prep=prep)
+    finally:
+        if registro is not None:
+            registro.cerrar()
+
+    info = {
+        "cache_aciertos": cache.aciertos if cache is not None else None,
+        "cache_fallos": cache.fallos if cache is not None else None,
+        "red_por_url": contexto.red_por_url,
+        "trazas": registro.ruta if registro is not None else None,
+        "regulador": contexto.regulador.estado(),
+        "navegador": contexto.contadores,
+    }
+    return res, info
+
+# -------------------------
+# HISTORIAL
+# -------------------------
+def guardar_historial(df_r, historial=None):
+    """Guarda el reporte como una corrida de ``historial.HistorialPrecios``; regresa el id de la corrida."""
+    if historial is None:
+        historial = HistorialPrecios()
+    return historial.guardar(df_r)
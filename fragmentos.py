@@ -0,0 +1,260 @@
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+import traceback
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from checkpoints import BitacoraEscaneo
+from escaneo import DATOS_INCOMPLETOS, armar_reporte, ejecutar_escaneo, preparar_inventario
+from mercado_ml import RUTA_SESION
+from regulador import combinar_estados
+
+# -------------------------
+# CONFIGURACIÓN ESCANEO REPARTIDO
+# -------------------------
+MODOS_REPARTO = ("consulta", "sucursal")
+
+# Veces que se vuelve a lanzar el fragmento de un proceso que se cayó antes de darlo por perdido.
+REINTENTOS_FRAGMENTO = 2
+
+# Del perfil maestro no se copian los candados de Chromium (impedirían abrir la copia) ni cachés.
+IGNORAR_EN_PERFIL = shutil.ignore_patterns(
+    "Singleton*", "lockfile", "Cache", "Code Cache", "GPUCache", "GrShaderCache", "ShaderCache",
+    "DawnCache", "Service Worker", "Crashpad", "BrowserMetrics*",
+)
+
+FALLA_PROCESO = (0, 0, "Error: proceso de escaneo caído", "", 0, 0, 0)
+
+
+# -------------------------
+# REPARTO DEL INVENTARIO
+# -------------------------
+def repartir(data, cols, procesos, por="consulta"):
+    """Lista de arreglos de posiciones (en el orden de ``data``), uno por proceso.
+
+    Por "consulta" cada URL de búsqueda cae siempre en el mismo fragmento (hash estable), así
+    que ninguna búsqueda se repite entre procesos. Por "sucursal" cada sucursal completa va a un
+    fragmento, llenando primero el que lleva menos filas.
+    """
+    procesos = max(1, int(procesos))
+    if por not in MODOS_REPARTO:
+        raise ValueError(f"Reparto desconocido: {por}")
+
+    if por == "sucursal" and cols["sucursal"]:
+        sucursales = data[cols["sucursal"]].astype(str).to_numpy()
+        codigos, unicas = pd.factorize(sucursales)
+        tamanos = np.bincount(codigos, minlength=len(unicas))
+        carga = [0] * procesos
+        destino = np.empty(len(unicas), dtype=int)
+        for codigo in np.argsort(-tamanos, kind="stable"):
+            elegido = carga.index(min(carga))
+            destino[codigo] = elegido
+            carga[elegido] += tamanos[codigo]
+        asignado = destino[codigos]
+    else:
+        consultas = preparar_inventario(data, cols)["consulta"].to_numpy()
+        # Las filas sin búsqueda (año inválido, datos incompletos) se reparten por posición.
+        asignado = np.array([
+            zlib.crc32(c.encode("utf-8")) % procesos if c else i % procesos
+            for i, c in enumerate(consultas)
+        ], dtype=int)
+
+    return [np.flatnonzero(asignado == n) for n in range(procesos) if (asignado == n).any()]
+
+
+# -------------------------
+# PERFILES DE CHROMIUM
+# -------------------------
+def clonar_perfil(origen=RUTA_SESION):
+    """Copia del perfil maestro en una carpeta temporal; regresa su ruta."""
+    destino = tempfile.mkdtemp(prefix="daytona_perfil_")
+    if os.path.isdir(origen):
+        shutil.copytree(origen, destino, symlinks=True, ignore=IGNORAR_EN_PERFIL, dirs_exist_ok=True)
+    return destino
+
+def borrar_perfil(ruta):
+    shutil.rmtree(ruta, ignore_errors=True)
+
+
+# -------------------------
+# PROCESO TRABAJADOR
+# -------------------------
+def _trabajar(num, data, cols, opciones, ruta_perfil, datos_bitacora, cola):
+    # Corre en un proceso aparte (spawn): cada mensaje lleva el número de fragmento.
+    try:
+        bitacora = BitacoraEscaneo(*datos_bitacora) if datos_bitacora else None
+
+        # Toda fila terminada (consultada, de la bitácora o sin datos) pasa por aquí, así que el
+        # avance se cuenta en el proceso principal con las filas recibidas.
+        def al_resultados(posiciones, filas):
+            cola.put(("filas", num, [int(p) for p in posiciones], filas.to_dict("records")))
+
+        _, info = ejecutar_escaneo(
+            data, cols, {**opciones, "procesos": 1},
+            bitacora=bitacora, al_resultados=al_resultados, ruta_memoria=ruta_perfil,
+        )
+        cola.put(("fin", num, info))
+    except Exception:
+        cola.put(("error", num, traceback.format_exc()))
+        raise
+
+
+class _Fragmento:
+    def __init__(self, num, posiciones):
+        self.num = num
+        self.posiciones = posiciones
+        self.recibidas = set()
+        self.mapa = None
+        self.intentos = 0
+        self.proceso = None
+        self.perfil = None
+        self.terminado = False
+        self.info = None
+        self.errores = []
+
+    def pendientes(self):
+        return np.array([p for p in self.posiciones if p not in self.recibidas], dtype=int)
+
+
+def ejecutar_fragmentado(data, cols, opciones, al_avanzar=None, bitacora=None, al_resultados=None,
+                         ruta_memoria=RUTA_SESION):
+    """``ejecutar_escaneo`` repartido entre ``opciones["procesos"]`` procesos.
+
+    Cada proceso tiene su propio Chromium con una copia del perfil ``ruta_memoria`` y su parte
+    de la ``tasa``. Las filas llegan al proceso principal conforme termina cada búsqueda y el
+    reporte final respeta el orden de ``data``. Si un proceso se cae, solo las filas de su
+    fragmento que no habían llegado se vuelven a lanzar (hasta ``REINTENTOS_FRAGMENTO`` veces);
+    las que siguen sin resultado quedan como error.
+    """
+    total = len(data)
+    fragmentos = [
+        _Fragmento(n, posiciones)
+        for n, posiciones in enumerate(repartir(data, cols, opciones["procesos"], opciones["repartir_por"]))
+    ]
+    opciones_proceso = {**opciones, "tasa": opciones["tasa"] / max(1, len(fragmentos))}
+    datos_bitacora = (bitacora.hash_archivo, bitacora.carpeta, bitacora.vigencia_horas) if bitacora else None
+
+    contexto = multiprocessing.get_context("spawn")
+    cola = contexto.Queue()
+    filas = [None] * total
+
+    def lanzar(fragmento):
+        pendientes = fragmento.pendientes()
+        fragmento.intentos += 1
+        fragmento.perfil = clonar_perfil(ruta_memoria)
+        fragmento.proceso = contexto.Process(
+            target=_trabajar,
+            args=(fragmento.num, data.iloc[pendientes], cols, opciones_proceso, fragmento.perfil,
+                  datos_bitacora, cola),
+            daemon=True,
+        )
+        # Posición dentro de lo que recibió el proceso → posición en data.
+        fragmento.mapa = pendientes
+        fragmento.proceso.start()
+
+    def cerrar_proceso(fragmento):
+        if fragmento.proceso is not None:
+            fragmento.proceso.join(timeout=5)
+            if fragmento.proceso.is_alive():
+                fragmento.proceso.kill()
+                fragmento.proceso.join()
+        if fragmento.perfil is not None:
+            borrar_perfil(fragmento.perfil)
+            fragmento.perfil = None
+
+    def avanzar():
+        if al_avanzar:
+            al_avanzar(sum(len(f.recibidas) for f in fragmentos), total)
+
+    def atender(mensaje):
+        tipo, num = mensaje[0], mensaje[1]
+        fragmento = fragmentos[num]
+        if tipo == "filas":
+            posiciones = [int(fragmento.mapa[p]) for p in mensaje[2]]
+            for pos, registro in zip(posiciones, mensaje[3]):
+                filas[pos] = registro
+            fragmento.recibidas.update(posiciones)
+            if al_resultados:
+                al_resultados(posiciones, pd.DataFrame(mensaje[3]))
+            avanzar()
+        elif tipo == "fin":
+            fragmento.info = mensaje[2]
+            fragmento.terminado = True
+            cerrar_proceso(fragmento)
+        elif tipo == "error":
+            fragmento.errores.append(mensaje[2])
+
+    try:
+        for fragmento in fragmentos:
+            lanzar(fragmento)
+
+        while not all(f.terminado for f in fragmentos):
+            try:
+                atender(cola.get(timeout=1))
+            except queue.Empty:
+                pass
+
+            # En cada vuelta, no solo cuando la cola se vacía: con los demás procesos enviando
+            # filas sin parar, uno caído pasaría inadvertido hasta el final.
+            caidos = [f for f in fragmentos if not f.terminado and f.proceso.exitcode is not None]
+            if not caidos:
+                continue
+            # Lo que alcanzó a enviar antes de salir (incluido su "fin") ya está en la cola.
+            while True:
+                try:
+                    atender(cola.get_nowait())
+                except queue.Empty:
+                    break
+            for fragmento in caidos:
+                if fragmento.terminado:
+                    continue
+                # Murió sin avisar "fin" (crash de Chromium, memoria, kill...).
+                cerrar_proceso(fragmento)
+                if len(fragmento.recibidas) < len(fragmento.posiciones) and fragmento.intentos <= REINTENTOS_FRAGMENTO:
+                    lanzar(fragmento)
+                else:
+                    fragmento.terminado = True
+    finally:
+        for fragmento in fragmentos:
+            if fragmento.proceso is not None and fragmento.proceso.is_alive():
+                fragmento.proceso.kill()
+            cerrar_proceso(fragmento)
+
+    # Lo que ningún intento alcanzó a entregar se reporta como error, igual que un fallo de consulta.
+    faltantes = [i for i, f in enumerate(filas) if f is None]
+    if faltantes:
+        prep = preparar_inventario(data.iloc[faltantes], cols)
+        resultado = [FALLA_PROCESO if valido else DATOS_INCOMPLETOS for valido in prep["anio_valido"]]
+        perdidas = armar_reporte(prep, resultado).to_dict("records")
+        for pos, registro in zip(faltantes, perdidas):
+            filas[pos] = registro
+        if al_resultados:
+            al_resultados(faltantes, pd.DataFrame(perdidas))
+    if al_avanzar:
+        al_avanzar(total, total)
+
+    infos = [f.info for f in fragmentos if f.info]
+    cache_usado = any(i.get("cache_aciertos") is not None for i in infos)
+    info = {
+        "cache_aciertos": sum(i.get("cache_aciertos") or 0 for i in infos) if cache_usado else None,
+        "cache_fallos": sum(i.get("cache_fallos") or 0 for i in infos) if cache_usado else None,
+        "red_por_url": {k: v for i in infos for k, v in (i.get("red_por_url") or {}).items()},
+        "trazas": ", ".join(i["trazas"] for i in infos if i.get("trazas")) or None,
+        "regulador": combinar_estados(i.get("regulador") for i in infos),
+        "navegador": {},
+        "fragmentos": [
+            {"filas": len(f.posiciones), "intentos": f.intentos, "errores": [e[-500:] for e in f.errores]}
+            for f in fragmentos
+        ],
+    }
+    for i in infos:
+        for clave, valor in (i.get("navegador") or {}).items():
+            info["navegador"][clave] = info["navegador"].get(clave, 0) + valor
+    # Las filas de error armadas aquí no traen los precios del catálogo: las columnas salen de la más completa.
+    columnas = max((list(f.keys()) for f in filas), key=len) if filas else None
+    return pd.DataFrame(filas, columns=columnas), info
@@ -0,0 +1,454 @@
+import hashlib
+import itertools
+import os
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+# -------------------------
+# CONFIGURACIÓN HISTORIAL
+# -------------------------
+RUTA_HISTORIAL = os.path.join(os.getcwd(), "historial_daytona.db")
+ARCHIVO_CSV_HISTORIAL = "historial_master_daytona.csv"
+
+# Sube cuando cambian las tablas; una base de una versión anterior se actualiza al abrirla y una
+# de una versión posterior no se toca.
+VERSION_ESQUEMA = 2
+
+# Columna del reporte → columna SQL y su tipo, en el orden del CSV que se guardaba antes (la
+# mediana de mercado, agregada en la v2, al final).
+COLUMNAS_HISTORIAL = (
+    ("ID", "id", "TEXT"),
+    ("Sucursal", "sucursal", "TEXT"),
+    ("Stock", "stock", "INTEGER"),
+    ("Auto", "auto", "TEXT"),
+    ("Versión", "version", "TEXT"),
+    ("Año", "anio", "TEXT"),
+    ("Comp.", "comparables", "INTEGER"),
+    ("Costo Real", "costo_real", "REAL"),
+    ("Compra Sugerida", "compra_sugerida", "REAL"),
+    ("Actual Venta", "actual_venta", "REAL"),
+    ("Sugerido Venta", "sugerido_venta", "REAL"),
+    ("Mínimo (Piso)", "minimo", "REAL"),
+    ("Utilidad", "utilidad", "REAL"),
+    ("Fecha", "fecha", "TEXT"),
+    ("Mediana Mercado", "mediana_mercado", "REAL"),
+)
+# Columnas que el CSV anterior no tiene: quedan vacías.
+COLUMNAS_OPCIONALES = ("Mediana Mercado",)
+COLUMNAS_REPORTE = [c for c, _, _ in COLUMNAS_HISTORIAL]
+COLUMNAS_SQL = [c for _, c, _ in COLUMNAS_HISTORIAL]
+
+ESQUEMA = f"""
+CREATE TABLE IF NOT EXISTS corridas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fecha TEXT NOT NULL,
+    origen TEXT NOT NULL,
+    filas INTEGER NOT NULL,
+    creado REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS historial (
+    corrida INTEGER NOT NULL REFERENCES corridas (id),
+    {", ".join(f"{c} {t}" for _, c, t in COLUMNAS_HISTORIAL)}
+);
+CREATE INDEX IF NOT EXISTS idx_historial_fecha ON historial (fecha, sucursal, auto, anio);
+CREATE INDEX IF NOT EXISTS idx_historial_modelo ON historial (auto, anio, fecha);
+CREATE TABLE IF NOT EXISTS importaciones (
+    sha256 TEXT PRIMARY KEY,
+    ruta TEXT NOT NULL,
+    corrida INTEGER,
+    filas INTEGER NOT NULL,
+    descartadas INTEGER NOT NULL,
+    creado REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS resumen_mercado (
+    auto TEXT NOT NULL,
+    anio TEXT NOT NULL,
+    fecha TEXT NOT NULL,
+    corrida INTEGER NOT NULL,
+    mediana REAL NOT NULL,
+    PRIMARY KEY (auto, anio, fecha)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS resumen_sucursales (
+    fecha TEXT NOT NULL,
+    sucursal TEXT NOT NULL,
+    corrida INTEGER NOT NULL,
+    autos INTEGER NOT NULL,
+    costo REAL NOT NULL,
+    valor_venta REAL NOT NULL,
+    utilidad REAL NOT NULL,
+    PRIMARY KEY (fecha, sucursal)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS resumen_dias (
+    fecha TEXT NOT NULL,
+    sucursal TEXT NOT NULL,
+    tramo INTEGER NOT NULL,
+    autos INTEGER NOT NULL,
+    PRIMARY KEY (fecha, sucursal, tramo)
+) WITHOUT ROWID;
+"""
+
+# -------------------------
+# RESÚMENES
+# -------------------------
+# Se actualizan en la misma transacción que guarda cada corrida, así que las vistas de tendencias
+# leen una fila por día (y por modelo o sucursal) sin importar cuánto historial haya. Todos son
+# una foto por día: si algo se vuelve a escanear el mismo día, cuenta la última corrida.
+
+# Días en stock: límite superior (inclusivo) de cada tramo. Los cortes de escaneo.semaforo_por_dias
+# (≤30 🟢, ≤89 🟡, 90+ 🔴) caen en bordes de tramo.
+TRAMOS_DIAS = (30, 60, 89, 179)
+ETIQUETAS_TRAMOS = ("0-30", "31-60", "61-89", "90-179", "180+")
+
+
+class ErrorEsquemaHistorial(Exception):
+    """La base o el reporte no tienen las columnas que espera el historial."""
+
+
+# Huella SHA-256 de cada CSV por (ruta, mtime, tamaño): la app pregunta en cada recarga si el CSV
+# anterior está pendiente y solo vuelve a leer el archivo completo cuando cambia.
+_huellas_csv = {}
+
+def _huella_csv(ruta_csv):
+    info = os.stat(ruta_csv)
+    firma = (os.path.abspath(ruta_csv), info.st_mtime_ns, info.st_size)
+    if firma not in _huellas_csv:
+        with open(ruta_csv, "rb") as f:
+            _huellas_csv[firma] = hashlib.sha256(f.read()).hexdigest()
+    return _huellas_csv[firma]
+
+def _a_registros(df):
+    # Tipos nativos de Python (sqlite3 no acepta los de numpy) y None en lugar de NaN.
+    df = df.astype(object).where(df.notna(), None)
+    return list(df.itertuples(index=False, name=None))
+
+def _normalizar_reporte(df_r):
+    faltan = [c for c in COLUMNAS_REPORTE if c not in df_r.columns and c not in COLUMNAS_OPCIONALES]
+    if faltan:
+        raise ErrorEsquemaHistorial(f"Al reporte le faltan columnas del historial: {', '.join(faltan)}")
+    df = df_r.reindex(columns=COLUMNAS_REPORTE)
+    for col in ("ID", "Sucursal", "Auto", "Versión", "Año", "Fecha"):
+        df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    # Años que llegaron como 2020.0 (p. ej. desde el CSV) se guardan como "2020".
+    df["Año"] = df["Año"].str.replace(r"\.0$", "", regex=True)
+    return df
+
+
+class HistorialPrecios:
+    """Historial de escaneos en SQLite, una fila por vehículo y corrida.
+
+    Cada ``guardar`` es una transacción: o entra la corrida completa o no entra nada. Las
+    consultas filtran por fecha, sucursal, auto y año usando índices, así que no hace falta
+    leer todo el historial para ver un modelo o un día.
+    """
+
+    def __init__(self, ruta=RUTA_HISTORIAL):
+        self.ruta = ruta
+        with self._conectar() as con:
+            self._verificar_esquema(con)
+
+    @contextmanager
+    def _conectar(self):
+        con = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+        try:
+            con.execute("PRAGMA journal_mode=WAL")
+            yield con
+        finally:
+            con.close()
+
+    @contextmanager
+    def _transaccion(self):
+        with self._conectar() as con:
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                yield con
+                con.execute("COMMIT")
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+
+    def _verificar_esquema(self, con):
+        version = con.execute("PRAGMA user_version").fetchone()[0]
+        if version > VERSION_ESQUEMA:
+            raise ErrorEsquemaHistorial(
+                f"{self.ruta} tiene el esquema v{version} y esta versión espera v{VERSION_ESQUEMA}."
+            )
+        con.executescript(ESQUEMA)
+        esperadas = ["corrida"] + COLUMNAS_SQL
+        columnas = [f[1] for f in con.execute("PRAGMA table_info(historial)")]
+        # A una base v1 todavía le falta la columna de la mediana de mercado (se agrega abajo).
+        if columnas != esperadas and not (version < VERSION_ESQUEMA and columnas == esperadas[:-1]):
+            raise ErrorEsquemaHistorial(f"Las columnas de {self.ruta} no coinciden con el historial esperado.")
+        if version == VERSION_ESQUEMA:
+            return
+        # v1 → v2: la columna nueva y los resúmenes, calculados una vez con lo que ya estaba guardado.
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            # Otro proceso pudo haber actualizado la base mientras tanto.
+            if con.execute("PRAGMA user_version").fetchone()[0] < VERSION_ESQUEMA:
+                if "mediana_mercado" not in [f[1] for f in con.execute("PRAGMA table_info(historial)")]:
+                    con.execute("ALTER TABLE historial ADD COLUMN mediana_mercado REAL")
+                self._reconstruir_resumenes(con)
+                con.execute(f"PRAGMA user_version = {VERSION_ESQUEMA}")
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+
+    def _insertar(self, con, df, origen):
+        fecha = str(df["Fecha"].iloc[0]) if len(df) else time.strftime('%Y-%m-%d')
+        corrida = con.execute(
+            "INSERT INTO corridas (fecha, origen, filas, creado) VALUES (?, ?, ?, ?)",
+            (fecha, origen, len(df), time.time()),
+        ).lastrowid
+        con.executemany(
+            f"INSERT INTO historial (corrida, {', '.join(COLUMNAS_SQL)}) "
+            f"VALUES (?, {', '.join('?' * len(COLUMNAS_SQL))})",
+            [(corrida,) + fila for fila in _a_registros(df)],
+        )
+        self._actualizar_resumenes(con, df.assign(Fecha=df["Fecha"].fillna(fecha)), corrida)
+        return corrida
+
+    def _actualizar_resumenes(self, con, df, corrida):
+        """Reemplaza con esta corrida la foto del día de sus modelos, sucursales y días en stock.
+
+        Un modelo o una sucursal escaneados dos veces el mismo día quedan con la última corrida.
+        """
+        # Mercado: la mediana de MercadoLibre de cada búsqueda (Auto, Año), una vez aunque haya varias
+        # unidades en inventario. Las filas anteriores a la v2 no la traen y no entran.
+        medianas = pd.to_numeric(df["Mediana Mercado"], errors="coerce")
+        con_precio = (medianas > 0) & df["Auto"].notna() & df["Año"].notna()
+        busquedas = pd.DataFrame({
+            "auto": df.loc[con_precio, "Auto"],
+            "anio": df.loc[con_precio, "Año"],
+            "fecha": df.loc[con_precio, "Fecha"],
+            "mediana": medianas[con_precio],
+        }).drop_duplicates(["auto", "anio", "fecha"])
+        con.executemany(
+            "INSERT OR REPLACE INTO resumen_mercado (auto, anio, fecha, corrida, mediana) VALUES (?, ?, ?, ?, ?)",
+            [(a, n, f, corrida, m) for a, n, f, m in _a_registros(busquedas)],
+        )
+
+        tabla = pd.DataFrame({
+            "fecha": df["Fecha"],
+            "sucursal": df["Sucursal"].fillna(""),
+            "costo": pd.to_numeric(df["Costo Real"], errors="coerce").fillna(0),
+            "valor_venta": pd.to_numeric(df["Actual Venta"], errors="coerce").fillna(0),
+            "utilidad": pd.to_numeric(df["Utilidad"], errors="coerce").fillna(0),
+            "dias": pd.to_numeric(df["Stock"], errors="coerce"),
+        })
+        por_sucursal = tabla.groupby(["fecha", "sucursal"]).agg(
+            autos=("costo", "size"), costo=("costo", "sum"), valor_venta=("valor_venta", "sum"), utilidad=("utilidad", "sum"),
+        ).reset_index()
+        con.executemany(
+            "INSERT OR REPLACE INTO resumen_sucursales (fecha, sucursal, corrida, autos, costo, valor_venta, utilidad) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(f, s, corrida, a, c, v, u) for f, s, a, c, v, u in _a_registros(por_sucursal)],
+        )
+
+        con.executemany(
+            "DELETE FROM resumen_dias WHERE fecha = ? AND sucursal = ?",
+            _a_registros(por_sucursal[["fecha", "sucursal"]]),
+        )
+        con_dias = tabla[tabla["dias"].notna()]
+        tramos = con_dias.assign(tramo=np.searchsorted(TRAMOS_DIAS, con_dias["dias"].to_numpy()))
+        con.executemany(
+            "INSERT INTO resumen_dias (fecha, sucursal, tramo, autos) VALUES (?, ?, ?, ?)",
+            _a_registros(tramos.groupby(["fecha", "sucursal", "tramo"]).size().reset_index()),
+        )
+
+    def _reconstruir_resumenes(self, con):
+        for tabla in ("resumen_mercado", "resumen_sucursales", "resumen_dias"):
+            con.execute(f"DELETE FROM {tabla}")
+        fechas = dict(con.execute("SELECT id, fecha FROM corridas"))
+        filas = con.execute(f"SELECT corrida, {', '.join(COLUMNAS_SQL)} FROM historial ORDER BY corrida")
+        for corrida, grupo in itertools.groupby(filas, key=lambda f: f[0]):
+            df = pd.DataFrame([f[1:] for f in grupo], columns=COLUMNAS_REPORTE)
+            self._actualizar_resumenes(con, df.assign(Fecha=df["Fecha"].fillna(fechas[corrida])), corrida)
+
+    def reconstruir_resumenes(self):
+        """Vuelve a calcular los resúmenes desde todo el historial (normalmente no hace falta)."""
+        with self._transaccion() as con:
+            self._reconstruir_resumenes(con)
+
+    def guardar(self, df_r, origen="escaneo"):
+        """Agrega las filas de un reporte como una corrida nueva; regresa el id de la corrida."""
+        df = _normalizar_reporte(df_r)
+        with self._transaccion() as con:
+            return self._insertar(con, df, origen)
+
+    def consultar(self, desde=None, hasta=None, sucursal=None, auto=None, anio=None, columnas=None):
+        """Filas del historial con los nombres de columna del reporte, filtradas en SQLite.
+
+        ``desde``/``hasta`` son fechas "AAAA-MM-DD" inclusivas; ``columnas`` limita qué se lee.
+        """
+        columnas = list(columnas or COLUMNAS_REPORTE)
+        sql_por_columna = {c: s for c, s, _ in COLUMNAS_HISTORIAL}
+        seleccion = ", ".join(sql_por_columna[c] for c in columnas)
+
+        condiciones, parametros = [], []
+        for sql, valor, operador in (
+            ("fecha", desde, ">="),
+            ("fecha", hasta, "<="),
+            ("sucursal", sucursal, "="),
+            ("auto", auto, "="),
+            ("anio", None if anio is None else str(anio), "="),
+        ):
+            if valor is not None:
+                condiciones.append(f"{sql} {operador} ?")
+                parametros.append(valor)
+        donde = f" WHERE {' AND '.join(condiciones)}" if condiciones else ""
+
+        with self._conectar() as con:
+            filas = con.execute(
+                f"SELECT {seleccion} FROM historial{donde} ORDER BY fecha, corrida", parametros
+            ).fetchall()
+        return pd.DataFrame(filas, columns=columnas)
+
+    def historial_modelo(self, auto, anio=None, dias=90):
+        """Precios de mercado de un modelo en los últimos ``dias`` días."""
+        desde = time.strftime('%Y-%m-%d', time.localtime(time.time() - dias * 86400))
+        return self.consultar(
+            desde=desde,
+            auto=auto,
+            anio=anio,
+            columnas=["Fecha", "Sucursal", "Versión", "Año", "Comp.", "Sugerido Venta", "Mínimo (Piso)", "Actual Venta"],
+        )
+
+    def frecuencia_modelos(self, dias=None):
+        """Veces que aparece cada (Auto, Año) en el historial, opcionalmente solo en los últimos ``dias``."""
+        donde, parametros = "", []
+        if dias is not None:
+            donde = " WHERE fecha >= ?"
+            parametros.append(time.strftime('%Y-%m-%d', time.localtime(time.time() - dias * 86400)))
+        with self._conectar() as con:
+            filas = con.execute(
+                f"SELECT auto, anio, COUNT(*) FROM historial{donde} GROUP BY auto, anio", parametros
+            ).fetchall()
+        return pd.DataFrame(filas, columns=["Auto", "Año", "Veces"])
+
+    def modelos_resumidos(self):
+        """(Auto, Año) que tienen precios de mercado resumidos."""
+        with self._conectar() as con:
+            filas = con.execute("SELECT DISTINCT auto, anio FROM resumen_mercado ORDER BY auto, anio").fetchall()
+        return pd.DataFrame(filas, columns=["Auto", "Año"])
+
+    def mediana_mercado(self, auto, anio=None, desde_mes=None):
+        """Precio de mercado de un modelo por mes ("AAAA-MM"), desde ``desde_mes``.
+
+        ``Mediana`` es la mediana de las medianas de MercadoLibre de cada día escaneado del mes
+        (``Días``).
+        """
+        condiciones, parametros = ["auto = ?"], [auto]
+        if anio is not None:
+            condiciones.append("anio = ?")
+            parametros.append(str(anio))
+        if desde_mes is not None:
+            condiciones.append("fecha >= ?")
+            parametros.append(desde_mes)
+        with self._conectar() as con:
+            filas = con.execute(
+                f"SELECT anio, substr(fecha, 1, 7), mediana FROM resumen_mercado WHERE {' AND '.join(condiciones)}",
+                parametros,
+            ).fetchall()
+        df = pd.DataFrame(filas, columns=["Año", "Mes", "Mediana"])
+        return (
+            df.groupby(["Año", "Mes"], sort=True)
+            .agg(Días=("Mediana", "size"), Mediana=("Mediana", "median"))
+            .reset_index()
+        )
+
+    def resumen_sucursales(self, desde=None, hasta=None):
+        """Autos, costo, valor de venta y utilidad del inventario por sucursal y fecha de escaneo."""
+        condiciones, parametros = [], []
+        for valor, operador in ((desde, ">="), (hasta, "<=")):
+            if valor is not None:
+                condiciones.append(f"fecha {operador} ?")
+                parametros.append(valor)
+        donde = f" WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        with self._conectar() as con:
+            filas = con.execute(
+                f"SELECT fecha, sucursal, autos, costo, valor_venta, utilidad FROM resumen_sucursales{donde} "
+                "ORDER BY fecha, sucursal",
+                parametros,
+            ).fetchall()
+        return pd.DataFrame(filas, columns=["Fecha", "Sucursal", "Autos", "Costo", "Valor venta", "Utilidad"])
+
+    def distribucion_dias(self, fecha=None):
+        """Autos por tramo de días en stock (``ETIQUETAS_TRAMOS``) y sucursal; por omisión, del último escaneo."""
+        with self._conectar() as con:
+            if fecha is None:
+                fecha = con.execute("SELECT MAX(fecha) FROM resumen_dias").fetchone()[0]
+            filas = con.execute(
+                "SELECT sucursal, tramo, autos FROM resumen_dias WHERE fecha = ? ORDER BY sucursal, tramo", (fecha,)
+            ).fetchall()
+        df = pd.DataFrame(filas, columns=["Sucursal", "Tramo", "Autos"])
+        df["Tramo"] = [ETIQUETAS_TRAMOS[t] for t in df["Tramo"]]
+        return df
+
+    def fechas(self):
+        with self._conectar() as con:
+            return [f[0] for f in con.execute("SELECT DISTINCT fecha FROM corridas ORDER BY fecha")]
+
+    def importar_csv(self, ruta_csv=ARCHIVO_CSV_HISTORIAL):
+        """Pasa al historial el CSV que se usaba antes, una sola vez por contenido.
+
+        Regresa ``(filas, descartadas)``; ``None`` si ese CSV ya se había importado. Las líneas
+        que no tienen las columnas del encabezado (anexos con otro esquema) se descartan y se cuentan.
+        """
+        sha = _huella_csv(ruta_csv)
+        with self._conectar() as con:
+            if con.execute("SELECT 1 FROM importaciones WHERE sha256 = ?", (sha,)).fetchone():
+                return None
+
+        descartadas = 0
+
+        def contar_descartada(_linea):
+            nonlocal descartadas
+            descartadas += 1
+            return None
+
+        df = pd.read_csv(ruta_csv, dtype=str, on_bad_lines=contar_descartada, engine="python")
+        df.columns = df.columns.str.strip()
+        df = _normalizar_reporte(df)
+        # Filas repetidas del encabezado, de anexos que reescribieron los títulos.
+        encabezado = df["Fecha"] == "Fecha"
+        descartadas += int(encabezado.sum())
+        df = df[~encabezado]
+        for col in ("Stock", "Comp.", "Costo Real", "Compra Sugerida", "Actual Venta",
+                    "Sugerido Venta", "Mínimo (Piso)", "Utilidad", "Mediana Mercado"):
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+
+        with self._transaccion() as con:
+            ultima = None
+            # Una corrida por fecha de escaneo, como si se hubieran guardado día por día.
+            for _, grupo in df.groupby("Fecha", sort=True):
+                ultima = self._insertar(con, grupo, f"csv:{os.path.basename(ruta_csv)}")
+            con.execute(
+                "INSERT INTO importaciones (sha256, ruta, corrida, filas, descartadas, creado) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (sha, os.path.abspath(ruta_csv), ultima, len(df), descartadas, time.time()),
+            )
+        return len(df), descartadas
+
+    def csv_pendiente(self, ruta_csv=ARCHIVO_CSV_HISTORIAL):
+        """True si existe el CSV anterior y su contenido actual todavía no se importó."""
+        if not os.path.exists(ruta_csv):
+            return False
+        sha = _huella_csv(ruta_csv)
+        with self._conectar() as con:
+            return con.execute("SELECT 1 FROM importaciones WHERE sha256 = ?", (sha,)).fetchone() is None
+
+
+if __name__ == "__main__":
+    # python historial.py [ruta_csv]  → importa el CSV anterior al historial en SQLite.
+    ruta = sys.argv[1] if len(sys.argv) > 1 else ARCHIVO_CSV_HISTORIAL
+    importado = HistorialPrecios().importar_csv(ruta)
+    if importado is None:
+        print(f"{ruta} ya estaba importado.")
+    else:
+        print(f"Importadas {importado[0]} filas de {ruta} ({importado[1]} descartadas).")
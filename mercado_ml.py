@@ -0,0 +1,1103 @@
+import asyncio
+import html
+import os
+import re
+import statistics
+import time
+import unicodedata
+from contextlib import asynccontextmanager, contextmanager
+from urllib.parse import urljoin, urlsplit
+
+from regulador import ReguladorTasa
+from trazas import anotar, etapa, vehiculo
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: candados de msvcrt sobre el primer byte del archivo.
+    fcntl = None
+    import msvcrt
+
+# -------------------------
+# CONFIGURACIÓN ROBOT ML
+# -------------------------
+RUTA_SESION = os.environ.get("DAYTONA_RUTA_SESION") or os.path.join(os.getcwd(), "mi_sesion_ml")
+
+# Base de las búsquedas de autos. DAYTONA_URL_ML la apunta a otro servidor (p. ej. el de benchmark.py).
+URL_BASE_LISTADOS = (os.environ.get("DAYTONA_URL_ML") or "https://autos.mercadolibre.com.mx").rstrip("/")
+SELECTOR_PRECIO = ".andes-money-amount__fraction"
+SELECTOR_SIN_RESULTADOS = ".ui-search-rescue, .ui-search-zrp"
+SELECTOR_SIGUIENTE = "li.andes-pagination__button--next a"
+
+# Tiempo máximo para que aparezcan precios (o el aviso de "sin resultados") tras cargar la página.
+TIMEOUT_LISTADO_MS = 10000
+
+# Se siguen las páginas de resultados hasta juntar este número de comparables o agotar MAX_PAGINAS.
+OBJETIVO_COMPARABLES = 100
+MAX_PAGINAS = 3
+
+# Modos de consulta: "http" descarga el HTML sin navegador y solo abre Chromium si no encuentra
+# precios o la respuesta parece un bloqueo; "navegador" usa siempre Chromium.
+MODOS_CONSULTA = ("http", "navegador")
+MODO_CONSULTA = "http"
+
+ENCABEZADOS_HTTP = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"
+    ),
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "es-MX,es;q=0.9",
+}
+TIMEOUT_HTTP = 15
+
+# Bloqueos HTTP seguidos tras los que el cliente HTTP se apaga y el resto del escaneo va directo a Chromium.
+BLOQUEOS_HTTP_SEGUIDOS = 3
+
+# Precio sugerido Daytona = este factor × la mediana de mercado (ya sin precios atípicos).
+FACTOR_PRECIO_DAYTONA = 0.95
+
+# Páginas que se usan antes de cerrarlas y abrir una nueva (evita fugas de memoria
+# en Chromium durante escaneos largos).
+USOS_POR_PAGINA = 25
+
+# Tope de Chromium abiertos a la vez en el servidor, sumando todo lo que lo lanza (escaneos de la app,
+# navegador compartido, trabajador, CLI, precarga y cada proceso de un escaneo repartido), y de
+# pestañas por Chromium. Cada Chromium toma un lugar en CARPETA_CUPOS antes de abrirse.
+MAX_NAVEGADORES = int(os.environ.get("DAYTONA_MAX_NAVEGADORES") or 4)
+MAX_PESTANAS = int(os.environ.get("DAYTONA_MAX_PESTANAS") or 8)
+CARPETA_CUPOS = os.environ.get("DAYTONA_CARPETA_CUPOS") or os.path.join(os.getcwd(), "cupos_navegador")
+ESPERA_CUPO = 0.5
+
+
+# -------------------------
+# FUNCIONES UTILITARIAS
+# -------------------------
+def normalizar_para_url(texto):
+    if not isinstance(texto, str):
+        return ""
+    texto = "".join(
+        c for c in unicodedata.normalize("NFD", texto)
+        if unicodedata.category(c) != "Mn"
+    )
+    texto = texto.lower().strip()
+    texto = re.sub(r"[^a-z0-9]+", "-", texto)
+    texto = re.sub(r"-+", "-", texto)
+    return texto
+
+def construir_url(marca, modelo, anio_str):
+    marca_url = normalizar_para_url(marca)
+    modelo_url = normalizar_para_url(modelo)
+    return f"{URL_BASE_LISTADOS}/{marca_url}/{modelo_url}/{anio_str}_NoIndex_True?VIEW=list"
+
+def limpiar_precios(textos):
+    precios = []
+    for t in textos:
+        limpio = t.replace(",", "").replace(".", "")
+        try:
+            val = int(limpio)
+            if 50000 <= val <= 10000000:
+                precios.append(val)
+        except:
+            pass
+    return precios
+
+def calcular_estadisticas(precios_brutos):
+    mediana_inicial = statistics.median(precios_brutos)
+    precios_limpios = [
+        p for p in precios_brutos
+        if mediana_inicial * 0.6 <= p <= mediana_inicial * 1.6
+    ]
+
+    if not precios_limpios:
+        precios_limpios = precios_brutos
+
+    mediana_final = int(statistics.median(precios_limpios))
+    return {
+        "precio_daytona": int(mediana_final * FACTOR_PRECIO_DAYTONA),
+        "cantidad": len(precios_limpios),
+        "mediana": mediana_final,
+        "minimo": min(precios_limpios),
+        "maximo": max(precios_limpios),
+    }
+
+def resultado_desde_estadisticas(est, url):
+    return est["precio_daytona"], est["cantidad"], "Exitoso", url, est["minimo"], est["maximo"], est["mediana"]
+
+def resumir_precios(precios_brutos, url, cache=None):
+    if not precios_brutos:
+        return 0, 0, "0 Resultados", url, 0, 0, 0
+
+    est = calcular_estadisticas(precios_brutos)
+    if cache is not None:
+        cache.guardar(url, precios_brutos, est)
+    return resultado_desde_estadisticas(est, url)
+
+
+# -------------------------
+# CONSULTA HTTP (SIN NAVEGADOR)
+# -------------------------
+PATRON_PRECIO_HTML = re.compile(r'class="[^"]*andes-money-amount__fraction[^"]*"[^>]*>\s*([\d.,]+)\s*<')
+PATRON_PRECIO_JSON = re.compile(r'"price"\s*:\s*\{[^{}]*?"(?:amount|value)"\s*:\s*(\d+(?:\.\d+)?)')
+PATRON_SIGUIENTE_HTML = re.compile(
+    r'andes-pagination__button--next[^>]*>\s*<a[^>]*href="([^"]+)"'
+)
+PATRON_SIN_RESULTADOS = re.compile(r'class="[^"]*ui-search-(?:rescue|zrp)')
+MARCAS_BLOQUEO = ("captcha", "account-verification", "suspicious-traffic", "/gz/webdevice")
+
+
+class ListadoBloqueado(Exception):
+    pass
+
+
+class ListadoVacio(Exception):
+    """La página cargó sin precios y sin el aviso de "sin resultados" (suele ser un bloqueo suave)."""
+
+
+class EscaneoDetenido(Exception):
+    """Quien llama detuvo el escaneo (p. ej. desde ``al_terminar``); no es una falla de consulta."""
+
+
+def parsear_listado(contenido):
+    """Regresa ``(precios, siguiente_url, sin_resultados)`` a partir del HTML de un listado.
+
+    Primero lee los nodos de precio del marcado; si no hay, los montos del estado JSON embebido.
+    """
+    textos = PATRON_PRECIO_HTML.findall(contenido)
+    if not textos:
+        textos = [str(int(float(v))) for v in PATRON_PRECIO_JSON.findall(contenido)]
+    enlace = PATRON_SIGUIENTE_HTML.search(contenido)
+    siguiente = html.unescape(enlace.group(1)) if enlace else None
+    sin_resultados = bool(PATRON_SIN_RESULTADOS.search(contenido))
+    return limpiar_precios(textos), siguiente, sin_resultados
+
+
+class ClienteHttp:
+    """Descarga listados con una sesión HTTP que reutiliza conexiones (keep-alive) entre consultas."""
+
+    def __init__(self, objetivo_comparables=OBJETIVO_COMPARABLES, max_paginas=MAX_PAGINAS, timeout=TIMEOUT_HTTP):
+        self.objetivo_comparables = objetivo_comparables
+        self.max_paginas = max(1, int(max_paginas))
+        self.timeout = timeout
+        self.bloqueos = 0
+        self.bloqueos_seguidos = 0
+        self.apagado = False
+        self._sesion = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+        return False
+
+    def _obtener_sesion(self):
+        if self._sesion is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            self._sesion = requests.Session()
+            self._sesion.headers.update(ENCABEZADOS_HTTP)
+            adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+            self._sesion.mount("https://", adaptador)
+            self._sesion.mount("http://", adaptador)
+        return self._sesion
+
+    def descargar(self, url):
+        respuesta = self._obtener_sesion().get(url, timeout=self.timeout)
+        texto = respuesta.text
+        final = respuesta.url.lower()
+        if respuesta.status_code in (403, 429) or any(m in final for m in MARCAS_BLOQUEO):
+            self.bloqueos += 1
+            raise ListadoBloqueado(f"HTTP {respuesta.status_code} {respuesta.url}")
+        respuesta.raise_for_status()
+        return texto, respuesta.url
+
+    def extraer_precios(self, url):
+        """Lista de precios brutos, ``[]`` si ML dice que no hay resultados, o ``None`` si no se pudo leer."""
+        precios = []
+        siguiente = url
+        for num_pagina in range(self.max_paginas):
+            try:
+                contenido, url_final = self.descargar(siguiente)
+            except Exception:
+                if num_pagina == 0:
+                    raise
+                break
+            nuevos, enlace, sin_resultados = parsear_listado(contenido)
+            if num_pagina == 0 and not nuevos:
+                if sin_resultados:
+                    return []
+                if any(m in contenido[:20000].lower() for m in MARCAS_BLOQUEO):
+                    self.bloqueos += 1
+                    raise ListadoBloqueado(url_final)
+                return None
+            precios.extend(nuevos)
+            siguiente = urljoin(url_final, enlace) if (enlace and nuevos) else None
+            if len(precios) >= self.objetivo_comparables or not siguiente:
+                break
+        return precios
+
+    def cerrar(self):
+        if self._sesion is not None:
+            self._sesion.close()
+            self._sesion = None
+
+
+# -------------------------
+# FILTRO DE RECURSOS (NAVEGADOR)
+# -------------------------
+# Del listado solo se leen textos de precio: imágenes, fuentes, video y rastreadores no hacen falta.
+TIPOS_BLOQUEADOS = ("image", "font", "media")
+TIPOS_RECURSO = ("image", "font", "media", "stylesheet", "script", "xhr", "fetch", "other")
+DOMINIOS_PROPIOS = ("mercadolibre.com.mx", "mercadolibre.com", "mlstatic.com")
+DOMINIOS_BLOQUEADOS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "googlesyndication.com",
+    "googleadservices.com", "facebook.net", "facebook.com", "hotjar.com", "clarity.ms",
+    "criteo.com", "criteo.net", "adsrvr.org", "bing.com", "tiktok.com", "taboola.com",
+)
+
+# Tamaño típico por tipo de recurso para estimar lo que se dejó de descargar (el navegador no
+# conoce el tamaño real de una petición abortada).
+BYTES_ESTIMADOS_POR_TIPO = {
+    "image": 35_000,
+    "font": 40_000,
+    "media": 250_000,
+    "stylesheet": 30_000,
+    "script": 45_000,
+}
+BYTES_ESTIMADOS_OTRO = 5_000
+
+
+def _dominio_en(host, dominios):
+    return any(host == d or host.endswith("." + d) for d in dominios)
+
+
+class PoliticaRecursos:
+    """Qué peticiones del navegador se abortan, por tipo de recurso y por dominio.
+
+    Con ``solo_dominios_propios`` también se bloquean scripts y peticiones de datos
+    de cualquier dominio que no sea de MercadoLibre.
+    """
+
+    def __init__(self, tipos_bloqueados=TIPOS_BLOQUEADOS, dominios_bloqueados=DOMINIOS_BLOQUEADOS,
+                 solo_dominios_propios=True, dominios_propios=DOMINIOS_PROPIOS):
+        self.tipos_bloqueados = frozenset(tipos_bloqueados)
+        self.dominios_bloqueados = tuple(dominios_bloqueados)
+        self.solo_dominios_propios = solo_dominios_propios
+        self.dominios_propios = tuple(dominios_propios)
+
+    def motivo_bloqueo(self, tipo, url):
+        if tipo in self.tipos_bloqueados:
+            return tipo
+        host = (urlsplit(url).hostname or "").lower()
+        if not host:
+            return None
+        if _dominio_en(host, self.dominios_bloqueados):
+            return "rastreador"
+        if self.solo_dominios_propios and tipo != "document" and not _dominio_en(host, self.dominios_propios):
+            return "tercero"
+        return None
+
+
+class MedidorRed:
+    """Peticiones bloqueadas y bytes de una pestaña durante una consulta."""
+
+    def __init__(self):
+        self.reiniciar()
+
+    def reiniciar(self):
+        self.solicitudes = 0
+        self.bloqueadas = 0
+        self.por_motivo = {}
+        self.bytes_descargados = 0
+        self.bytes_ahorrados_est = 0
+
+    def registrar_bloqueo(self, motivo, tipo):
+        self.bloqueadas += 1
+        self.por_motivo[motivo] = self.por_motivo.get(motivo, 0) + 1
+        self.bytes_ahorrados_est += BYTES_ESTIMADOS_POR_TIPO.get(tipo, BYTES_ESTIMADOS_OTRO)
+
+    def registrar_respuesta(self, encabezados):
+        try:
+            self.bytes_descargados += int(encabezados.get("content-length", 0))
+        except (TypeError, ValueError):
+            pass
+
+    def resumen(self):
+        return {
+            "solicitudes": self.solicitudes,
+            "bloqueadas": self.bloqueadas,
+            "por_motivo": dict(self.por_motivo),
+            "bytes_descargados": self.bytes_descargados,
+            "bytes_ahorrados_est": self.bytes_ahorrados_est,
+        }
+
+
+POLITICA_PREDETERMINADA = PoliticaRecursos()
+
+
+def instalar_filtro(page, politica, medidor):
+    def manejar(route):
+        req = route.request
+        motivo = politica.motivo_bloqueo(req.resource_type, req.url)
+        if motivo:
+            medidor.registrar_bloqueo(motivo, req.resource_type)
+            route.abort()
+        else:
+            medidor.solicitudes += 1
+            route.continue_()
+
+    page.route("**/*", manejar)
+    page.on("response", lambda respuesta: medidor.registrar_respuesta(respuesta.headers))
+
+async def instalar_filtro_async(page, politica, medidor):
+    async def manejar(route):
+        req = route.request
+        motivo = politica.motivo_bloqueo(req.resource_type, req.url)
+        if motivo:
+            medidor.registrar_bloqueo(motivo, req.resource_type)
+            await route.abort()
+        else:
+            medidor.solicitudes += 1
+            await route.continue_()
+
+    await page.route("**/*", manejar)
+    page.on("response", lambda respuesta: medidor.registrar_respuesta(respuesta.headers))
+
+
+# -------------------------
+# TOPE DE NAVEGADORES
+# -------------------------
+class CupoNavegador:
+    """Uno de los ``lugares`` para un Chromium, compartidos por todos los procesos del servidor.
+
+    Cada lugar es un archivo en ``carpeta`` con un candado del sistema operativo, que se suelta al
+    cerrarlo o si el proceso muere. ``tomar`` (o ``tomar_async``) espera hasta que haya uno libre.
+    """
+
+    def __init__(self, carpeta=CARPETA_CUPOS, lugares=MAX_NAVEGADORES):
+        self.carpeta = carpeta
+        self.lugares = max(1, int(lugares))
+        self._archivo = None
+
+    def intentar(self):
+        if self._archivo is not None:
+            return True
+        os.makedirs(self.carpeta, exist_ok=True)
+        for num in range(self.lugares):
+            archivo = open(os.path.join(self.carpeta, f"navegador_{num}.lock"), "a+b")
+            try:
+                if fcntl is not None:
+                    fcntl.flock(archivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    archivo.seek(0)
+                    msvcrt.locking(archivo.fileno(), msvcrt.LK_NBLCK, 1)
+            except OSError:
+                archivo.close()
+                continue
+            self._archivo = archivo
+            return True
+        return False
+
+    def tomar(self):
+        with etapa("cupo_navegador"):
+            while not self.intentar():
+                time.sleep(ESPERA_CUPO)
+
+    async def tomar_async(self):
+        with etapa("cupo_navegador"):
+            while not self.intentar():
+                await asyncio.sleep(ESPERA_CUPO)
+
+    def soltar(self):
+        if self._archivo is None:
+            return
+        if fcntl is None:
+            try:
+                self._archivo.seek(0)
+                msvcrt.locking(self._archivo.fileno(), msvcrt.LK_UNLCK, 1)
+            except OSError:
+                pass
+        self._archivo.close()
+        self._archivo = None
+
+
+# -------------------------
+# SESIÓN DE NAVEGADOR
+# -------------------------
+class SesionNavegador:
+    """Un solo Chromium (contexto persistente) reutilizado durante todo un escaneo.
+
+    Se abre al pedir la primera página y se cierra con ``cerrar()`` o al salir del
+    bloque ``with``. Las páginas se reciclan cada ``usos_por_pagina`` vehículos o
+    cuando una consulta falla; si el navegador completo se cae, se relanza.
+    Como todo objeto de ``playwright.sync_api``, solo debe usarse desde el hilo
+    que la inició.
+
+    Con ``politica_recursos`` cada pestaña aborta las peticiones que la política
+    rechaza; lo bloqueado en cada consulta queda en ``red_por_url``. Antes de lanzar
+    Chromium espera un lugar del tope ``MAX_NAVEGADORES`` (ver ``CupoNavegador``).
+    """
+
+    def __init__(self, ver_navegador=False, ruta_memoria=RUTA_SESION, usos_por_pagina=USOS_POR_PAGINA,
+                 objetivo_comparables=OBJETIVO_COMPARABLES, max_paginas=MAX_PAGINAS,
+                 politica_recursos=POLITICA_PREDETERMINADA, red_por_url=None):
+        self.ver_navegador = ver_navegador
+        self.ruta_memoria = ruta_memoria
+        self.usos_por_pagina = usos_por_pagina
+        self.objetivo_comparables = objetivo_comparables
+        self.max_paginas = max(1, int(max_paginas))
+        self.politica_recursos = politica_recursos
+        self.red_por_url = red_por_url if red_por_url is not None else {}
+        self.medidor = MedidorRed()
+        self.paginas_recicladas = 0
+        self.reinicios = 0
+        self._cupo = CupoNavegador()
+        self._playwright = None
+        self._contexto = None
+        self._pagina = None
+        self._usos = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+        return False
+
+    @property
+    def activa(self):
+        return self._contexto is not None
+
+    def iniciar(self):
+        if self._contexto is not None:
+            return self
+        self._cupo.tomar()
+        with etapa("navegador_inicio"):
+            if self._playwright is None:
+                from playwright.sync_api import sync_playwright
+                self._playwright = sync_playwright().start()
+            try:
+                self._contexto = self._playwright.chromium.launch_persistent_context(
+                    user_data_dir=self.ruta_memoria,
+                    headless=not self.ver_navegador,
+                    viewport={"width": 1280, "height": 800},
+                    args=["--disable-blink-features=AutomationControlled"],
+                )
+            except Exception:
+                self._cupo.soltar()
+                raise
+            self._pagina = self._contexto.pages[0] if self._contexto.pages else self._contexto.new_page()
+            self._preparar(self._pagina)
+        self._usos = 0
+        return self
+
+    def _preparar(self, page):
+        if self.politica_recursos is not None:
+            instalar_filtro(page, self.politica_recursos, self.medidor)
+
+    @contextmanager
+    def pagina(self):
+        self.iniciar()
+        if self._pagina is None or self._pagina.is_closed() or self._usos >= self.usos_por_pagina:
+            self._reciclar_pagina()
+        try:
+            yield self._pagina
+        except Exception:
+            self._recuperar()
+            raise
+        finally:
+            self._usos += 1
+
+    def _reciclar_pagina(self):
+        # Se abre la nueva antes de cerrar la vieja para que el contexto nunca quede sin páginas.
+        nueva = self._contexto.new_page()
+        self._preparar(nueva)
+        if self._pagina is not None and not self._pagina.is_closed():
+            try:
+                self._pagina.close()
+            except Exception:
+                pass
+            self.paginas_recicladas += 1
+        self._pagina = nueva
+        self._usos = 0
+
+    def _recuperar(self):
+        try:
+            self._reciclar_pagina()
+        except Exception:
+            # El navegador completo murió: se cierra lo que quede y se relanza.
+            self._cerrar_contexto()
+            self.reinicios += 1
+            try:
+                self.iniciar()
+            except Exception:
+                pass
+
+    def _cerrar_contexto(self):
+        if self._contexto is not None:
+            try:
+                self._contexto.close()
+            except Exception:
+                pass
+        self._contexto = None
+        self._pagina = None
+        self._usos = 0
+        self._cupo.soltar()
+
+    def cerrar(self):
+        self._cerrar_contexto()
+        if self._playwright is not None:
+            try:
+                self._playwright.stop()
+            except Exception:
+                pass
+            self._playwright = None
+
+
+# -------------------------
+# ROBOT MERCADOLIBRE
+# -------------------------
+def preparar_consulta(marca, modelo, anio):
+    """Regresa ``(url, None)`` o ``(None, resultado_error)`` si los datos no alcanzan para buscar."""
+    if not marca or not modelo or not anio:
+        return None, (0, 0, "Datos incompletos", "", 0, 0, 0)
+
+    try:
+        anio_str = str(int(float(anio)))
+    except:
+        return None, (0, 0, "Error Año", "", 0, 0, 0)
+
+    return construir_url(marca, modelo, anio_str), None
+
+def esperar_listado(page):
+    try:
+        page.wait_for_selector(f"{SELECTOR_PRECIO}, {SELECTOR_SIN_RESULTADOS}", timeout=TIMEOUT_LISTADO_MS)
+    except Exception:
+        # Ni precios ni aviso de "sin resultados": se espera a que la red se calme y se lee lo que haya.
+        try:
+            page.wait_for_load_state("networkidle", timeout=TIMEOUT_LISTADO_MS)
+        except Exception:
+            pass
+
+def revisar_listado_vacio(url_final, avisos_sin_resultados):
+    """Primera página sin precios: si ML no dice "sin resultados", es un bloqueo o una página vacía."""
+    if avisos_sin_resultados:
+        return
+    if any(m in url_final.lower() for m in MARCAS_BLOQUEO):
+        raise ListadoBloqueado(url_final)
+    raise ListadoVacio(url_final)
+
+def siguiente_pagina(page):
+    enlace = page.locator(SELECTOR_SIGUIENTE).first
+    if enlace.count() == 0:
+        return None
+    href = enlace.get_attribute("href")
+    return urljoin(page.url, href) if href else None
+
+def extraer_precios(sesion, url):
+    precios = []
+    sesion.medidor.reiniciar()
+    with sesion.pagina() as page:
+        siguiente = url
+        for num_pagina in range(sesion.max_paginas):
+            try:
+                with etapa("goto"):
+                    page.goto(siguiente, timeout=30000, wait_until="domcontentloaded")
+                with etapa("espera_listado"):
+                    esperar_listado(page)
+                with etapa("extraccion"):
+                    nuevos = limpiar_precios(page.locator(SELECTOR_PRECIO).all_inner_texts())
+                    if num_pagina == 0 and not nuevos:
+                        revisar_listado_vacio(page.url, page.locator(SELECTOR_SIN_RESULTADOS).count())
+                    siguiente = siguiente_pagina(page) if nuevos else None
+            except Exception:
+                # Un fallo en páginas posteriores no tira lo ya juntado.
+                if num_pagina == 0:
+                    raise
+                break
+            precios.extend(nuevos)
+            if len(precios) >= sesion.objetivo_comparables or not siguiente:
+                break
+    if sesion.politica_recursos is not None:
+        sesion.red_por_url[url] = sesion.medidor.resumen()
+    return precios
+
+def precios_por_http(cliente_http, url, regulador=None):
+    """Intenta la consulta ligera; ``None`` indica que hay que recurrir al navegador.
+
+    Las fallas transitorias (bloqueo, tiempo, red) se reportan a ``regulador`` aunque el navegador
+    de respaldo sí responda; tras ``BLOQUEOS_HTTP_SEGUIDOS`` bloqueos seguidos el cliente se apaga.
+    """
+    if cliente_http is None or cliente_http.apagado:
+        return None
+    try:
+        with etapa("http"):
+            precios = cliente_http.extraer_precios(url)
+    except Exception as e:
+        tipo = tipo_falla(e)
+        if regulador is not None and tipo is not None:
+            regulador.fallo(tipo)
+        if tipo == "bloqueo":
+            cliente_http.bloqueos_seguidos += 1
+            if cliente_http.bloqueos_seguidos >= BLOQUEOS_HTTP_SEGUIDOS:
+                cliente_http.apagado = True
+                anotar(http_apagado=True)
+        return None
+    cliente_http.bloqueos_seguidos = 0
+    return precios
+
+def obtener_precios(sesion, url, cliente_http=None, regulador=None):
+    precios = precios_por_http(cliente_http, url, regulador)
+    if precios is not None:
+        anotar(fuente="http")
+        return precios
+    anotar(fuente="navegador")
+    return extraer_precios(sesion, url)
+
+def sumar_contadores(contadores, navegador=None, cliente_http=None):
+    """Acumula en ``contadores`` (dict) las pestañas recicladas y reinicios de Chromium y los bloqueos HTTP."""
+    if contadores is None:
+        return
+    for clave, valor in (
+        ("paginas_recicladas", getattr(navegador, "paginas_recicladas", 0)),
+        ("reinicios", getattr(navegador, "reinicios", 0)),
+        ("bloqueos_http", getattr(cliente_http, "bloqueos", 0)),
+    ):
+        contadores[clave] = contadores.get(clave, 0) + valor
+
+def texto_navegador(contadores):
+    """Una línea con los contadores de ``sumar_contadores`` (app y CLI), o None si todos están en 0."""
+    if not any((contadores or {}).values()):
+        return None
+    return (
+        f"Navegador: {contadores.get('paginas_recicladas', 0)} pestañas recicladas · "
+        f"{contadores.get('reinicios', 0)} reinicios · {contadores.get('bloqueos_http', 0)} bloqueos HTTP"
+    )
+
+def tipo_falla(e):
+    """Tipo de falla transitoria (ver ``regulador.TIPOS_FALLA``) o None si reintentar no ayudaría."""
+    if isinstance(e, ListadoBloqueado):
+        return "bloqueo"
+    if isinstance(e, ListadoVacio):
+        return "vacia"
+    nombre = type(e).__name__
+    if isinstance(e, (TimeoutError, asyncio.TimeoutError)) or "Timeout" in nombre:
+        return "tiempo"
+    # OSError cubre las de requests (y ConnectionError); Playwright las reporta como "net::ERR_...".
+    if isinstance(e, OSError) or "Connection" in nombre or "net::ERR_" in str(e):
+        return "red"
+    return None
+
+def describir_error(e, intentos=1):
+    tipo = tipo_falla(e)
+    if tipo == "bloqueo":
+        mensaje = "MercadoLibre bloqueó la consulta"
+    elif tipo == "vacia":
+        mensaje = "página sin precios ni aviso de sin resultados"
+    elif tipo == "tiempo":
+        mensaje = "tiempo de espera agotado"
+    elif tipo == "red":
+        mensaje = f"falla de red ({type(e).__name__})"
+    else:
+        detalle = (str(e).strip().splitlines() or [""])[0][:80]
+        mensaje = f"{type(e).__name__}: {detalle}" if detalle else type(e).__name__
+    if intentos > 1:
+        mensaje += f" ({intentos} intentos)"
+    return f"Error: {mensaje}"
+
+def consultar_con_reintentos(regulador, consulta):
+    """Corre ``consulta()`` al ritmo del regulador y reintenta las fallas transitorias.
+
+    Regresa ``(precios, None)``, o ``(None, mensaje)`` si falló el último intento.
+    """
+    intento = 1
+    while True:
+        with etapa("espera_tasa"):
+            espera = regulador.reservar()
+            while espera > 0:
+                time.sleep(espera)
+                espera = regulador.reservar()
+        try:
+            precios = consulta()
+        except Exception as e:
+            tipo = tipo_falla(e)
+            regulador.fallo(tipo)
+            if tipo is None or intento > regulador.reintentos:
+                anotar(intentos=intento)
+                return None, describir_error(e, intento)
+            with etapa("reintento"):
+                time.sleep(regulador.espera_reintento(intento, tipo))
+            intento += 1
+            continue
+        regulador.exito()
+        if intento > 1:
+            anotar(intentos=intento)
+        return precios, None
+
+def analizar_vehiculo(marca, modelo, anio, ver_navegador, sesion=None, cache=None, cliente_http=None,
+                      regulador=None):
+    """Resultado ``(sugerido, comparables, estado, url, minimo, maximo, mediana)`` de un auto.
+
+    Sin ``regulador`` la consulta sale de inmediato, aunque igual se reintenta si falla.
+    """
+    url, error = preparar_consulta(marca, modelo, anio)
+    if error:
+        return error
+
+    if cache is not None:
+        with etapa("cache"):
+            guardado = cache.obtener(url)
+        if guardado:
+            anotar(fuente="cache")
+            return resultado_desde_estadisticas(guardado, url)
+
+    # Sin sesión compartida se abre un navegador solo para esta consulta (y solo si hace falta).
+    sesion_propia = sesion is None
+    if sesion_propia:
+        sesion = SesionNavegador(ver_navegador)
+
+    if regulador is None:
+        regulador = ReguladorTasa()
+    try:
+        precios_brutos, error = consultar_con_reintentos(regulador, lambda: obtener_precios(sesion, url, cliente_http, regulador))
+    finally:
+        if sesion_propia:
+            sesion.cerrar()
+    if error:
+        return 0, 0, error, url, 0, 0, 0
+
+    with etapa("estadisticas"):
+        return resumir_precios(precios_brutos, url, cache)
+
+
+# -------------------------
+# MODO CONCURRENTE (ASYNC)
+# -------------------------
+class PoolPaginasAsync:
+    """Un Chromium (contexto persistente) con ``paginas`` pestañas que se reparten entre consultas simultáneas.
+
+    Igual que ``SesionNavegador``, cada pestaña se recicla tras ``usos_por_pagina`` consultas o cuando falla,
+    y aplica ``politica_recursos`` con su propio medidor de red; si el navegador completo se cae, se relanza
+    y las pestañas del navegador anterior se descartan al devolverlas. Como ella, toma un lugar de
+    ``CupoNavegador`` antes de lanzar Chromium; ``paginas`` no pasa de ``MAX_PESTANAS``.
+    """
+
+    def __init__(self, ver_navegador=False, paginas=3, ruta_memoria=RUTA_SESION, usos_por_pagina=USOS_POR_PAGINA,
+                 objetivo_comparables=OBJETIVO_COMPARABLES, max_paginas=MAX_PAGINAS,
+                 politica_recursos=POLITICA_PREDETERMINADA, red_por_url=None):
+        self.ver_navegador = ver_navegador
+        self.num_paginas = max(1, min(int(paginas), MAX_PESTANAS))
+        self.ruta_memoria = ruta_memoria
+        self.usos_por_pagina = usos_por_pagina
+        self.objetivo_comparables = objetivo_comparables
+        self.max_paginas = max(1, int(max_paginas))
+        self.politica_recursos = politica_recursos
+        self.red_por_url = red_por_url if red_por_url is not None else {}
+        self.paginas_recicladas = 0
+        self.reinicios = 0
+        self._playwright = None
+        self._contexto = None
+        self._libres = None
+        self._vigentes = set()
+        self._usos = {}
+        self._medidores = {}
+        self._candado_inicio = None
+        self._cupo = CupoNavegador()
+
+    async def __aenter__(self):
+        # Chromium se lanza hasta que alguna consulta pide una pestaña.
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.cerrar()
+        return False
+
+    async def iniciar(self):
+        if self._contexto is not None:
+            return self
+        await self._cupo.tomar_async()
+        with etapa("navegador_inicio"):
+            if self._playwright is None:
+                from playwright.async_api import async_playwright
+                self._playwright = await async_playwright().start()
+            try:
+                self._contexto = await self._playwright.chromium.launch_persistent_context(
+                    user_data_dir=self.ruta_memoria,
+                    headless=not self.ver_navegador,
+                    viewport={"width": 1280, "height": 800},
+                    args=["--disable-blink-features=AutomationControlled"],
+                )
+            except Exception:
+                self._cupo.soltar()
+                raise
+            self._libres = asyncio.Queue()
+            paginas = list(self._contexto.pages)
+            while len(paginas) < self.num_paginas:
+                paginas.append(await self._contexto.new_page())
+            for page in paginas[:self.num_paginas]:
+                await self._preparar(page)
+                self._libres.put_nowait(page)
+        return self
+
+    def _candado(self):
+        # Lanzar y relanzar Chromium pasa una sola vez aunque varias consultas lo pidan a la vez.
+        if self._candado_inicio is None:
+            self._candado_inicio = asyncio.Lock()
+        return self._candado_inicio
+
+    async def _preparar(self, page):
+        self._vigentes.add(id(page))
+        self._usos[id(page)] = 0
+        self._medidores[id(page)] = MedidorRed()
+        if self.politica_recursos is not None:
+            await instalar_filtro_async(page, self.politica_recursos, self._medidores[id(page)])
+
+    def medidor(self, page):
+        return self._medidores[id(page)]
+
+    @asynccontextmanager
+    async def pagina(self):
+        if self._contexto is None:
+            async with self._candado():
+                await self.iniciar()
+        page = await self._libres.get()
+        try:
+            if page.is_closed() or self._usos.get(id(page), 0) >= self.usos_por_pagina:
+                page = await self._reemplazar(page)
+            try:
+                yield page
+            except Exception:
+                page = await self._reemplazar(page)
+                raise
+            finally:
+                if id(page) in self._vigentes:
+                    self._usos[id(page)] += 1
+        finally:
+            # Una pestaña de un navegador que ya se relanzó no vuelve a repartirse.
+            if id(page) in self._vigentes:
+                self._libres.put_nowait(page)
+
+    async def _reemplazar(self, page):
+        if id(page) in self._vigentes:
+            try:
+                nueva = await self._contexto.new_page()
+            except Exception:
+                # El navegador completo murió: se cierra lo que quede y se relanza.
+                await self._relanzar(page)
+            else:
+                self._vigentes.discard(id(page))
+                self._usos.pop(id(page), None)
+                self._medidores.pop(id(page), None)
+                await self._preparar(nueva)
+                if not page.is_closed():
+                    try:
+                        await page.close()
+                    except Exception:
+                        pass
+                    self.paginas_recicladas += 1
+                return nueva
+        # La pestaña era del navegador anterior: se toma una del nuevo.
+        if self._contexto is None:
+            async with self._candado():
+                await self.iniciar()
+        return await self._libres.get()
+
+    async def _relanzar(self, page):
+        async with self._candado():
+            # Si otra consulta ya lo relanzó, la pestaña ya no está vigente y basta con el nuevo.
+            if id(page) in self._vigentes:
+                self.reinicios += 1
+                await self._cerrar_contexto()
+            await self.iniciar()
+
+    async def _cerrar_contexto(self):
+        self._vigentes.clear()
+        self._usos.clear()
+        self._medidores.clear()
+        if self._contexto is not None:
+            try:
+                await self._contexto.close()
+            except Exception:
+                pass
+            self._contexto = None
+        self._cupo.soltar()
+
+    async def cerrar(self):
+        await self._cerrar_contexto()
+        if self._playwright is not None:
+            try:
+                await self._playwright.stop()
+            except Exception:
+                pass
+            self._playwright = None
+
+
+async def esperar_listado_async(page):
+    try:
+        await page.wait_for_selector(f"{SELECTOR_PRECIO}, {SELECTOR_SIN_RESULTADOS}", timeout=TIMEOUT_LISTADO_MS)
+    except Exception:
+        try:
+            await page.wait_for_load_state("networkidle", timeout=TIMEOUT_LISTADO_MS)
+        except Exception:
+            pass
+
+async def siguiente_pagina_async(page):
+    enlace = page.locator(SELECTOR_SIGUIENTE).first
+    if await enlace.count() == 0:
+        return None
+    href = await enlace.get_attribute("href")
+    return urljoin(page.url, href) if href else None
+
+async def extraer_precios_async(pool, url):
+    precios = []
+    async with pool.pagina() as page:
+        medidor = pool.medidor(page)
+        medidor.reiniciar()
+        siguiente = url
+        for num_pagina in range(pool.max_paginas):
+            try:
+                with etapa("goto"):
+                    await page.goto(siguiente, timeout=30000, wait_until="domcontentloaded")
+                with etapa("espera_listado"):
+                    await esperar_listado_async(page)
+                with etapa("extraccion"):
+                    nuevos = limpiar_precios(await page.locator(SELECTOR_PRECIO).all_inner_texts())
+                    if num_pagina == 0 and not nuevos:
+                        revisar_listado_vacio(page.url, await page.locator(SELECTOR_SIN_RESULTADOS).count())
+                    siguiente = await siguiente_pagina_async(page) if nuevos else None
+            except Exception:
+                if num_pagina == 0:
+                    raise
+                break
+            precios.extend(nuevos)
+            if len(precios) >= pool.objetivo_comparables or not siguiente:
+                break
+        if pool.politica_recursos is not None:
+            pool.red_por_url[url] = medidor.resumen()
+    return precios
+
+async def consultar_con_reintentos_async(regulador, consulta):
+    """Igual que ``consultar_con_reintentos`` con ``consulta`` como corrutina."""
+    intento = 1
+    while True:
+        with etapa("espera_tasa"):
+            espera = regulador.reservar()
+            while espera > 0:
+                await asyncio.sleep(espera)
+                espera = regulador.reservar()
+        try:
+            precios = await consulta()
+        except Exception as e:
+            tipo = tipo_falla(e)
+            regulador.fallo(tipo)
+            if tipo is None or intento > regulador.reintentos:
+                anotar(intentos=intento)
+                return None, describir_error(e, intento)
+            with etapa("reintento"):
+                await asyncio.sleep(regulador.espera_reintento(intento, tipo))
+            intento += 1
+            continue
+        regulador.exito()
+        if intento > 1:
+            anotar(intentos=intento)
+        return precios, None
+
+async def analizar_vehiculo_async(marca, modelo, anio, pool, regulador, cache=None, cliente_http=None):
+    url, error = preparar_consulta(marca, modelo, anio)
+    if error:
+        return error
+
+    if cache is not None:
+        with etapa("cache"):
+            guardado = cache.obtener(url)
+        if guardado:
+            anotar(fuente="cache")
+            return resultado_desde_estadisticas(guardado, url)
+
+    async def consulta():
+        precios = None
+        if cliente_http is not None:
+            precios = await asyncio.to_thread(precios_por_http, cliente_http, url, regulador)
+        if precios is not None:
+            anotar(fuente="http")
+            return precios
+        anotar(fuente="navegador")
+        return await extraer_precios_async(pool, url)
+
+    precios_brutos, error = await consultar_con_reintentos_async(regulador, consulta)
+    if error:
+        return 0, 0, error, url, 0, 0, 0
+
+    with etapa("estadisticas"):
+        return resumir_precios(precios_brutos, url, cache)
+
+async def _analizar_lote(consultas, ver_navegador, concurrencia, regulador, al_terminar, cache, cliente_http,
+                         opciones_pool, resultados, contadores):
+    cupo = asyncio.Semaphore(concurrencia)
+
+    async with PoolPaginasAsync(ver_navegador, paginas=concurrencia, **opciones_pool) as pool:
+        async def una(pos, consulta):
+            marca, modelo, anio = consulta
+            async with cupo:
+                with vehiculo(marca=marca, modelo=modelo, anio=anio, posicion=pos):
+                    resultado = await analizar_vehiculo_async(marca, modelo, anio, pool, regulador, cache, cliente_http)
+                    anotar(url=resultado[3], estado=resultado[2])
+                return pos, resultado
+
+        tareas = [asyncio.ensure_future(una(pos, c)) for pos, c in enumerate(consultas)]
+        try:
+            for siguiente in asyncio.as_completed(tareas):
+                pos, resultado = await siguiente
+                resultados[pos] = resultado
+                if al_terminar:
+                    al_terminar(pos, resultado)
+        finally:
+            sumar_contadores(contadores, navegador=pool)
+
+def analizar_lote(consultas, ver_navegador, concurrencia=3, tasa=1.0, al_terminar=None, cache=None,
+                  modo_consulta=MODO_CONSULTA, regulador=None, contadores=None, **opciones_pool):
+    """Analiza ``(marca, modelo, anio)`` en paralelo y regresa los resultados en el orden de ``consultas``.
+
+    Las consultas salen al ritmo de ``regulador`` (uno nuevo que arranca en ``tasa`` si no se pasa).
+
+    ``al_terminar(posicion, resultado)`` se llama en el hilo que invoca, conforme termina cada consulta.
+    Si el lote se cae, lo que no alcanzó a terminar regresa como error sin pasar por ``al_terminar``
+    (no se consultó); un ``EscaneoDetenido`` se propaga tal cual.
+    ``opciones_pool`` se pasa a ``PoolPaginasAsync`` (p. ej. ``objetivo_comparables``, ``max_paginas``).
+    Con ``contadores`` (dict) se acumulan ahí las cifras del navegador y del cliente HTTP
+    (ver ``sumar_contadores``).
+    """
+    resultados = [None] * len(consultas)
+    if not consultas:
+        return resultados
+
+    if regulador is None:
+        regulador = ReguladorTasa(tasa)
+    cliente_http = None
+    if modo_consulta == "http":
+        cliente_http = ClienteHttp(
+            objetivo_comparables=opciones_pool.get("objetivo_comparables", OBJETIVO_COMPARABLES),
+            max_paginas=opciones_pool.get("max_paginas", MAX_PAGINAS),
+        )
+
+    try:
+        asyncio.run(
+            _analizar_lote(consultas, ver_navegador, concurrencia, regulador, al_terminar, cache, cliente_http,
+                           opciones_pool, resultados, contadores)
+        )
+    except EscaneoDetenido:
+        raise
+    except Exception as e:
+        # Lo que no alcanzó a terminar se reporta como error igual que en modo secuencial.
+        for pos, (marca, modelo, anio) in enumerate(consultas):
+            if resultados[pos] is not None:
+                continue
+            url, error = preparar_consulta(marca, modelo, anio)
+            resultados[pos] = error or (0, 0, describir_error(e), url, 0, 0, 0)
+    finally:
+        sumar_contadores(contadores, cliente_http=cliente_http)
+        if cliente_http is not None:
+            cliente_http.cerrar()
+    return resultados
@@ -0,0 +1,234 @@
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from cache_mercado import CacheMercado
+from catalogo import RUTA_AUTOPRECIOS, indice_catalogo
+from escaneo import cargar_inventario, preparar_inventario
+from historial import HistorialPrecios
+from mercado_ml import MODOS_CONSULTA, ClienteHttp, SesionNavegador, analizar_vehiculo, construir_url, normalizar_para_url
+from regulador import ReguladorTasa
+
+# -------------------------
+# CONFIGURACIÓN PRECARGA
+# -------------------------
+RUTA_ESTADO_PRECARGA = os.path.join(os.getcwd(), "precarga_mercado.json")
+
+# Horas (inicio, fin) en que se permite precargar; puede cruzar la medianoche, p. ej. (22, 5).
+HORARIO_PRECARGA = (1, 6)
+PRESUPUESTO_MINUTOS = 240
+
+# Lo consultado hace menos de esto no se vuelve a consultar en la siguiente precarga.
+REFRESCAR_HORAS = 20
+
+# Ventana del historial que cuenta para ordenar los modelos por frecuencia.
+DIAS_FRECUENCIA = 180
+
+
+# -------------------------
+# PLAN: QUÉ CONSULTAR Y EN QUÉ ORDEN
+# -------------------------
+def clave_modelo(auto, anio):
+    # "Marca Submarca" del catálogo y "Auto" del historial/inventario coinciden así normalizados.
+    return normalizar_para_url(str(auto)), str(anio)
+
+def combinaciones_catalogo(indice):
+    """(marca, submarca, año) distintos del catálogo, como los ofrece "Cotizar compra"."""
+    return [
+        (marca, submarca, anio)
+        for marca in indice.marcas()
+        for submarca in indice.submarcas(marca)
+        for anio in indice.anios(marca, submarca)
+    ]
+
+def frecuencias(historial=None, inventarios=(), dias=DIAS_FRECUENCIA):
+    """Veces que aparece cada modelo (``clave_modelo``) en el historial y en los inventarios ``(df, cols)``."""
+    conteo = {}
+    if historial is not None:
+        for auto, anio, veces in historial.frecuencia_modelos(dias).itertuples(index=False):
+            clave = clave_modelo(auto, anio)
+            conteo[clave] = conteo.get(clave, 0) + int(veces)
+    for df, cols in inventarios:
+        prep = preparar_inventario(df, cols)
+        for (auto, anio), veces in prep.groupby(["auto", "anio"]).size().items():
+            clave = clave_modelo(auto, anio)
+            conteo[clave] = conteo.get(clave, 0) + int(veces)
+    return conteo
+
+def planear(indice, conteo, cache, refrescar_horas=REFRESCAR_HORAS):
+    """Combinaciones del catálogo por consultar, de la más frecuente a la menos.
+
+    Las que nunca aparecieron quedan al final, de la más nueva a la más vieja; las que el caché
+    tiene de hace menos de ``refrescar_horas`` se omiten.
+    """
+    plan = pd.DataFrame(combinaciones_catalogo(indice), columns=["marca", "submarca", "anio"])
+    if plan.empty:
+        return plan.assign(url=[], veces=[], creado=[])
+    plan["url"] = [construir_url(m, s, a) for m, s, a in plan.itertuples(index=False)]
+    plan["veces"] = [conteo.get(clave_modelo(f"{m} {s}", a), 0) for m, s, a, _ in plan.itertuples(index=False)]
+    creados = cache.creados(plan["url"])
+    plan["creado"] = plan["url"].map(creados)
+    limite = time.time() - refrescar_horas * 3600
+    plan = plan[~(plan["creado"] >= limite)]
+    # Una búsqueda por URL (dos submarcas pueden normalizarse igual).
+    plan = plan.sort_values(["veces", "anio"], ascending=False, kind="stable").drop_duplicates("url")
+    return plan.reset_index(drop=True)
+
+
+# -------------------------
+# HORARIO
+# -------------------------
+def en_horario(momento, horario=HORARIO_PRECARGA):
+    inicio, fin = horario
+    if inicio <= fin:
+        return inicio <= momento.hour < fin
+    return momento.hour >= inicio or momento.hour < fin
+
+def proximo(momento, hora):
+    """Siguiente ``hora``:00 después de ``momento``."""
+    objetivo = momento.replace(hour=hora, minute=0, second=0, microsecond=0)
+    return objetivo if objetivo > momento else objetivo + timedelta(days=1)
+
+
+# -------------------------
+# PRECARGA
+# -------------------------
+def precalentar(plan, presupuesto_segundos, tasa=0.5, modo_consulta="http", ver_navegador=False,
+                cache=None, al_avanzar=None):
+    """Consulta las combinaciones de ``plan`` en orden hasta agotar el tiempo; guarda en el caché.
+
+    Regresa un resumen con lo consultado, lo que quedó pendiente y el estado del regulador.
+    """
+    inicio = time.monotonic()
+    limite = inicio + presupuesto_segundos
+    if cache is None:
+        cache = CacheMercado()
+    regulador = ReguladorTasa(tasa)
+    consultadas = exitosas = 0
+
+    cliente_http = ClienteHttp() if modo_consulta == "http" else None
+    try:
+        with SesionNavegador(ver_navegador) as sesion:
+            for marca, submarca, anio in plan[["marca", "submarca", "anio"]].itertuples(index=False):
+                if time.monotonic() >= limite:
+                    break
+                resultado = analizar_vehiculo(
+                    marca, submarca, anio, ver_navegador,
+                    sesion=sesion, cache=cache, cliente_http=cliente_http, regulador=regulador,
+                )
+                consultadas += 1
+                exitosas += resultado[2] == "Exitoso"
+                if al_avanzar:
+                    al_avanzar(consultadas, len(plan), resultado)
+    finally:
+        if cliente_http is not None:
+            cliente_http.cerrar()
+
+    return {
+        "fecha": time.strftime("%Y-%m-%d %H:%M"),
+        "planeadas": len(plan),
+        "consultadas": consultadas,
+        "exitosas": exitosas,
+        "pendientes": len(plan) - consultadas,
+        "segundos": round(time.monotonic() - inicio, 1),
+        "regulador": regulador.estado(),
+    }
+
+def guardar_estado(resumen, ruta=RUTA_ESTADO_PRECARGA):
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump(resumen, f, ensure_ascii=False)
+
+def leer_estado(ruta=RUTA_ESTADO_PRECARGA):
+    """Resumen de la última precarga, o None si nunca ha corrido."""
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# -------------------------
+# LÍNEA DE COMANDOS (cron o proceso continuo)
+# -------------------------
+def crear_parser():
+    parser = argparse.ArgumentParser(
+        prog="precarga",
+        description="Precarga en el caché los precios de mercado del catálogo AUTOPRECIOS, en horario de poca carga.",
+    )
+    parser.add_argument("--catalogo", default=RUTA_AUTOPRECIOS, help="Catálogo AUTOPRECIOS (.xls).")
+    parser.add_argument("--inventario", action="append", default=[],
+                        help="Inventario que también cuenta para el orden (se puede repetir).")
+    parser.add_argument("--presupuesto", type=float, default=PRESUPUESTO_MINUTOS, help="Minutos máximos por corrida.")
+    parser.add_argument("--horario", default=f"{HORARIO_PRECARGA[0]}-{HORARIO_PRECARGA[1]}",
+                        help="Horas permitidas, p. ej. 1-6 o 22-5.")
+    parser.add_argument("--forzar", action="store_true", help="Corre ya aunque esté fuera de horario.")
+    parser.add_argument("--continuo", action="store_true", help="No termina: espera cada noche el horario y precarga.")
+    parser.add_argument("--refrescar-horas", type=float, default=REFRESCAR_HORAS,
+                        help="Omite lo consultado hace menos de estas horas.")
+    parser.add_argument("--tasa", type=float, default=0.5, help="Consultas por segundo al arrancar.")
+    parser.add_argument("--modo", choices=MODOS_CONSULTA, default="http", help="Modo de consulta.")
+    parser.add_argument("--ver-navegador", action="store_true", help="Muestra la ventana de Chromium.")
+    return parser
+
+def correr(args, fin=None):
+    indice = indice_catalogo(args.catalogo)
+    inventarios = []
+    for ruta in args.inventario:
+        with open(ruta, "rb") as f:
+            inventarios.append(cargar_inventario(f.read(), nombre=ruta))
+    # Con esta vigencia, lo que el plan incluye por viejo sí se vuelve a consultar.
+    cache = CacheMercado(ttl_horas=args.refrescar_horas)
+    plan = planear(indice, frecuencias(HistorialPrecios(), inventarios), cache, args.refrescar_horas)
+
+    presupuesto = args.presupuesto * 60
+    if fin is not None:
+        presupuesto = min(presupuesto, (fin - datetime.now()).total_seconds())
+    print(f"{len(plan)} combinaciones por consultar; presupuesto {presupuesto / 60:.0f} min.", file=sys.stderr, flush=True)
+
+    def al_avanzar(hechas, total, resultado):
+        if hechas % 25 == 0 or hechas == total:
+            print(f"{hechas}/{total} · {resultado[2]}", file=sys.stderr, flush=True)
+
+    resumen = precalentar(plan, presupuesto, args.tasa, args.modo, args.ver_navegador, cache, al_avanzar)
+    guardar_estado(resumen)
+    print(
+        f"Listo: {resumen['exitosas']}/{resumen['consultadas']} con precios, {resumen['pendientes']} pendientes.",
+        file=sys.stderr,
+        flush=True,
+    )
+
+def main(argv=None):
+    parser = crear_parser()
+    args = parser.parse_args(argv)
+    if args.tasa <= 0:
+        parser.error("--tasa debe ser mayor que 0.")
+    horario = tuple(int(h) for h in args.horario.split("-"))
+
+    if not args.continuo:
+        if not args.forzar and not en_horario(datetime.now(), horario):
+            print(f"Fuera del horario de precarga ({args.horario} h); usa --forzar para correr ya.", file=sys.stderr)
+            return 0
+        correr(args, None if args.forzar else proximo(datetime.now(), horario[1]))
+        return 0
+
+    while True:
+        ahora = datetime.now()
+        if not en_horario(ahora, horario):
+            time.sleep((proximo(ahora, horario[0]) - ahora).total_seconds())
+            continue
+        try:
+            correr(args, proximo(datetime.now(), horario[1]))
+        except Exception as e:
+            print(f"Precarga fallida: {e}", file=sys.stderr, flush=True)
+        # Una corrida por noche: se espera al siguiente inicio de horario.
+        ahora = datetime.now()
+        time.sleep((proximo(ahora, horario[0]) - ahora).total_seconds())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+import random
+import threading
+import time
+from collections import deque
+
+# -------------------------
+# CONFIGURACIÓN REGULADOR
+# -------------------------
+# Consultas por segundo entre las que se mueve la tasa (AIMD: sube de a poco, baja a la mitad);
+# la tasa con que se crea el regulador siempre queda dentro de los límites (ver ``ReguladorTasa``).
+TASA_MINIMA = 0.1
+TASA_MAXIMA = 4.0
+INCREMENTO_TASA = 0.05
+FACTOR_RECORTE = 0.5
+
+# Reintentos por consulta ante fallas transitorias; la espera se duplica en cada intento, con azar.
+REINTENTOS = 3
+ESPERA_BASE = 2.0
+ESPERA_MAXIMA = 60.0
+
+# El circuito se abre si en las últimas VENTANA_CIRCUITO consultas falla al menos UMBRAL_CIRCUITO;
+# la pausa se duplica cada vez que vuelve a abrirse sin una consulta buena de por medio.
+VENTANA_CIRCUITO = 20
+MUESTRAS_MINIMAS = 8
+UMBRAL_CIRCUITO = 0.5
+PAUSA_CIRCUITO = 60.0
+PAUSA_MAXIMA = 15 * 60.0
+
+# Tipos de falla transitoria; "bloqueo" (captcha, 403/429) recorta la tasa el doble.
+TIPOS_FALLA = ("tiempo", "red", "vacia", "bloqueo")
+
+
+class ReguladorTasa:
+    """Ritmo adaptable de consultas a MercadoLibre, con reintentos y cortacircuitos.
+
+    ``reservar()`` dice cuántos segundos esperar antes de la siguiente consulta (0 = ya puede
+    salir). Cada consulta buena (``exito``) sube la tasa un poco; cada falla transitoria
+    (``fallo``) la recorta. Si en las últimas consultas fallan demasiadas, el circuito se abre y
+    ninguna consulta sale durante la pausa; al terminar sale una sola de prueba, que lo cierra si
+    funciona o lo vuelve a abrir con una pausa del doble si falla.
+
+    La tasa arranca en ``tasa`` y se mueve entre ``tasa_minima`` y ``tasa_maxima``; sin esos
+    límites se usan ``TASA_MINIMA`` y ``TASA_MAXIMA``, ampliados para que incluyan ``tasa``
+    (la tasa configurada nunca se recorta en silencio).
+
+    Es seguro desde varios hilos y desde tareas de asyncio (nunca bloquea: solo calcula esperas).
+    """
+
+    def __init__(self, tasa=1.0, tasa_minima=None, tasa_maxima=None, reintentos=REINTENTOS,
+                 al_abrir=None, reloj=time.monotonic):
+        tasa = float(tasa)
+        if tasa <= 0:
+            raise ValueError(f"La tasa debe ser mayor que 0 consultas por segundo (se pidió {tasa}).")
+        self.tasa_minima = float(tasa_minima) if tasa_minima is not None else min(TASA_MINIMA, tasa)
+        self.tasa_maxima = float(tasa_maxima) if tasa_maxima is not None else max(TASA_MAXIMA, tasa)
+        self.tasa_maxima = max(self.tasa_maxima, self.tasa_minima)
+        self.tasa = min(max(tasa, self.tasa_minima), self.tasa_maxima)
+        self.reintentos = max(0, int(reintentos))
+        self.al_abrir = al_abrir
+        self._reloj = reloj
+        self._candado = threading.Lock()
+        self._siguiente = 0.0
+        self._ventana = deque(maxlen=VENTANA_CIRCUITO)
+        self._circuito = "cerrado"
+        self._abierto_hasta = 0.0
+        self._pausa = PAUSA_CIRCUITO
+        self._sonda_en_curso = False
+        self.consultas = 0
+        self.exitos = 0
+        self.reintentos_hechos = 0
+        self.aperturas = 0
+        self.fallos = {tipo: 0 for tipo in TIPOS_FALLA + ("otro",)}
+
+    def reservar(self):
+        """0 si la siguiente consulta puede salir ya (y la cuenta); si no, segundos a esperar."""
+        with self._candado:
+            ahora = self._reloj()
+            if self._circuito == "abierto":
+                if ahora < self._abierto_hasta:
+                    return self._abierto_hasta - ahora
+                self._circuito = "prueba"
+            if self._circuito == "prueba" and self._sonda_en_curso:
+                return min(1.0, 1.0 / self.tasa)
+            if ahora < self._siguiente:
+                return self._siguiente - ahora
+            self._siguiente = ahora + 1.0 / self.tasa
+            self._sonda_en_curso = self._circuito == "prueba"
+            self.consultas += 1
+            return 0.0
+
+    def exito(self):
+        with self._candado:
+            self.exitos += 1
+            self._ventana.append(False)
+            self.tasa = min(self.tasa_maxima, self.tasa + INCREMENTO_TASA)
+            if self._circuito == "prueba":
+                self._circuito = "cerrado"
+                self._sonda_en_curso = False
+                self._pausa = PAUSA_CIRCUITO
+
+    def fallo(self, tipo):
+        """Registra una consulta fallida; ``tipo`` None es un error que no tiene que ver con el sitio."""
+        abrio = False
+        with self._candado:
+            if tipo not in TIPOS_FALLA:
+                self.fallos["otro"] += 1
+                if self._circuito == "prueba":
+                    self._sonda_en_curso = False
+                return
+            self.fallos[tipo] += 1
+            self._ventana.append(True)
+            recorte = FACTOR_RECORTE ** (2 if tipo == "bloqueo" else 1)
+            self.tasa = max(self.tasa_minima, self.tasa * recorte)
+            errores = sum(self._ventana)
+            if self._circuito == "prueba" or (
+                self._circuito == "cerrado"
+                and len(self._ventana) >= MUESTRAS_MINIMAS
+                and errores / len(self._ventana) >= UMBRAL_CIRCUITO
+            ):
+                self._abrir()
+                abrio = True
+        if abrio and self.al_abrir:
+            self.al_abrir(self.estado())
+
+    def _abrir(self):
+        # Con el candado tomado.
+        if self._circuito == "prueba":
+            self._pausa = min(self._pausa * 2, PAUSA_MAXIMA)
+        self._circuito = "abierto"
+        self._abierto_hasta = self._reloj() + self._pausa
+        self._siguiente = self._abierto_hasta
+        self._sonda_en_curso = False
+        self._ventana.clear()
+        self.tasa = self.tasa_minima
+        self.aperturas += 1
+
+    def espera_reintento(self, intento, tipo=None):
+        """Segundos antes del reintento número ``intento`` (1, 2, ...): exponencial con azar."""
+        with self._candado:
+            self.reintentos_hechos += 1
+        base = ESPERA_BASE * (2 if tipo == "bloqueo" else 1)
+        return min(ESPERA_MAXIMA, base * 2 ** (intento - 1)) * random.uniform(0.5, 1.5)
+
+    def estado(self):
+        with self._candado:
+            pausa = max(0.0, self._abierto_hasta - self._reloj()) if self._circuito == "abierto" else 0.0
+            return {
+                "tasa": round(self.tasa, 3),
+                "consultas": self.consultas,
+                "exitos": self.exitos,
+                "reintentos": self.reintentos_hechos,
+                "fallos": dict(self.fallos),
+                "circuito": self._circuito,
+                "aperturas": self.aperturas,
+                "pausa_restante": round(pausa, 1),
+            }
+
+
+def texto_regulador(estado):
+    """Una línea con la tasa, los reintentos y las fallas de un ``estado()`` (app y CLI)."""
+    fallas = sum(estado["fallos"].values())
+    texto = f"{estado['tasa']:.2f} consultas/s · {estado['reintentos']} reintentos · {fallas} fallas"
+    if estado["aperturas"]:
+        texto += f" · {estado['aperturas']} pausas por errores"
+    return texto
+
+def combinar_estados(estados):
+    """Suma los contadores de varios reguladores (uno por proceso); la tasa es la suma de tasas."""
+    estados = [e for e in estados if e]
+    if not estados:
+        return None
+    return {
+        "tasa": round(sum(e["tasa"] for e in estados), 3),
+        "consultas": sum(e["consultas"] for e in estados),
+        "exitos": sum(e["exitos"] for e in estados),
+        "reintentos": sum(e["reintentos"] for e in estados),
+        "fallos": {t: sum(e["fallos"].get(t, 0) for e in estados) for t in estados[0]["fallos"]},
+        "circuito": "abierto" if any(e["circuito"] == "abierto" for e in estados) else "cerrado",
+        "aperturas": sum(e["aperturas"] for e in estados),
+        "pausa_restante": max(e["pausa_restante"] for e in estados),
+    }
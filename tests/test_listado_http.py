@@ -0,0 +1,135 @@
+import os
+
+import pytest
+
+from mercado_ml import BLOQUEOS_HTTP_SEGUIDOS, ClienteHttp, ListadoBloqueado, parsear_listado, precios_por_http
+from regulador import ReguladorTasa
+
+CARPETA_FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+URL_LISTADO = "https://autos.mercadolibre.com.mx/nissan/versa/2020_NoIndex_True?VIEW=list"
+URL_PAGINA_2 = "https://autos.mercadolibre.com.mx/nissan/versa/2020_Desde_49_NoIndex_True?VIEW=list&orden=relevancia"
+
+
+def leer_fixture(nombre):
+    with open(os.path.join(CARPETA_FIXTURES, nombre), encoding="utf-8") as f:
+        return f.read()
+
+
+class ClienteFixtures(ClienteHttp):
+    """``ClienteHttp`` que responde con páginas guardadas en lugar de descargar."""
+
+    def __init__(self, paginas, **opciones):
+        super().__init__(**opciones)
+        self.paginas = paginas
+        self.descargadas = []
+
+    def descargar(self, url):
+        self.descargadas.append(url)
+        return leer_fixture(self.paginas[url]), url
+
+
+# -------------------------
+# parsear_listado
+# -------------------------
+def test_precios_del_marcado():
+    precios, siguiente, sin_resultados = parsear_listado(leer_fixture("listado_precios.html"))
+    # El accesorio de $3,500 queda fuera del rango de precios de autos.
+    assert precios == [215000, 198500, 239900]
+    assert not sin_resultados
+
+def test_enlace_siguiente_pagina():
+    _, siguiente, _ = parsear_listado(leer_fixture("listado_precios.html"))
+    assert siguiente == URL_PAGINA_2
+
+def test_ultima_pagina_sin_siguiente():
+    precios, siguiente, _ = parsear_listado(leer_fixture("listado_pagina2.html"))
+    assert precios == [205000, 221000]
+    assert siguiente is None
+
+def test_precios_del_json_embebido():
+    precios, siguiente, sin_resultados = parsear_listado(leer_fixture("listado_json.html"))
+    assert precios == [289000, 265500, 312000]
+    assert siguiente is None
+    assert not sin_resultados
+
+def test_aviso_sin_resultados():
+    precios, siguiente, sin_resultados = parsear_listado(leer_fixture("listado_sin_resultados.html"))
+    assert precios == []
+    assert siguiente is None
+    assert sin_resultados
+
+def test_pagina_de_bloqueo_sin_precios():
+    precios, siguiente, sin_resultados = parsear_listado(leer_fixture("bloqueo_captcha.html"))
+    assert precios == []
+    assert siguiente is None
+    assert not sin_resultados
+
+
+# -------------------------
+# ClienteHttp.extraer_precios
+# -------------------------
+def test_sigue_la_siguiente_pagina():
+    cliente = ClienteFixtures({URL_LISTADO: "listado_precios.html", URL_PAGINA_2: "listado_pagina2.html"})
+    assert cliente.extraer_precios(URL_LISTADO) == [215000, 198500, 239900, 205000, 221000]
+    assert cliente.descargadas == [URL_LISTADO, URL_PAGINA_2]
+
+def test_se_detiene_al_juntar_comparables():
+    cliente = ClienteFixtures(
+        {URL_LISTADO: "listado_precios.html", URL_PAGINA_2: "listado_pagina2.html"}, objetivo_comparables=3
+    )
+    assert cliente.extraer_precios(URL_LISTADO) == [215000, 198500, 239900]
+    assert cliente.descargadas == [URL_LISTADO]
+
+def test_respeta_max_paginas():
+    cliente = ClienteFixtures(
+        {URL_LISTADO: "listado_precios.html", URL_PAGINA_2: "listado_pagina2.html"}, max_paginas=1
+    )
+    assert cliente.extraer_precios(URL_LISTADO) == [215000, 198500, 239900]
+
+def test_precios_del_json_por_http():
+    cliente = ClienteFixtures({URL_LISTADO: "listado_json.html"})
+    assert cliente.extraer_precios(URL_LISTADO) == [289000, 265500, 312000]
+
+def test_sin_resultados_regresa_lista_vacia():
+    cliente = ClienteFixtures({URL_LISTADO: "listado_sin_resultados.html"})
+    assert cliente.extraer_precios(URL_LISTADO) == []
+    assert precios_por_http(cliente, URL_LISTADO) == []
+
+def test_captcha_recurre_al_navegador():
+    cliente = ClienteFixtures({URL_LISTADO: "bloqueo_captcha.html"})
+    with pytest.raises(ListadoBloqueado):
+        cliente.extraer_precios(URL_LISTADO)
+    # precios_por_http convierte el bloqueo en None: la consulta sigue en Chromium.
+    assert precios_por_http(cliente, URL_LISTADO) is None
+
+def test_pagina_sin_precios_ni_aviso_recurre_al_navegador():
+    # Una página que cargó sin precios, sin aviso de "sin resultados" y sin marcas de bloqueo.
+    vacia = leer_fixture("listado_pagina2.html").replace("andes-money-amount__fraction", "precio-oculto")
+    cliente = ClienteHttp()
+    cliente.descargar = lambda url: (vacia, url)
+    assert cliente.extraer_precios(URL_LISTADO) is None
+
+def test_bloqueo_http_se_reporta_al_regulador():
+    regulador = ReguladorTasa(2.0)
+    cliente = ClienteFixtures({URL_LISTADO: "bloqueo_captcha.html"})
+    assert precios_por_http(cliente, URL_LISTADO, regulador) is None
+    assert regulador.estado()["fallos"]["bloqueo"] == 1
+    assert regulador.estado()["tasa"] < 2.0
+
+def test_bloqueos_seguidos_apagan_el_cliente_http():
+    cliente = ClienteFixtures({URL_LISTADO: "bloqueo_captcha.html", URL_PAGINA_2: "listado_pagina2.html"})
+    for _ in range(BLOQUEOS_HTTP_SEGUIDOS):
+        assert precios_por_http(cliente, URL_LISTADO) is None
+    assert cliente.apagado
+    # Apagado, ya ni siquiera descarga: el resto del escaneo va directo al navegador.
+    assert precios_por_http(cliente, URL_PAGINA_2) is None
+    assert cliente.descargadas == [URL_LISTADO] * BLOQUEOS_HTTP_SEGUIDOS
+
+def test_una_respuesta_buena_reinicia_los_bloqueos_seguidos():
+    cliente = ClienteFixtures({URL_LISTADO: "bloqueo_captcha.html", URL_PAGINA_2: "listado_pagina2.html"})
+    for _ in range(BLOQUEOS_HTTP_SEGUIDOS - 1):
+        precios_por_http(cliente, URL_LISTADO)
+    assert precios_por_http(cliente, URL_PAGINA_2) == [205000, 221000]
+    precios_por_http(cliente, URL_LISTADO)
+    assert not cliente.apagado
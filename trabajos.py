@@ -0,0 +1,250 @@
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+import pandas as pd
+
+from checkpoints import BitacoraEscaneo, hash_inventario
+from escaneo import cargar_inventario, ejecutar_escaneo, filas_a_escanear, guardar_historial
+from mercado_ml import EscaneoDetenido
+
+# -------------------------
+# CONFIGURACIÓN COLA
+# -------------------------
+RUTA_TRABAJOS = os.path.join(os.getcwd(), "trabajos_daytona.db")
+CARPETA_INVENTARIOS = os.path.join(os.getcwd(), "trabajos_inventarios")
+BITACORA_TRABAJADOR = os.path.join(os.getcwd(), "trabajador_daytona.log")
+
+# Un trabajador que no late en este tiempo se da por muerto y sus trabajos vuelven a la cola.
+LATIDO_SEGUNDOS = 5
+TRABAJADOR_MUERTO_SEGUNDOS = 30
+ESPERA_COLA_VACIA = 2
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS trabajos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nombre TEXT NOT NULL,
+    estado TEXT NOT NULL DEFAULT 'pendiente',
+    archivo TEXT NOT NULL,
+    sucursal TEXT,
+    prueba INTEGER NOT NULL DEFAULT 0,
+    opciones TEXT NOT NULL,
+    hechos INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    creado REAL NOT NULL,
+    iniciado REAL,
+    terminado REAL,
+    pid INTEGER,
+    error TEXT,
+    resultado TEXT,
+    info TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_trabajos_estado ON trabajos (estado, id);
+CREATE TABLE IF NOT EXISTS trabajadores (
+    pid INTEGER PRIMARY KEY,
+    latido REAL NOT NULL
+);
+"""
+
+
+@contextmanager
+def conectar(ruta=RUTA_TRABAJOS):
+    con = sqlite3.connect(ruta, timeout=30, isolation_level=None)
+    con.row_factory = sqlite3.Row
+    try:
+        con.execute("PRAGMA journal_mode=WAL")
+        con.executescript(ESQUEMA)
+        yield con
+    finally:
+        con.close()
+
+
+# -------------------------
+# LADO DE LA APP
+# -------------------------
+def encolar(contenido, nombre, sucursal, prueba, opciones, ruta=RUTA_TRABAJOS):
+    """Guarda una copia del inventario subido y registra un trabajo pendiente; regresa su id."""
+    os.makedirs(CARPETA_INVENTARIOS, exist_ok=True)
+    archivo = os.path.join(CARPETA_INVENTARIOS, f"{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}_{time.time_ns()}.xlsx")
+    with open(archivo, "wb") as f:
+        f.write(contenido)
+
+    with conectar(ruta) as con:
+        cur = con.execute(
+            "INSERT INTO trabajos (nombre, archivo, sucursal, prueba, opciones, creado) VALUES (?, ?, ?, ?, ?, ?)",
+            (nombre, archivo, sucursal, int(bool(prueba)), json.dumps(opciones), time.time()),
+        )
+        return cur.lastrowid
+
+def listar(limite=20, ruta=RUTA_TRABAJOS):
+    with conectar(ruta) as con:
+        filas = con.execute(
+            "SELECT id, nombre, estado, sucursal, prueba, hechos, total, creado, iniciado, terminado, error "
+            "FROM trabajos ORDER BY id DESC LIMIT ?",
+            (limite,),
+        ).fetchall()
+    return [dict(f) for f in filas]
+
+def resultado(id_trabajo, ruta=RUTA_TRABAJOS):
+    """Filas del reporte y ``info`` de un trabajo terminado, o ``(None, None)``."""
+    with conectar(ruta) as con:
+        fila = con.execute("SELECT resultado, info FROM trabajos WHERE id = ?", (id_trabajo,)).fetchone()
+    if fila is None or fila["resultado"] is None:
+        return None, None
+    return pd.DataFrame(json.loads(fila["resultado"])), json.loads(fila["info"] or "{}")
+
+def cancelar(id_trabajo, ruta=RUTA_TRABAJOS):
+    """Cancela un trabajo en cola o en proceso; el trabajador lo suelta en su siguiente avance."""
+    with conectar(ruta) as con:
+        return con.execute(
+            "UPDATE trabajos SET estado = 'cancelado', terminado = ? "
+            "WHERE id = ? AND estado IN ('pendiente', 'en_proceso')",
+            (time.time(), id_trabajo),
+        ).rowcount > 0
+
+def trabajador_activo(ruta=RUTA_TRABAJOS):
+    with conectar(ruta) as con:
+        fila = con.execute("SELECT MAX(latido) FROM trabajadores").fetchone()
+    return fila[0] is not None and time.time() - fila[0] < TRABAJADOR_MUERTO_SEGUNDOS
+
+def asegurar_trabajador(ruta=RUTA_TRABAJOS):
+    """Lanza el proceso trabajador en segundo plano si no hay uno vivo."""
+    if trabajador_activo(ruta):
+        return False
+    with open(BITACORA_TRABAJADOR, "ab") as bitacora:
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__)],
+            cwd=os.getcwd(),
+            stdin=subprocess.DEVNULL,
+            stdout=bitacora,
+            stderr=bitacora,
+            start_new_session=True,
+        )
+    return True
+
+
+# -------------------------
+# LADO DEL TRABAJADOR
+# -------------------------
+class TrabajoCancelado(EscaneoDetenido):
+    """El trabajo se canceló desde la app mientras corría."""
+
+
+def latir(con):
+    con.execute("INSERT OR REPLACE INTO trabajadores (pid, latido) VALUES (?, ?)", (os.getpid(), time.time()))
+
+def latir_en_segundo_plano(ruta, detener):
+    # Late aunque una consulta tarde mucho; así "sin latido" solo significa proceso muerto.
+    with conectar(ruta) as con:
+        while not detener.wait(LATIDO_SEGUNDOS):
+            latir(con)
+
+def recuperar_huerfanos(con):
+    # Trabajos que quedaron "en_proceso" de un trabajador que ya no late vuelven a la cola.
+    limite = time.time() - TRABAJADOR_MUERTO_SEGUNDOS
+    con.execute("DELETE FROM trabajadores WHERE latido < ?", (limite,))
+    con.execute(
+        "UPDATE trabajos SET estado = 'pendiente', pid = NULL "
+        "WHERE estado = 'en_proceso' AND (pid IS NULL OR pid NOT IN (SELECT pid FROM trabajadores))"
+    )
+
+def tomar_siguiente(con):
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        fila = con.execute(
+            "SELECT * FROM trabajos WHERE estado = 'pendiente' ORDER BY id LIMIT 1"
+        ).fetchone()
+        if fila is not None:
+            con.execute(
+                "UPDATE trabajos SET estado = 'en_proceso', pid = ?, iniciado = ?, hechos = 0 WHERE id = ?",
+                (os.getpid(), time.time(), fila["id"]),
+            )
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    return dict(fila) if fila is not None else None
+
+def ejecutar_trabajo(con, trabajo):
+    with open(trabajo["archivo"], "rb") as f:
+        contenido = f.read()
+    # Si el trabajo se reencola tras una caída, la bitácora evita repetir lo ya consultado.
+    opciones = json.loads(trabajo["opciones"])
+    # El trabajador corre desatendido en el servidor: nunca abre una ventana de Chromium.
+    opciones["ver_navegador"] = False
+    bitacora = BitacoraEscaneo(hash_inventario(contenido)) if opciones.get("reanudar", True) else None
+
+    df, cols = cargar_inventario(contenido)
+    data = filas_a_escanear(df, cols, trabajo["sucursal"], trabajo["prueba"])
+
+    ultimo = 0.0
+
+    def al_avanzar(hechos, total):
+        nonlocal ultimo
+        ahora = time.monotonic()
+        if ahora - ultimo >= 1 or hechos == total:
+            ultimo = ahora
+            cambiadas = con.execute(
+                "UPDATE trabajos SET hechos = ?, total = ? WHERE id = ? AND estado = 'en_proceso'",
+                (hechos, total, trabajo["id"]),
+            ).rowcount
+            if not cambiadas:
+                raise TrabajoCancelado()
+
+    con.execute("UPDATE trabajos SET total = ? WHERE id = ?", (len(data), trabajo["id"]))
+    res, info = ejecutar_escaneo(data, cols, opciones, al_avanzar=al_avanzar, bitacora=bitacora)
+    df_r = pd.DataFrame(res)
+
+    if not trabajo["prueba"]:
+        try:
+            info["corrida_historial"] = guardar_historial(df_r)
+        except Exception as e:
+            # El reporte ya está calculado: se entrega aunque no haya entrado al historial.
+            traceback.print_exc()
+            info["error_historial"] = str(e)[:500]
+
+    con.execute(
+        "UPDATE trabajos SET estado = 'terminado', terminado = ?, hechos = ?, resultado = ?, info = ? "
+        "WHERE id = ? AND estado = 'en_proceso'",
+        (time.time(), len(df_r), df_r.to_json(orient="records", force_ascii=False), json.dumps(info), trabajo["id"]),
+    )
+
+def main(ruta=RUTA_TRABAJOS):
+    detener = threading.Event()
+    with conectar(ruta) as con:
+        latir(con)
+        recuperar_huerfanos(con)
+        threading.Thread(target=latir_en_segundo_plano, args=(ruta, detener), daemon=True).start()
+        try:
+            while True:
+                trabajo = tomar_siguiente(con)
+                if trabajo is None:
+                    time.sleep(ESPERA_COLA_VACIA)
+                    recuperar_huerfanos(con)
+                    continue
+
+                try:
+                    ejecutar_trabajo(con, trabajo)
+                except TrabajoCancelado:
+                    # Ya quedó "cancelado"; lo consultado sigue en la bitácora y el caché.
+                    pass
+                except Exception as e:
+                    traceback.print_exc()
+                    con.execute(
+                        "UPDATE trabajos SET estado = 'error', terminado = ?, error = ? "
+                        "WHERE id = ? AND estado = 'en_proceso'",
+                        (time.time(), str(e)[:500], trabajo["id"]),
+                    )
+        finally:
+            detener.set()
+            con.execute("DELETE FROM trabajadores WHERE pid = ?", (os.getpid(),))
+
+
+if __name__ == "__main__":
+    main()
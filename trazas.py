@@ -0,0 +1,191 @@
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+# -------------------------
+# CONFIGURACIÓN TRAZAS
+# -------------------------
+CARPETA_TRAZAS = os.path.join(os.getcwd(), "trazas")
+
+# Registro del escaneo en curso y traza del vehículo en curso. Viajan con el contexto, así que
+# cada tarea de asyncio (y cada asyncio.to_thread) ve la traza de su propio vehículo.
+_registro = ContextVar("registro_trazas", default=None)
+_traza = ContextVar("traza_vehiculo", default=None)
+
+# Con las trazas apagadas todas las mediciones regresan este mismo objeto: un ContextVar.get y nada más.
+_NULO = nullcontext()
+
+
+class _Etapa:
+    __slots__ = ("destino", "nombre", "inicio")
+
+    def __init__(self, destino, nombre):
+        self.destino = destino
+        self.nombre = nombre
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.destino[self.nombre] = self.destino.get(self.nombre, 0.0) + time.perf_counter() - self.inicio
+        return False
+
+
+class _TrazaVehiculo:
+    """Tiempos de una consulta; al salir se escribe como una línea del registro."""
+
+    def __init__(self, registro, datos):
+        self.registro = registro
+        self.datos = datos
+        self.etapas = {}
+        self._token = None
+
+    def __enter__(self):
+        self._inicio = time.perf_counter()
+        self._token = _traza.set(self)
+        return self
+
+    def __exit__(self, tipo, error, _tb):
+        total = time.perf_counter() - self._inicio
+        _traza.reset(self._token)
+        if error is not None:
+            self.datos.setdefault("estado", f"Error: {tipo.__name__}")
+        self.registro.escribir(self.datos, self.etapas, total)
+        return False
+
+
+def etapa(nombre):
+    """Mide el bloque como la etapa ``nombre`` del vehículo en curso (o del escaneo, si no hay vehículo)."""
+    traza = _traza.get()
+    if traza is not None:
+        return _Etapa(traza.etapas, nombre)
+    registro = _registro.get()
+    if registro is None:
+        return _NULO
+    return _Etapa(registro.fuera_de_vehiculo, nombre)
+
+def vehiculo(**datos):
+    """Abre la traza de una consulta (url, marca, modelo, año, filas...) si hay un registro activo."""
+    registro = _registro.get()
+    if registro is None:
+        return _NULO
+    return _TrazaVehiculo(registro, datos)
+
+def etapa_previa(nombre, segundos):
+    """Suma a la traza en curso una etapa medida antes de abrirla (p. ej. la espera en la cola del broker)."""
+    traza = _traza.get()
+    if traza is not None:
+        traza.etapas[nombre] = traza.etapas.get(nombre, 0.0) + segundos
+        traza._inicio -= segundos
+
+def anotar(**datos):
+    """Agrega campos (estado, fuente...) a la traza del vehículo en curso."""
+    traza = _traza.get()
+    if traza is not None:
+        traza.datos.update(datos)
+
+@contextmanager
+def trazando(registro):
+    token = _registro.set(registro)
+    try:
+        yield registro
+    finally:
+        _registro.reset(token)
+
+
+class RegistroTrazas:
+    """Archivo JSONL con una línea por consulta de un escaneo.
+
+    Cada línea trae ``url``, ``marca``, ``modelo``, ``anio``, ``filas`` (vehículos que comparten la
+    búsqueda), ``estado``, ``fuente`` (caché, http o navegador), ``total_ms`` y ``etapas`` en ms.
+    Lo medido fuera de un vehículo (p. ej. redibujar la barra de avance) se escribe al cerrar, en
+    una última línea con ``"tipo": "escaneo"``.
+    """
+
+    def __init__(self, carpeta=CARPETA_TRAZAS, nombre=None):
+        os.makedirs(carpeta, exist_ok=True)
+        nombre = nombre or f"escaneo_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+        self.ruta = os.path.join(carpeta, f"{nombre}.jsonl")
+        self.fuera_de_vehiculo = {}
+        self._inicio = time.perf_counter()
+        self._candado = threading.Lock()
+        self._archivo = open(self.ruta, "a", encoding="utf-8")
+
+    def escribir(self, datos, etapas, total):
+        registro = {
+            "tipo": "vehiculo",
+            "ts": time.time(),
+            **datos,
+            "total_ms": round(total * 1000, 2),
+            "etapas": {k: round(v * 1000, 2) for k, v in etapas.items()},
+        }
+        linea = json.dumps(registro, ensure_ascii=False, default=str) + "\n"
+        with self._candado:
+            self._archivo.write(linea)
+
+    def cerrar(self):
+        if self._archivo.closed:
+            return
+        registro = {
+            "tipo": "escaneo",
+            "ts": time.time(),
+            "total_ms": round((time.perf_counter() - self._inicio) * 1000, 2),
+            "etapas": {k: round(v * 1000, 2) for k, v in self.fuera_de_vehiculo.items()},
+        }
+        with self._candado:
+            self._archivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            self._archivo.close()
+
+
+# -------------------------
+# LECTURA Y RESUMEN
+# -------------------------
+def archivos_trazas(carpeta=CARPETA_TRAZAS):
+    """Archivos de trazas, del más reciente al más viejo."""
+    return sorted(glob.glob(os.path.join(carpeta, "*.jsonl")), key=os.path.getmtime, reverse=True)
+
+def leer_trazas(ruta):
+    registros = []
+    with open(ruta, encoding="utf-8") as f:
+        for linea in f:
+            try:
+                registros.append(json.loads(linea))
+            except ValueError:
+                continue
+    return registros
+
+def resumir_trazas(registros, lentos=10):
+    """Vehículos más lentos, proporción de tiempo por etapa y tasa de error de un archivo de trazas."""
+    vehiculos = [r for r in registros if r.get("tipo") == "vehiculo"]
+    escaneo = next((r for r in registros if r.get("tipo") == "escaneo"), None)
+
+    por_etapa = {}
+    for r in vehiculos:
+        for nombre, ms in r["etapas"].items():
+            por_etapa[nombre] = por_etapa.get(nombre, 0.0) + ms
+        # Lo que no cayó en ninguna etapa medida (armar URL, parseo, etc.).
+        sin_etapa = r["total_ms"] - sum(r["etapas"].values())
+        if sin_etapa > 0:
+            por_etapa["otros"] = por_etapa.get("otros", 0.0) + sin_etapa
+    if escaneo is not None:
+        for nombre, ms in escaneo["etapas"].items():
+            por_etapa[nombre] = por_etapa.get(nombre, 0.0) + ms
+
+    total_etapas = sum(por_etapa.values()) or 1.0
+    errores = sum(1 for r in vehiculos if str(r.get("estado", "")).startswith("Error"))
+    return {
+        "consultas": len(vehiculos),
+        "vehiculos": sum(r.get("filas", 1) for r in vehiculos),
+        "errores": errores,
+        "tasa_error": errores / len(vehiculos) if vehiculos else 0.0,
+        "duracion_ms": escaneo["total_ms"] if escaneo is not None else None,
+        "proporcion_etapas": {
+            nombre: ms / total_etapas for nombre, ms in sorted(por_etapa.items(), key=lambda x: -x[1])
+        },
+        "mas_lentos": sorted(vehiculos, key=lambda r: -r["total_ms"])[:lentos],
+    }